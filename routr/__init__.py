@@ -8,22 +8,14 @@
 
 """
 
-import re
-
-from pkg_resources import iter_entry_points
-
-try:
-    from urllib.parse import urlencode
-except ImportError:
-    from urllib import urlencode
-
-from webob.exc import HTTPException, HTTPBadRequest
-from routr.utils import import_string, cached_property
+from routr.utils import (
+    import_string, cached_property, split_path, join_segments, urlencode,
+    mapping_proxy)
 from routr.urlpattern import URLPattern
 from routr.exc import (
     NoMatchFound, NoURLPatternMatched, RouteGuarded,
     MethodNotAllowed, RouteConfigurationError, InvalidRoutePattern,
-    RouteReversalError)
+    RouteReversalError, PathTooLong, http_exceptions)
 
 
 __all__ = (
@@ -85,11 +77,33 @@ class Trace(object):
     def target(self):
         return self.endpoint.target
 
+    @property
+    def annotations(self):
+        """ Read-only mapping of annotations of matched routes, annotations of
+        outer routes override annotations of inner ones
+        """
+        return mapping_proxy(self._annotations())
+
     def annotation(self, name, default=None):
-        for route in self.routes:
-            if name in route.annotations:
-                return route.annotations[name]
-        return default
+        """ Return annotation ``name`` of the outermost matched route which
+        has it
+        """
+        return self._annotations().get(name, default)
+
+    def _annotations(self):
+        routes = self.routes
+        cached = self.__dict__.get('_merged_annotations')
+        if (cached is not None and cached[0] is routes
+                and cached[1] == len(routes)):
+            return cached[2]
+        merged = None
+        if routes and isinstance(routes[0], RouteGroup):
+            # chains through route tree are merged when tree is first matched
+            merged = routes[0].annotations_index().get(tuple(routes))
+        if merged is None:
+            merged = chain_annotations(routes)
+        self.__dict__['_merged_annotations'] = (routes, len(routes), merged)
+        return merged
 
     def __add__(self, tr):
         args = self.args + tr.args
@@ -114,6 +128,16 @@ class Trace(object):
         return self.payload[name]
 
 
+def chain_annotations(routes):
+    """ Return annotations of ``routes`` merged with outer routes' annotations
+    taking precedence
+    """
+    merged = {}
+    for route in reversed(routes):
+        merged.update(route.annotations)
+    return merged
+
+
 class Route(object):
     """ Base class for routes
 
@@ -130,6 +154,12 @@ class Route(object):
 
     url_pattern_cls = None
 
+    # maximum length of path accepted by __call__, see routr.complexity.limit
+    max_path_length = None
+
+    # match undecoded PATH_INFO, see routr.raw.raw
+    raw_path = False
+
     def __init__(self, guards, pattern, url_pattern_cls=None, **annotations):
         self.guards = guards
         self._pattern = pattern
@@ -164,7 +194,7 @@ class Route(object):
             trace = guard(request, trace) or trace
         return trace
 
-    def __call__(self, request):
+    def __call__(self, request, segments=False):
         """ Try to match route against ``request``
 
         If no route was matched the :class:`routr.exc.NoMatchFound` exception
@@ -172,8 +202,23 @@ class Route(object):
 
         :param request:
             :class:`webob.Request` object to match route against
+        :param segments:
+            if ``True`` then path is split into segments once and patterns
+            are matched against whole segments, see :meth:`match_segments`
         """
-        return self.match(request.path_info, request)
+        path_info = self.request_path(request)
+        if (self.max_path_length is not None
+                and len(path_info) > self.max_path_length):
+            raise PathTooLong()
+        if segments:
+            return self.match_segments(split_path(path_info), 0, request)
+        return self.match(path_info, request)
+
+    def request_path(self, request):
+        """ Return path of ``request`` route is matched against"""
+        if self.raw_path:
+            return request.environ.get('PATH_INFO', '')
+        return request.path_info
 
     def match(self, path_info, request):
         """ Match ``request`` against route
@@ -192,6 +237,26 @@ class Route(object):
         """
         raise NotImplementedError()
 
+    def match_segments(self, segments, pos, request):
+        """ Match ``request`` against route using path split into
+        ``segments``
+
+        Unlike :meth:`match` patterns should match whole segments, so route
+        with pattern ``/api`` doesn't match ``/apifoo``. Segments are shared
+        between all routes and each route only advances ``pos`` so no
+        intermediate strings are created.
+
+        By default it falls back to :meth:`match` with path joined back from
+        ``segments``.
+
+        :param segments:
+            a tuple of path segments as returned by
+            :func:`routr.utils.split_path`
+        :param pos:
+            index of the first segment not matched yet
+        """
+        return self.match(join_segments(segments, pos), request)
+
     def reverse(self, name, *args, **kwargs):
         """ Reverse route with ``name`` using ``*args`` as pattern parameters
         and ``**kwargs`` as query string parameters
@@ -201,6 +266,16 @@ class Route(object):
         """
         raise NotImplementedError()
 
+    def reverse_for(self, target, *args, **kwargs):
+        """ Reverse route with ``target`` using ``*args`` as pattern
+        parameters and ``**kwargs`` as query string parameters
+
+        :raises routr.exc.RouteReversalError:
+            if no reversal can be computed for given arguments or ``target``
+            is reachable through more than one route
+        """
+        raise NotImplementedError()
+
     def __iter__(self):
         raise NotImplementedError()
 
@@ -241,6 +316,25 @@ class Endpoint(Route):
         trace = self.match_guards(request, trace)
         return trace
 
+    def match_segments(self, segments, pos, request):
+        if (type(self).match is not Endpoint.match
+                and type(self).match_segments is Endpoint.match_segments):
+            # subclass customized matching only for paths
+            return super(Endpoint, self).match_segments(
+                segments, pos, request)
+        if self.pattern is None:
+            if pos < len(segments) and segments[pos:] != ('',):
+                raise NoURLPatternMatched()
+            args = ()
+        else:
+            pos, args = self.pattern.match_segments(segments, pos)
+            if pos != len(segments):
+                raise NoURLPatternMatched()
+        self.match_method(request)
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        return trace
+
     def reverse(self, name, *args, **kwargs):
         if name != self.name:
             raise RouteReversalError("no route with name '%s'" % name)
@@ -249,6 +343,14 @@ class Endpoint(Route):
             url += '?' + urlencode(kwargs)
         return url
 
+    def reverse_for(self, target, *args, **kwargs):
+        if target != self.target:
+            raise RouteReversalError("no route with target %r" % (target,))
+        url = self.pattern.reverse(*args) if self.pattern else '/'
+        if kwargs:
+            url += '?' + urlencode(kwargs)
+        return url
+
     def __iter__(self):
         return iter([self])
 
@@ -271,11 +373,65 @@ class RouteGroup(Route):
         a list of :class:`Route` objects
     """
 
+    # bumped each time routes of the group or of any group nested in it
+    # change, indexes and reversal caches built before that are stale
+    version = 0
+
+    # see :meth:`memoize_reversal`
+    reversal_cache = None
+
     def __init__(self, routes, guards, pattern, url_pattern_cls=None,
                  **annotations):
         super(RouteGroup, self).__init__(
             guards, pattern, url_pattern_cls=url_pattern_cls, **annotations)
-        self.routes = routes
+        # nothing is built for a new group yet, so there's nothing to bump
+        self.__dict__['routes'] = routes
+        self._adopt(routes)
+
+    def __setattr__(self, name, value):
+        # not a property so reading routes while matching stays cheap
+        super(RouteGroup, self).__setattr__(name, value)
+        if name == 'routes':
+            self.invalidate()
+
+    def _adopt(self, routes):
+        # nested groups keep weak references to groups they are included in,
+        # so their changes invalidate only trees which include them
+        from weakref import WeakKeyDictionary
+        for r in routes:
+            if isinstance(r, RouteGroup):
+                parents = r.__dict__.get('_parents')
+                if parents is None:
+                    parents = r.__dict__['_parents'] = WeakKeyDictionary()
+                parents[self] = True
+
+    def invalidate(self):
+        """ Mark indexes and reversal caches of this route tree and of trees
+        which include it as stale
+
+        Assigning ``routes`` does that automatically, call it after modifying
+        list of ``routes`` in place.
+        """
+        self._adopt(self.routes)
+        seen = set()
+        stack = [self]
+        while stack:
+            group = stack.pop()
+            if id(group) in seen:
+                continue
+            seen.add(id(group))
+            group.__dict__['version'] = group.version + 1
+            parents = group.__dict__.get('_parents')
+            if parents:
+                stack.extend(parents.keys())
+
+    def _fresh(self, name, build):
+        # return value built by ``build`` and cached under ``name`` until the
+        # next change of this route tree
+        cached = self.__dict__.get(name)
+        if cached is None or cached[0] != self.version:
+            cached = self.__dict__[name] = (self.version, build())
+        return cached[1]
 
     def index(self):
         """ Return mapping from route name to actual route"""
@@ -298,14 +454,103 @@ class RouteGroup(Route):
                     idx[n] = self.pattern + u
         return idx
 
-    @cached_property
-    def _cached_index(self):
-        return self.index()
+    def target_index(self):
+        """ Return mapping from endpoint target to actual route, targets
+        reachable through more than one route are mapped to lists of routes
+        """
+        idx = {}
+
+        def add(target, pattern):
+            try:
+                seen = idx.get(target)
+            except TypeError:
+                # unhashable targets can't be reversed
+                return
+            if seen is None:
+                idx[target] = pattern
+            elif isinstance(seen, list):
+                seen.append(pattern)
+            else:
+                idx[target] = [seen, pattern]
+
+        for r in self.routes:
+            if isinstance(r, Endpoint):
+                if self.pattern or r.pattern:
+                    add(r.target, self.pattern + r.pattern)
+                else:
+                    add(r.target, (self.url_pattern_cls or URLPattern)('/'))
+            elif isinstance(r, RouteGroup):
+                for target, u in r.target_index().items():
+                    for u in (u if isinstance(u, list) else [u]):
+                        add(target, self.pattern + u)
+        return idx
+
+    def annotations_index(self):
+        """ Return mapping from chains of routes which can be matched through
+        this route tree (tuples starting with the group itself and ending
+        with an endpoint) to their merged annotations
+
+        Mapping is built once per change of route tree, it shouldn't be
+        modified.
+        """
+        return self._fresh('_cached_annotations_index', self._chains)
+
+    def _chains(self):
+        idx = {}
+        stack = [((self,), dict(self.annotations), self)]
+        while stack:
+            chain, merged, group = stack.pop()
+            for r in group.routes:
+                sub = dict(r.annotations)
+                sub.update(merged)
+                if isinstance(r, RouteGroup):
+                    stack.append((chain + (r,), sub, r))
+                else:
+                    idx[chain + (r,)] = sub
+        return idx
+
+    def memoize_reversal(self, maxsize=1024):
+        """ Cache results of :meth:`reverse` in LRU cache
+
+        Cache is keyed by route name, ``*args`` and sorted ``**kwargs`` and is
+        cleared each time this route tree changes, calls with unhashable
+        arguments aren't cached.
+
+        :param maxsize:
+            maximum number of cached URLs
+        :rtype:
+            :class:`routr.reversal.ReversalCache` which collects hit-rate stats
+        """
+        from routr.reversal import ReversalCache
+        self.reversal_cache = ReversalCache(
+            self._reverse, maxsize, version=lambda: self.version)
+        return self.reversal_cache
 
     def reverse(self, name, *args, **kwargs):
-        if not name in self._cached_index:
+        if self.reversal_cache is not None:
+            return self.reversal_cache(name, args, kwargs)
+        return self._reverse(name, args, kwargs)
+
+    def _reverse(self, name, args, kwargs):
+        index = self._fresh('_cached_index', self.index)
+        if not name in index:
             raise RouteReversalError("no route with name '%s'" % name)
-        url = self._cached_index[name].reverse(*args)
+        url = index[name].reverse(*args)
+        if kwargs:
+            url += '?' + urlencode(kwargs)
+        return url
+
+    def reverse_for(self, target, *args, **kwargs):
+        index = self._fresh('_cached_target_index', self.target_index)
+        try:
+            pattern = index[target]
+        except (KeyError, TypeError):
+            raise RouteReversalError("no route with target %r" % (target,))
+        if isinstance(pattern, list):
+            raise RouteReversalError(
+                "target %r is reachable through more than one route: %s" % (
+                    target, ', '.join("'%s'" % p.pattern for p in pattern)))
+        url = pattern.reverse(*args)
         if kwargs:
             url += '?' + urlencode(kwargs)
         return url
@@ -316,14 +561,21 @@ class RouteGroup(Route):
             return path_info, ()
         return self.pattern.match(path_info)
 
-    def match(self, path_info, request):
-        path_info, args = self.match_pattern(path_info)
+    def match_routes(self, trace, routes, match):
+        """ Return ``trace`` of the group followed by trace of the first of
+        ``routes`` matched by ``match(route)``
+
+        Routes which don't match by URL are skipped, if none matches the last
+        guard failure is raised.
+        """
         guarded = []
-        trace = Trace(args, {}, [self])
-        trace = self.match_guards(request, trace)
-        for subroute in self.routes:
+        too_long = None
+        for subroute in routes:
             try:
-                subtrace = subroute.match(path_info, request)
+                subtrace = match(subroute)
+            except PathTooLong as e:
+                too_long = e
+                continue
             except NoURLPatternMatched:
                 continue
             except MethodNotAllowed as e:
@@ -332,7 +584,7 @@ class RouteGroup(Route):
             except RouteGuarded as e:
                 guarded.append(e)
                 continue
-            except HTTPException as e:
+            except http_exceptions() as e:
                 guarded.append(RouteGuarded(e, e))
                 continue
             else:
@@ -343,8 +595,33 @@ class RouteGroup(Route):
             # NOTE we raise only last guard failure
             # cause it's more interesting one
             raise guarded[-1]
+        if too_long is not None:
+            raise too_long
         raise NoURLPatternMatched()
 
+    def match(self, path_info, request):
+        path_info, args = self.match_pattern(path_info)
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        return self.match_routes(
+            trace, self.routes, lambda r: r.match(path_info, request))
+
+    def match_segments(self, segments, pos, request):
+        if (type(self).match is not RouteGroup.match
+                and type(self).match_segments is RouteGroup.match_segments):
+            # subclass customized matching only for paths
+            return super(RouteGroup, self).match_segments(
+                segments, pos, request)
+        if self.pattern is not None:
+            pos, args = self.pattern.match_segments(segments, pos)
+        else:
+            args = ()
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        return self.match_routes(
+            trace, self.routes,
+            lambda r: r.match_segments(segments, pos, request))
+
     def __iter__(self):
         return iter(self.routes)
 
@@ -374,6 +651,7 @@ def plug(name):
     :param name:
         entry point name to query routes
     """
+    from pkg_resources import iter_entry_points
     routes = []
     for p in iter_entry_points('routr', name=name):
         r = p.load()
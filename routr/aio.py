@@ -0,0 +1,281 @@
+"""
+
+    routr.aio -- dispatching requests with asyncio
+    ==============================================
+
+    This module provides :class:`AsyncDispatcher` which works like
+    :class:`routr.dispatch.Dispatcher` but inside asyncio event loop, targets
+    can be coroutine functions or plain functions::
+
+        from routr.aio import AsyncDispatcher
+
+        dispatcher = AsyncDispatcher(routes)
+        response = await dispatcher.dispatch(request)
+
+    Targets of routes annotated with ``executor`` annotation are run off the
+    event loop in a pool from :class:`routr.executors.Executors`, everything
+    else is called inline. Validators set by ``validator`` annotation (see
+    :mod:`routr.conditional`) can be coroutine functions too. Concurrency
+    limits set by ``concurrency`` annotation are enforced by
+    :class:`AsyncLimiter` which makes requests wait in queue without blocking
+    event loop.
+
+    This module requires Python 3.5 or later.
+
+"""
+
+import asyncio
+import inspect
+
+from webob.exc import HTTPException
+from routr.dispatch import Dispatcher
+from routr.limits import Limiter
+from routr.coalesce import Coalescer, share
+from routr.mount import Mount
+from routr.exc import NoMatchFound, RouteConfigurationError
+
+
+__all__ = ('AsyncDispatcher', 'AsyncLimiter', 'AsyncCoalescer')
+
+# loop of running coroutine, get_event_loop() does the same before Python 3.7
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class AsyncDispatcher(Dispatcher):
+    """ Dispatcher for asyncio applications
+
+    Targets of routes annotated with ``executor`` annotation are submitted to
+    the named pool, targets run in process pools can't accept ``request``
+    argument and receive only ``trace.args`` and ``trace.kwargs``.
+
+    :param routes:
+        routes to match requests against
+    :param cache:
+        :class:`routr.cache.ResponseCache` for routes annotated with ``cache``
+        annotation, new cache is created if not supplied
+    :param executors:
+        :class:`routr.executors.Executors` for routes annotated with
+        ``executor`` annotation, default pools are used if not supplied
+    :param limiter:
+        :class:`.AsyncLimiter` for routes annotated with ``concurrency``
+        annotation, new limiter is created if not supplied
+    :param coalescer:
+        :class:`.AsyncCoalescer` for routes annotated with ``coalesce``
+        annotation, new coalescer is created if not supplied
+    """
+
+    def __init__(self, routes, cache=None, executors=None, limiter=None,
+                 coalescer=None):
+        super(AsyncDispatcher, self).__init__(
+            routes, cache=cache, limiter=limiter, coalescer=coalescer)
+        if executors is None:
+            from routr.executors import Executors
+            executors = Executors()
+        self.executors = executors
+
+    def __call__(self, environ, start_response):
+        raise TypeError("%s isn't a WSGI application, use dispatch() method"
+                        % self.__class__.__name__)
+
+    async def dispatch(self, request):
+        """ Dispatch ``request`` and return response"""
+        try:
+            trace = self.match(request)
+        except NoMatchFound as e:
+            return e.response
+        except HTTPException as e:
+            return e
+        try:
+            return await self.handle(request, trace)
+        except HTTPException as e:
+            return e
+
+    def create_limiter(self):
+        return AsyncLimiter()
+
+    def create_coalescer(self):
+        return AsyncCoalescer()
+
+    async def handle(self, request, trace):
+        """ Produce response for ``request`` matched with ``trace`` honouring
+        route annotations
+        """
+        policy = trace.annotation('concurrency')
+        if policy is None:
+            return await self.validate(request, trace)
+        limiter = self.limiter
+        gauge = limiter.gauge(trace, policy)
+        if gauge is None:
+            return await self.validate(request, trace)
+        if not await limiter.acquire(gauge):
+            return limiter.reject(gauge)
+        try:
+            return await self.validate(request, trace)
+        finally:
+            limiter.release(gauge)
+
+    async def validate(self, request, trace):
+        """ Produce response for ``request`` honouring ``validator``
+        annotation, validator can be a coroutine function
+        """
+        validator = trace.annotation('validator')
+        if validator is None:
+            return await self.respond(request, trace)
+        from routr.conditional import (
+            validators, not_modified, not_modified_response, set_validators)
+        value = self.apply(validator, request, trace)
+        if inspect.isawaitable(value):
+            value = await value
+        etag, last_modified = validators(value)
+        if not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        response = await self.respond(request, trace)
+        if hasattr(response, 'status_int') and response.status_int == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    async def respond(self, request, trace):
+        """ Produce response for ``request`` by calling target, possibly
+        through response cache
+        """
+        policy = trace.annotation('cache')
+        if policy is None:
+            return await self.execute(request, trace)
+        key, policy = self.cache.lookup(request, trace, policy)
+        if key is None:
+            return await self.execute(request, trace)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+        response = await self.execute(request, trace)
+        self.cache.store(key, response, policy)
+        return response
+
+    async def execute(self, request, trace):
+        """ Call target of matched ``trace`` coalescing identical concurrent
+        requests if route is annotated with ``coalesce`` annotation
+        """
+        policy = trace.annotation('coalesce')
+        if policy is not None:
+            return await self.coalescer.handle(
+                request, trace, policy, self.call)
+        return await self.call(request, trace)
+
+    async def call(self, request, trace):
+        """ Call target of matched ``trace``"""
+        target = trace.target
+        if trace.annotation('static_view'):
+            return target(request, *trace.args)
+        if isinstance(trace.endpoint, Mount):
+            return trace.endpoint.respond(request, trace)
+        name = trace.annotation('executor')
+        if name is not None:
+            return await self.offload(name, request, trace)
+        response = self.apply(target, request, trace)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+    async def offload(self, name, request, trace):
+        """ Run target of matched ``trace`` in executor pool ``name``"""
+        target = trace.target
+        args = trace.args
+        position = self.request_position(target)
+        if self.executors.pool(name).kind == 'process':
+            if position is not None:
+                raise RouteConfigurationError(
+                    "target %r run in process pool can't accept request"
+                    % target)
+        elif position is not None:
+            args = list(args)
+            args.insert(position, request)
+        future = self.executors.submit(
+            name, target, *args, **dict(trace.kwargs))
+        return await asyncio.wrap_future(future)
+
+    def close(self, wait=True):
+        """ Shutdown executor pools"""
+        self.executors.shutdown(wait=wait)
+
+
+class AsyncLimiter(Limiter):
+    """ Concurrency limits for asyncio applications, :meth:`acquire` is a
+    coroutine and all methods should be called from event loop thread
+    """
+
+    async def acquire(self, gauge):
+        policy = gauge.policy
+        if gauge.in_flight < policy.max_concurrency and not gauge.waiters:
+            gauge.in_flight += 1
+            gauge.admitted += 1
+            return True
+        if len(gauge.waiters) >= policy.max_queue:
+            gauge.rejected += 1
+            return False
+        waiter = _running_loop().create_future()
+        gauge.waiters.append(waiter)
+        gauge.queued += 1
+        try:
+            # slot is handed over by release() without decrementing in_flight
+            await asyncio.wait_for(asyncio.shield(waiter), policy.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(gauge, waiter)
+            raise
+        finally:
+            gauge.queued -= 1
+        if waiter.done() and not waiter.cancelled():
+            gauge.admitted += 1
+            return True
+        self._abandon(gauge, waiter)
+        gauge.rejected += 1
+        return False
+
+    def _abandon(self, gauge, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # slot was handed over already
+            self.release(gauge)
+            return
+        waiter.cancel()
+        gauge.waiters.remove(waiter)
+
+    def release(self, gauge):
+        while gauge.waiters:
+            waiter = gauge.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        gauge.in_flight -= 1
+
+
+class AsyncCoalescer(Coalescer):
+    """ Coalescer of concurrent identical requests for asyncio applications,
+    all methods should be called from event loop thread
+    """
+
+    async def handle(self, request, trace, policy, call):
+        policy = self.policy(policy)
+        key = self.key(request, trace, policy)
+        if key is None:
+            return await call(request, trace)
+        flight, leader = self.join(
+            key, _running_loop().create_future)
+        if leader:
+            try:
+                response = await call(request, trace)
+            except BaseException as e:
+                self.land(key)
+                flight.set_result((None, e))
+                raise
+            self.land(key)
+            flight.set_result((share(response), None))
+            return response
+        try:
+            response, error = await asyncio.wait_for(
+                asyncio.shield(flight), policy.timeout)
+        except asyncio.TimeoutError:
+            return self.timeout()
+        if error is not None:
+            raise error
+        return share(response)
@@ -0,0 +1,219 @@
+"""
+
+    routr.cache -- in-process response caching
+    ==========================================
+
+    Routes annotated with ``cache`` annotation have their responses cached by
+    :class:`routr.dispatch.Dispatcher` in :class:`ResponseCache`::
+
+        from routr import route, GET
+        from routr.cache import CachePolicy
+
+        routes = route(
+            route(GET, '/news',      list_news, cache=60, name='news'),
+            route(GET, '/news/{id}', get_news,
+                  cache=CachePolicy(ttl=300, vary=['Accept'])),
+            )
+
+    Responses are keyed by endpoint, request method, converted ``trace.args``
+    and ``trace.kwargs``, query string and values of ``vary`` headers, cache
+    hits skip target call entirely. Responses which set cookies or have
+    ``Cache-Control`` header with ``private``, ``no-store`` or ``no-cache``
+    directives aren't cached. Cache is bounded by total size of response
+    bodies and entries can be invalidated by route name::
+
+        dispatcher.cache.invalidate('news')
+
+"""
+
+import time
+import numbers
+import threading
+from collections import OrderedDict
+
+from webob import Response
+from routr.exc import RouteConfigurationError
+from routr.utils import request_key, PolicyCache
+
+
+__all__ = ('CachePolicy', 'ResponseCache')
+
+
+class CachePolicy(object):
+    """ Caching policy for a route
+
+    :param ttl:
+        number of seconds response is considered fresh
+    :param vary:
+        names of request headers which values are part of cache key
+    :param max_entries:
+        maximum number of cached responses for the route
+    """
+
+    def __init__(self, ttl, vary=(), max_entries=None):
+        self.ttl = ttl
+        self.vary = tuple(vary)
+        self.max_entries = max_entries
+
+    @classmethod
+    def coerce(cls, value):
+        """ Make policy out of annotation ``value`` which can be a policy
+        itself, a number of seconds or a dict of policy params, ``None`` is
+        returned for ``False`` or ``None`` which disable caching
+        """
+        if value is None or value is False:
+            return None
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        if isinstance(value, numbers.Real) and not isinstance(value, bool):
+            return cls(value)
+        raise RouteConfigurationError(
+            'invalid cache annotation %r, expected number of seconds or'
+            ' policy' % (value,))
+
+
+class ResponseCache(object):
+    """ LRU cache of responses bounded by total size of response bodies
+
+    :param max_bytes:
+        maximum total size of cached response bodies
+    :param clock:
+        function which returns current time in seconds
+    """
+
+    cacheable_methods = ('GET', 'HEAD')
+    cacheable_statuses = (200, 203, 300, 301, 404, 410)
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, clock=time.time):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_endpoint = {}
+        self._policies = PolicyCache(CachePolicy.coerce)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def policy(self, value):
+        """ Return :class:`.CachePolicy` for ``cache`` annotation ``value`` or
+        ``None`` if it disables caching
+        """
+        return self._policies(value)
+
+    def key(self, request, trace, policy):
+        """ Return cache key for ``request`` matched with ``trace`` or
+        ``None`` if request can't be cached
+        """
+        return request_key(request, trace, policy.vary)
+
+    def handle(self, request, trace, policy, call):
+        """ Return cached response for ``request`` or produce new one with
+        ``call(request, trace)`` and cache it
+        """
+        key, policy = self.lookup(request, trace, policy)
+        if key is None:
+            return call(request, trace)
+        response = self.get(key)
+        if response is not None:
+            return response
+        response = call(request, trace)
+        self.store(key, response, policy)
+        return response
+
+    def lookup(self, request, trace, policy):
+        """ Return cache key for ``request`` along with coerced ``policy``,
+        key is ``None`` if request can't be cached
+        """
+        if request.method not in self.cacheable_methods:
+            return None, None
+        policy = self.policy(policy)
+        if policy is None:
+            return None, None
+        return self.key(request, trace, policy), policy
+
+    def store(self, key, response, policy):
+        """ Cache ``response`` under ``key`` if it is cacheable"""
+        if self.cacheable(response):
+            self.set(key, response, policy)
+
+    def cacheable(self, response):
+        """ Return ``True`` if ``response`` can be served to other requests --
+        it has cacheable status, doesn't set cookies and isn't marked as
+        private or not to be stored by ``Cache-Control`` header
+        """
+        if not (isinstance(response, Response)
+                and response.status_int in self.cacheable_statuses):
+            return False
+        if 'Set-Cookie' in response.headers:
+            return False
+        if 'Cache-Control' in response.headers:
+            cc = response.cache_control
+            if cc.private or cc.no_store or cc.no_cache:
+                return False
+        return True
+
+    def get(self, key):
+        """ Return copy of cached response for ``key`` or ``None``"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, response = entry
+            if expires <= self.clock():
+                self._forget(key, size)
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            keys = self._by_endpoint[key[0]]
+            del keys[key]
+            keys[key] = True
+            self.hits += 1
+        return response.copy()
+
+    def set(self, key, response, policy):
+        """ Cache ``response`` under ``key`` according to ``policy``"""
+        response = response.copy()
+        size = len(response.body) + sum(
+            len(k) + len(v) for k, v in response.headerlist)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._forget(key, self._entries.pop(key)[1])
+            self._entries[key] = (self.clock() + policy.ttl, size, response)
+            self._by_endpoint.setdefault(key[0], OrderedDict())[key] = True
+            self.size += size
+            keys = self._by_endpoint[key[0]]
+            while policy.max_entries and len(keys) > policy.max_entries:
+                oldest = next(iter(keys))
+                self._forget(oldest, self._entries.pop(oldest)[1])
+            while self.size > self.max_bytes:
+                oldest, (_, oldest_size, _) = next(iter(self._entries.items()))
+                del self._entries[oldest]
+                self._forget(oldest, oldest_size)
+
+    def invalidate(self, name=None):
+        """ Remove cached responses of routes with ``name`` or all cached
+        responses if ``name`` is ``None``
+        """
+        with self._lock:
+            for endpoint in list(self._by_endpoint):
+                if name is not None and endpoint.name != name:
+                    continue
+                for key in list(self._by_endpoint[endpoint]):
+                    self._forget(key, self._entries.pop(key)[1])
+
+    def _forget(self, key, size):
+        # should be called with lock held and entry removed from _entries
+        self.size -= size
+        keys = self._by_endpoint[key[0]]
+        del keys[key]
+        if not keys:
+            del self._by_endpoint[key[0]]
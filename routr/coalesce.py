@@ -0,0 +1,187 @@
+"""
+
+    routr.coalesce -- coalescing of concurrent identical requests
+    =============================================================
+
+    Routes annotated with ``coalesce`` annotation have concurrent identical
+    requests coalesced by :class:`routr.dispatch.Dispatcher` (and
+    :class:`routr.aio.AsyncDispatcher`) -- target is called for the first
+    request only while others wait for it and get copies of its response::
+
+        from routr import route, GET
+        from routr.coalesce import CoalescePolicy
+
+        routes = route(
+            route(GET, '/',          index, coalesce=True, cache=60),
+            route(GET, '/news/{id}', news,
+                  coalesce=CoalescePolicy(timeout=5, vary=['Accept'])),
+            )
+
+    Annotation value can be ``True``, timeout in seconds or a policy, ``False``
+    and ``None`` disable coalescing. Requests are identical if they are
+    matched to the same endpoint with the same ``trace.args`` and
+    ``trace.kwargs`` and have the same query string and values of ``vary``
+    headers. Only ``GET`` and ``HEAD`` requests are coalesced. Requests which
+    wait longer than ``timeout`` get ``504 Gateway Timeout`` response, if
+    target raises an exception it is raised for all coalesced requests.
+
+    Coalescing happens on response cache misses, so it prevents stampede of
+    requests when cached response expires.
+
+"""
+
+import numbers
+import threading
+
+from webob import Response
+from routr.exc import RouteConfigurationError
+from routr.utils import request_key, PolicyCache
+
+
+__all__ = ('CoalescePolicy', 'Coalescer')
+
+
+class CoalescePolicy(object):
+    """ Coalescing policy for a route
+
+    :param timeout:
+        maximum number of seconds coalesced requests wait for response
+    :param vary:
+        names of request headers which values are part of coalescing key
+    """
+
+    def __init__(self, timeout=30, vary=()):
+        self.timeout = timeout
+        self.vary = tuple(vary)
+
+    @classmethod
+    def coerce(cls, value):
+        """ Make policy out of annotation ``value`` which can be a policy
+        itself, ``True``, timeout in seconds or a dict of policy params,
+        ``None`` is returned for ``False`` or ``None`` which disable coalescing
+        """
+        if value is None or value is False:
+            return None
+        if isinstance(value, cls):
+            return value
+        if value is True:
+            return cls()
+        if isinstance(value, dict):
+            return cls(**value)
+        if isinstance(value, numbers.Real):
+            return cls(value)
+        raise RouteConfigurationError(
+            'invalid coalesce annotation %r' % (value,))
+
+
+def share(response):
+    """ Return copy of ``response`` which can be given to another request"""
+    if isinstance(response, Response):
+        return response.copy()
+    return response
+
+
+class Flight(object):
+    """ Execution of target for coalesced requests"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+    def wait(self, timeout):
+        """ Wait for ``(response, error)`` or ``None`` on timeout"""
+        if not self.event.wait(timeout):
+            return None
+        return self.result
+
+    def finish(self, response, error):
+        self.result = (share(response), error)
+        self.event.set()
+
+
+class Coalescer(object):
+    """ Coalescer of concurrent identical requests for threaded WSGI servers
+
+    :attr executions:
+        number of target calls made for coalesced routes
+    :attr coalesced:
+        number of requests which waited for another request's response
+    :attr timeouts:
+        number of requests which didn't get response in time
+    """
+
+    coalescable_methods = ('GET', 'HEAD')
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self._flights = {}
+        self._policies = PolicyCache(CoalescePolicy.coerce)
+        self._lock = threading.Lock()
+
+    def policy(self, value):
+        """ Return :class:`.CoalescePolicy` for ``coalesce`` annotation
+        ``value`` or ``None`` if it disables coalescing
+        """
+        return self._policies(value)
+
+    def key(self, request, trace, policy):
+        """ Return coalescing key for ``request`` matched with ``trace`` or
+        ``None`` if request can't be coalesced
+        """
+        if policy is None or request.method not in self.coalescable_methods:
+            return None
+        return request_key(request, trace, policy.vary)
+
+    def join(self, key, create):
+        """ Return flight for ``key`` and ``True`` if it was created with
+        ``create()`` and caller should lead it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = create()
+            self.executions += 1
+            return flight, True
+
+    def land(self, key):
+        """ Forget flight for ``key``, next request will start a new one"""
+        with self._lock:
+            del self._flights[key]
+
+    def timeout(self):
+        """ Return ``504 Gateway Timeout`` response"""
+        from webob.exc import HTTPGatewayTimeout
+        with self._lock:
+            self.timeouts += 1
+        return HTTPGatewayTimeout()
+
+    def handle(self, request, trace, policy, call):
+        """ Produce response with ``call(request, trace)`` or wait for
+        response of identical request being processed
+        """
+        policy = self.policy(policy)
+        key = self.key(request, trace, policy)
+        if key is None:
+            return call(request, trace)
+        flight, leader = self.join(key, Flight)
+        if leader:
+            try:
+                response = call(request, trace)
+            except BaseException as e:
+                self.land(key)
+                flight.finish(None, e)
+                raise
+            self.land(key)
+            flight.finish(response, None)
+            return response
+        result = flight.wait(policy.timeout)
+        if result is None:
+            return self.timeout()
+        response, error = result
+        if error is not None:
+            raise error
+        return share(response)
@@ -0,0 +1,296 @@
+"""
+
+    routr.codegen -- code generated matchers
+    ========================================
+
+    This module provides :func:`compile_matcher` which turns a route tree into
+    Python source of specialized match functions and compiles it::
+
+        from routr.codegen import compile_matcher
+
+        matcher = compile_matcher(routes)
+        trace = matcher(request)
+
+    Literal patterns are compared inline, regular expressions and converters
+    are bound as constants and guards are called directly, so no ``Route``
+    attributes are looked up during matching. Results are the same as of
+    ``routes.match``, generated source is available as ``matcher.source``.
+
+    Route tree is considered frozen -- changes made to it after compilation
+    aren't seen by matcher. Only :class:`routr.Endpoint` and
+    :class:`routr.RouteGroup` routes with default URL patterns are compiled,
+    other routes are matched by calling their ``match`` method.
+
+"""
+
+from routr import Trace, Endpoint, RouteGroup
+from routr.urlpattern import URLPattern
+from routr.explain import describe
+from routr.exc import (
+    NoURLPatternMatched, MethodNotAllowed, RouteGuarded, PathTooLong,
+    http_exceptions)
+
+
+__all__ = ('compile_matcher', 'Matcher')
+
+
+class Matcher(object):
+    """ Compiled matcher for route tree
+
+    :attr route:
+        root of compiled route tree
+    :attr source:
+        generated Python source
+    """
+
+    def __init__(self, route, source, match):
+        self.route = route
+        self.source = source
+        self._match = match
+
+    def __call__(self, request):
+        """ Match ``request`` just like ``route(request)`` does"""
+        path_info = self.route.request_path(request)
+        limit = self.route.max_path_length
+        if limit is not None and len(path_info) > limit:
+            raise PathTooLong()
+        return self._match(path_info, request)
+
+    def match(self, path_info, request):
+        """ Match ``path_info`` and ``request`` just like ``route.match``
+        does
+        """
+        return self._match(path_info, request)
+
+
+def _chain(base, args, routes, trace):
+    # combine traces of matched routes, ``base`` is a trace of outer routes
+    # with guards, ``args`` and ``routes`` are accumulated from outer routes
+    # without guards
+    if routes:
+        pending = Trace(args, {}, list(routes))
+        base = pending if base is None else base + pending
+    if trace is None:
+        return base
+    return trace if base is None else base + trace
+
+
+def compilable(route):
+    """ Check if matching of ``route`` itself can be compiled"""
+    if type(route) not in (Endpoint, RouteGroup):
+        return False
+    if route.url_pattern_cls not in (None, URLPattern):
+        return False
+    return route.pattern is None or type(route.pattern) is URLPattern
+
+
+def _comment(route):
+    return '# ' + describe(route).replace('\n', ' ')
+
+
+class Generator(object):
+    """ Generator of matcher source for route tree"""
+
+    def __init__(self):
+        self.namespace = {
+            '_Trace': Trace,
+            '_NoURL': NoURLPatternMatched,
+            '_MNA': MethodNotAllowed,
+            '_RG': RouteGuarded,
+            '_TooLong': PathTooLong,
+            '_http': http_exceptions,
+            '_chain': _chain,
+        }
+        self.lines = []
+        self.counter = 0
+
+    def const(self, prefix, value):
+        name = '_%s%d' % (prefix, self.counter)
+        self.counter += 1
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def source(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def function(self, group):
+        """ Generate function matching ``group`` and return its name"""
+        children = []
+        for r in group.routes:
+            if compilable(r) and isinstance(r, RouteGroup):
+                children.append((r, self.function(r)))
+            else:
+                children.append((r, None))
+        name = self.const('match', group)
+        r = self.const('r', group)
+        self.emit(0, 'def %s(path, request, args, routes, base):' % name)
+        self.emit(1, _comment(group))
+        self.pattern(
+            1, group.pattern, 'raise _NoURL()', full=False,
+            too_long='raise _TooLong()')
+        if group.guards:
+            self.emit(1, 't = _Trace(a, {}, [%s])' % r)
+            self.guards(1, group.guards)
+            self.emit(1, 'base = _chain(base, args, routes, t)')
+            self.emit(1, 'args = ()')
+            self.emit(1, 'routes = ()')
+        else:
+            self.emit(1, 'args = args + a')
+            self.emit(1, 'routes = routes + (%s,)' % r)
+        self.emit(1, 'guarded = None')
+        self.emit(1, 'too_long = None')
+        for route, function in children:
+            if function is not None:
+                self.emit(1, _comment(route))
+                self.call(
+                    1, '%s(path, request, args, routes, base)' % function,
+                    'return t')
+            elif compilable(route):
+                self.endpoint(1, route)
+            else:
+                self.emit(1, _comment(route))
+                match = self.const('m', route.match)
+                self.call(
+                    1, '%s(path, request)' % match,
+                    'return _chain(base, args, routes, t)')
+        self.emit(1, 'if guarded is not None:')
+        self.emit(2, 'raise guarded')
+        self.emit(1, 'if too_long is not None:')
+        self.emit(2, 'raise too_long')
+        self.emit(1, 'raise _NoURL()')
+        self.emit(0, '')
+        return name
+
+    def pattern(self, indent, pattern, fail, full,
+                too_long='too_long = _TooLong()'):
+        """ Generate code which matches ``path`` against ``pattern`` and
+        stores captured args into ``a``, if ``full`` is true then whole path
+        should be matched, ``too_long`` is executed before ``fail`` if path is
+        too long for pattern
+        """
+        if pattern is None:
+            if full:
+                self.emit(indent, "if path and path != '/':")
+                self.emit(indent + 1, fail)
+            self.emit(indent, 'a = ()')
+        elif pattern.is_exact:
+            literal = pattern.pattern
+            if full:
+                self.emit(indent, 'if path != %r:' % literal)
+                self.emit(indent + 1, fail)
+            else:
+                self.emit(indent, 'if not path.startswith(%r):' % literal)
+                self.emit(indent + 1, fail)
+                self.emit(indent, 'path = path[%d:]' % len(literal))
+            self.emit(indent, 'a = ()')
+        else:
+            regex = self.const('re', pattern.compiled.match)
+            if pattern.max_length is not None:
+                # too long path is a miss for this pattern only, it's
+                # reported if no other route matches
+                self.emit(indent, 'if len(path) > %d:' % pattern.max_length)
+                self.emit(indent + 1, 'if path.startswith(%r):' % (
+                    pattern._prefix,))
+                self.emit(indent + 2, too_long)
+                self.emit(indent + 1, fail)
+            self.emit(indent, 'm = %s(path)' % regex)
+            self.emit(indent, 'if m is None:')
+            self.emit(indent + 1, fail)
+            values = []
+            for group, c, label in pattern._names:
+                if c is None:
+                    values.append('m.group(%r)' % group)
+                else:
+                    values.append('%s(m.group(%r))' % (
+                        self.const('c', c), group))
+            self.emit(indent, 'try:')
+            self.emit(indent + 1, 'a = (%s)' % ''.join(
+                v + ', ' for v in values).rstrip())
+            self.emit(indent, 'except ValueError:')
+            self.emit(indent + 1, fail)
+            if full:
+                self.emit(indent, 'if m.end() != len(path):')
+                self.emit(indent + 1, fail)
+            else:
+                self.emit(indent, 'path = path[m.end():]')
+
+    def guards(self, indent, guards):
+        for guard in guards:
+            guard = self.const('g', guard)
+            self.emit(indent, 't = %s(request, t) or t' % guard)
+
+    def endpoint(self, indent, endpoint):
+        """ Generate block matching ``endpoint``, blocks are executed in a
+        single pass loop so failure is just a ``break``
+        """
+        r = self.const('r', endpoint)
+        self.emit(indent, _comment(endpoint))
+        self.emit(indent, 'while True:')
+        indent += 1
+        self.pattern(indent, endpoint.pattern, 'break', full=True)
+        self.emit(indent, 'if request.method != %r:' % endpoint.method)
+        self.emit(indent + 1, 'e = _MNA()')
+        self.emit(indent + 1, 'guarded = _RG(e, e.response)')
+        self.emit(indent + 1, 'break')
+        if not endpoint.guards:
+            self.emit(indent, 'if base is None:')
+            self.emit(indent + 1, 'return _Trace(args + a, {}, '
+                                  'list(routes) + [%s])' % r)
+            self.emit(indent, 'return _chain(base, args, routes, '
+                              '_Trace(a, {}, [%s]))' % r)
+            return
+        self.emit(indent, 't = _Trace(a, {}, [%s])' % r)
+        self.emit(indent, 'try:')
+        self.guards(indent + 1, endpoint.guards)
+        self.except_ladder(indent)
+        self.emit(indent, 'else:')
+        self.emit(indent + 1, 'return _chain(base, args, routes, t)')
+        self.emit(indent, 'break')
+
+    def call(self, indent, call, success):
+        """ Generate call to subroute matcher which failures are collected
+        just like :meth:`routr.RouteGroup.match` does
+        """
+        self.emit(indent, 'try:')
+        self.emit(indent + 1, 't = %s' % call)
+        self.except_ladder(indent)
+        self.emit(indent, 'else:')
+        self.emit(indent + 1, success)
+
+    def except_ladder(self, indent):
+        self.emit(indent, 'except _TooLong as e:')
+        self.emit(indent + 1, 'too_long = e')
+        self.emit(indent, 'except _NoURL:')
+        self.emit(indent + 1, 'pass')
+        self.emit(indent, 'except _MNA as e:')
+        self.emit(indent + 1, 'guarded = _RG(e, e.response)')
+        self.emit(indent, 'except _RG as e:')
+        self.emit(indent + 1, 'guarded = e')
+        self.emit(indent, 'except _http() as e:')
+        self.emit(indent + 1, 'guarded = _RG(e, e)')
+
+
+def compile_matcher(route):
+    """ Compile matcher for ``route`` tree
+
+    :param route:
+        root of route tree, usually :class:`routr.RouteGroup`
+    :rtype:
+        :class:`.Matcher`
+    """
+    if not (compilable(route) and isinstance(route, RouteGroup)):
+        return Matcher(route, '', route.match)
+    # annotations of chains are merged now rather than on first request
+    route.annotations_index()
+    generator = Generator()
+    name = generator.function(route)
+    generator.emit(0, 'def match(path, request):')
+    generator.emit(1, 'return %s(path, request, (), (), None)' % name)
+    source = generator.source()
+    namespace = generator.namespace
+    code = compile(source, '<routr matcher>', 'exec')
+    exec(code, namespace)
+    return Matcher(route, source, namespace['match'])
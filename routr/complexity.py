@@ -0,0 +1,335 @@
+"""
+
+    routr.complexity -- pattern complexity analysis
+    ===============================================
+
+    Regular expressions of some placeholders can backtrack heavily on crafted
+    URLs -- ``{a:path}/{b:path}/edit`` takes quadratic time to reject long path
+    and converters with nested quantifiers like ``(a+)+`` take exponential
+    time. This module provides :func:`analyze` which finds such patterns in
+    route tree::
+
+        from routr.complexity import analyze, check, limit
+
+        for issue in analyze(routes):
+            print(issue)
+
+        check(routes, strict=True)      # raises InvalidRoutePattern
+        limit(routes, max_path_length=2048)
+
+    and :func:`limit` which bounds length of path matched by the whole tree and
+    by each of super-linear patterns so matching a single request never takes
+    more than ``max_work`` regular expression steps (estimated). Path which is
+    too long for a pattern is a miss for its route only, if no other route
+    matches request is rejected with :class:`routr.exc.PathTooLong`
+    (``414 Request-URI Too Long``).
+
+    Analysis is conservative approximation made on parsed regular expressions,
+    only converters of default :class:`routr.urlpattern.URLPattern` type are
+    inspected.
+
+"""
+
+import math
+import string
+import warnings
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from routr.utils import walk
+from routr.urlpattern import URLPattern
+from routr.exc import InvalidRoutePattern
+
+
+__all__ = (
+    'analyze', 'check', 'limit', 'pattern_complexity', 'Issue',
+    'PatternComplexityWarning')
+
+EXPONENTIAL = 'exponential'
+POLYNOMIAL = 'polynomial'
+AMBIGUOUS = 'ambiguous'
+BACKREFERENCE = 'backreference'
+
+_REPEATS = tuple(
+    getattr(sre_parse, name)
+    for name in ('MAX_REPEAT', 'MIN_REPEAT')
+    if hasattr(sre_parse, name))
+_CHARS = (
+    sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN)
+_PROBE = string.printable
+
+
+class PatternComplexityWarning(UserWarning):
+    """ Warning issued by :func:`check` for patterns which can backtrack
+    heavily
+    """
+
+
+class Issue(object):
+    """ Complexity issue found in route's pattern
+
+    :attr route:
+        route which pattern has an issue
+    :attr kind:
+        ``'exponential'``, ``'polynomial'``, ``'ambiguous'`` or
+        ``'backreference'``
+    :attr message:
+        human readable description
+    :attr degree:
+        estimated degree of polynomial matching time or ``None`` for
+        exponential patterns
+    """
+
+    def __init__(self, route, kind, message, degree):
+        self.route = route
+        self.kind = kind
+        self.message = message
+        self.degree = degree
+
+    def __str__(self):
+        return "%s: pattern '%s' %s" % (
+            self.kind, self.route.pattern.pattern, self.message)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self)
+
+
+def _category(name, ch):
+    name = str(name).lower()
+    if 'digit' in name:
+        result = ch.isdigit()
+    elif 'word' in name:
+        result = ch.isalnum() or ch == '_'
+    elif 'space' in name:
+        result = ch.isspace()
+    else:
+        return True
+    return not result if 'not' in name else result
+
+
+def _accepts(item, ch):
+    """ Check if single character ``item`` of parsed regex accepts ``ch``"""
+    op, av = item
+    if op is sre_parse.LITERAL:
+        return ord(ch) == av
+    if op is sre_parse.NOT_LITERAL:
+        return ord(ch) != av
+    if op is sre_parse.ANY:
+        return ch != '\n'
+    negate = found = False
+    for iop, iav in av:
+        if iop is sre_parse.NEGATE:
+            negate = True
+        elif iop is sre_parse.LITERAL:
+            found = found or ord(ch) == iav
+        elif iop is sre_parse.RANGE:
+            found = found or iav[0] <= ord(ch) <= iav[1]
+        elif iop is sre_parse.CATEGORY:
+            found = found or _category(iav, ch)
+    return found != negate
+
+
+def _overlap(a, b):
+    return any(
+        any(_accepts(x, ch) for x in a) and any(_accepts(y, ch) for y in b)
+        for ch in _PROBE)
+
+
+class _Scan(object):
+    """ Facts about parsed regular expression"""
+
+    def __init__(self):
+        self.chars = []          # char items repeated without bound
+        self.exponential = False
+        self.lookarounds = 0     # lookarounds which scan without bound
+        self.backreference = False
+
+    def visit(self, parsed, unbounded=False):
+        for op, av in parsed:
+            if op in _REPEATS:
+                lo, hi, body = av
+                inner = _Scan()
+                inner.visit(body, unbounded or hi == sre_parse.MAXREPEAT)
+                if hi == sre_parse.MAXREPEAT and inner.chars:
+                    nested = _Scan()
+                    nested.visit_nested(body)
+                    if nested.chars and not _separated(body, nested.chars):
+                        self.exponential = True
+                self.merge(inner)
+            elif op is sre_parse.SUBPATTERN:
+                self.visit(av[-1], unbounded)
+            elif op is sre_parse.BRANCH:
+                for alternative in av[1]:
+                    self.visit(alternative, unbounded)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                inner = _Scan()
+                inner.visit(av[1], False)
+                if inner.chars:
+                    self.lookarounds += 1
+                self.exponential = self.exponential or inner.exponential
+                self.backreference = self.backreference or inner.backreference
+            elif op is sre_parse.GROUPREF:
+                self.backreference = True
+            elif op in _CHARS and unbounded:
+                self.chars.append((op, av))
+
+    def visit_nested(self, parsed):
+        # collect chars of unbounded repeats nested into repeat's body
+        for op, av in parsed:
+            if op in _REPEATS:
+                if av[1] == sre_parse.MAXREPEAT:
+                    self.visit(av[2], True)
+                else:
+                    self.visit_nested(av[2])
+            elif op is sre_parse.SUBPATTERN:
+                self.visit_nested(av[-1])
+            elif op is sre_parse.BRANCH:
+                for alternative in av[1]:
+                    self.visit_nested(alternative)
+
+    def merge(self, other):
+        self.chars.extend(other.chars)
+        self.exponential = self.exponential or other.exponential
+        self.lookarounds += other.lookarounds
+        self.backreference = self.backreference or other.backreference
+
+
+def _separated(body, chars):
+    # body of repeat is unambiguous if it has mandatory character which can't
+    # be matched by repeats nested into it
+    items = list(body)
+    while len(items) == 1 and items[0][0] is sre_parse.SUBPATTERN:
+        items = list(items[0][1][-1])
+    return any(
+        op in _CHARS and not _overlap([(op, av)], chars)
+        for op, av in items)
+
+
+def _placeholders(pattern):
+    """ Return list of ``(scan, literal)`` for placeholders of ``pattern``
+    where ``literal`` is a text which follows placeholder
+    """
+    matches = list(pattern._type_re.finditer(pattern.pattern))
+    result = []
+    for n, m in enumerate(matches):
+        converter = pattern.lookup_converter(m.group('type'), m.group('args'))
+        scan = _Scan()
+        scan.visit(sre_parse.parse(converter.regex))
+        end = matches[n + 1].start() if n + 1 < len(matches) else None
+        result.append((scan, pattern.pattern[m.end():end]))
+    return result
+
+
+def pattern_complexity(pattern):
+    """ Estimate complexity of matching ``pattern``
+
+    :return:
+        tuple of estimated degree of polynomial matching time (``None`` for
+        exponential) and list of ``(kind, message)`` pairs
+    """
+    if pattern.is_exact:
+        return 1, []
+    placeholders = _placeholders(pattern)
+    problems = []
+    ambiguous = 0
+    lookarounds = 0
+    exponential = False
+    for n, (scan, literal) in enumerate(placeholders):
+        if scan.exponential:
+            exponential = True
+            problems.append((
+                EXPONENTIAL,
+                'has placeholder #%d with nested quantifiers' % (n + 1)))
+        if scan.backreference:
+            problems.append((
+                BACKREFERENCE,
+                'has placeholder #%d with backreference' % (n + 1)))
+        lookarounds += scan.lookarounds
+        if not scan.chars:
+            continue
+        if literal:
+            if any(_accepts(c, literal[0]) for c in scan.chars):
+                ambiguous += 1
+                problems.append((
+                    AMBIGUOUS, "has placeholder #%d which can match '%s'"
+                    % (n + 1, literal[0])))
+        elif n + 1 < len(placeholders):
+            following = placeholders[n + 1][0]
+            if following.chars and _overlap(scan.chars, following.chars):
+                ambiguous += 1
+                problems.append((
+                    AMBIGUOUS, 'has adjacent placeholders #%d and #%d'
+                    % (n + 1, n + 2)))
+    if exponential:
+        return None, problems
+    degree = max(1, ambiguous) + lookarounds
+    if degree > 1:
+        problems.append((
+            POLYNOMIAL, 'can take O(n^%d) time to match' % degree))
+    return degree, problems
+
+
+def _analyzable(route):
+    return type(getattr(route, 'pattern', None)) is URLPattern
+
+
+def analyze(route):
+    """ Find patterns in ``route`` tree which can backtrack heavily
+
+    :rtype:
+        list of :class:`.Issue`
+    """
+    issues = []
+    for r in walk(route):
+        if not _analyzable(r):
+            continue
+        degree, problems = pattern_complexity(r.pattern)
+        for kind, message in problems:
+            issues.append(Issue(r, kind, message, degree))
+    return issues
+
+
+def check(route, strict=False):
+    """ Analyze ``route`` tree and warn about found issues with
+    :class:`.PatternComplexityWarning`
+
+    :param strict:
+        raise :class:`routr.exc.InvalidRoutePattern` if any issues were found
+    """
+    issues = analyze(route)
+    if strict and issues:
+        raise InvalidRoutePattern(
+            'patterns can backtrack heavily:\n' +
+            '\n'.join(str(issue) for issue in issues))
+    for issue in issues:
+        warnings.warn(str(issue), PatternComplexityWarning, stacklevel=2)
+    return issues
+
+
+def limit(route, max_path_length=None, max_work=1000000):
+    """ Set limits on length of path matched against ``route`` tree
+
+    :param max_path_length:
+        maximum length of request path accepted by ``route``
+    :param max_work:
+        estimated number of regular expression steps a single pattern is
+        allowed to take, lengths of paths matched against super-linear
+        patterns are limited accordingly
+
+    Limits should be set before compiling matcher with
+    :func:`routr.codegen.compile_matcher`.
+    """
+    if max_path_length is not None:
+        route.max_path_length = max_path_length
+    for r in walk(route):
+        if not _analyzable(r):
+            continue
+        degree, _ = pattern_complexity(r.pattern)
+        if degree is None:
+            r.pattern.max_length = int(math.log(max_work, 2))
+        elif degree > 1:
+            r.pattern.max_length = int(max_work ** (1.0 / degree))
+    return route
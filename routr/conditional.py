@@ -0,0 +1,81 @@
+"""
+
+    routr.conditional -- conditional requests
+    =========================================
+
+    Routes can declare a cheap validator function via ``validator``
+    annotation::
+
+        def news_version(id):
+            return 'v%d' % versions[id]
+
+        routes = route(GET, '/news/{id:int}', get_news, validator=news_version)
+
+    Validator is called by :class:`routr.dispatch.Dispatcher` with the same
+    arguments as target, if result matches ``If-None-Match`` or
+    ``If-Modified-Since`` request headers then ``304 Not Modified`` response is
+    returned without calling target at all.
+
+    Validator can return ETag string, ``datetime`` or timestamp of last
+    modification, a tuple of both or ``None`` if resource can't be validated.
+
+"""
+
+from datetime import datetime, timedelta
+
+from webob.exc import HTTPNotModified
+from webob.datetime_utils import UTC
+
+
+__all__ = (
+    'validators', 'not_modified', 'not_modified_response', 'set_validators')
+
+_epoch = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def validators(value):
+    """ Normalize value returned by validator into ``(etag, last_modified)``
+    tuple
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, tuple):
+        etag, last_modified = value
+    elif isinstance(value, (datetime, int, float)):
+        etag, last_modified = None, value
+    else:
+        etag, last_modified = value, None
+    if isinstance(last_modified, (int, float)):
+        last_modified = _epoch + timedelta(seconds=last_modified)
+    elif last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=UTC)
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """ Check if ``request`` can be answered with ``304 Not Modified``"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.if_none_match:
+        return etag is not None and etag in request.if_none_match
+    if_modified_since = request.if_modified_since
+    if if_modified_since is not None and last_modified is not None:
+        return last_modified <= if_modified_since
+    return False
+
+
+def not_modified_response(etag, last_modified):
+    """ Return ``304 Not Modified`` response with validators set"""
+    response = HTTPNotModified()
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    """ Set validators on ``response`` unless it already has them"""
+    if etag is not None and response.etag is None:
+        response.etag = etag
+    if last_modified is not None and response.last_modified is None:
+        response.last_modified = last_modified
@@ -0,0 +1,207 @@
+"""
+
+    routr.dispatch -- dispatching requests to matched targets
+    =========================================================
+
+    This module provides :class:`Dispatcher` -- a WSGI application which
+    matches requests against routes and calls targets of matched endpoints::
+
+        from routr import route, GET
+        from routr.dispatch import Dispatcher
+
+        application = Dispatcher(route(
+            route(GET, '/',          index),
+            route(GET, '/news/{id}', news, cache=60),
+            ))
+
+    Dispatcher honours route annotations which change the way target is
+    called, like ``concurrency`` (see :mod:`routr.limits`), ``validator``
+    (see :mod:`routr.conditional`), ``cache`` (see :mod:`routr.cache`) and
+    ``coalesce`` (see :mod:`routr.coalesce`).
+    WSGI applications mounted with :func:`routr.mount.mount` are called
+    directly.
+
+"""
+
+from webob import Request
+from webob.exc import HTTPException
+from routr.mount import Mount, MountIndex
+from routr.utils import positional_args
+from routr.exc import NoMatchFound
+
+
+__all__ = ('Dispatcher',)
+
+
+class Dispatcher(object):
+    """ WSGI application which dispatches requests to targets of matched
+    routes
+
+    Targets are called with ``trace.args`` and ``trace.kwargs``, ``request``
+    is passed as well if target accepts ``request`` positional argument.
+    Targets of routes annotated with ``static_view`` are called as
+    ``target(request, *trace.args)``. Targets should return
+    :class:`webob.Response` objects.
+
+    :param routes:
+        routes to match requests against
+    :param cache:
+        :class:`routr.cache.ResponseCache` for routes annotated with ``cache``
+        annotation, new cache is created if not supplied
+    :param limiter:
+        :class:`routr.limits.Limiter` for routes annotated with
+        ``concurrency`` annotation, new limiter is created if not supplied
+    :param coalescer:
+        :class:`routr.coalesce.Coalescer` for routes annotated with
+        ``coalesce`` annotation, new coalescer is created if not supplied
+    """
+
+    request_cls = Request
+
+    def __init__(self, routes, cache=None, limiter=None, coalescer=None):
+        if cache is None:
+            from routr.cache import ResponseCache
+            cache = ResponseCache()
+        if limiter is None:
+            limiter = self.create_limiter()
+        if coalescer is None:
+            coalescer = self.create_coalescer()
+        self.routes = routes
+        self.cache = cache
+        self.limiter = limiter
+        self.coalescer = coalescer
+        self._request_positions = {}
+        self._mounts = None
+
+    def __call__(self, environ, start_response):
+        mounts = self.mounts
+        if mounts.index:
+            m = mounts.resolve(environ)
+            if m is not None:
+                return m.app(environ, start_response)
+        request = self.request_cls(environ)
+        response = self.dispatch(request)
+        return response(environ, start_response)
+
+    @property
+    def mounts(self):
+        """ :class:`routr.mount.MountIndex` of mounts resolved before
+        constructing request, rebuilt when routes change
+        """
+        version = getattr(self.routes, 'version', None)
+        cached = self._mounts
+        if cached is None or cached[0] != version:
+            cached = self._mounts = (
+                version, MountIndex.from_routes(self.routes))
+        return cached[1]
+
+    def match(self, request):
+        """ Match ``request`` against routes and return trace"""
+        return self.routes(request)
+
+    def dispatch(self, request):
+        """ Dispatch ``request`` and return response"""
+        try:
+            trace = self.match(request)
+        except NoMatchFound as e:
+            return e.response
+        except HTTPException as e:
+            return e
+        try:
+            return self.handle(request, trace)
+        except HTTPException as e:
+            return e
+
+    def create_limiter(self):
+        from routr.limits import Limiter
+        return Limiter()
+
+    def create_coalescer(self):
+        from routr.coalesce import Coalescer
+        return Coalescer()
+
+    def handle(self, request, trace):
+        """ Produce response for ``request`` matched with ``trace`` honouring
+        route annotations
+        """
+        policy = trace.annotation('concurrency')
+        if policy is not None:
+            return self.limiter.handle(request, trace, policy, self.validate)
+        return self.validate(request, trace)
+
+    def validate(self, request, trace):
+        """ Produce response for ``request`` honouring ``validator``
+        annotation
+        """
+        validator = trace.annotation('validator')
+        if validator is None:
+            return self.respond(request, trace)
+        from routr.conditional import (
+            validators, not_modified, not_modified_response, set_validators)
+        etag, last_modified = validators(
+            self.apply(validator, request, trace))
+        if not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        response = self.respond(request, trace)
+        if hasattr(response, 'status_int') and response.status_int == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def respond(self, request, trace):
+        """ Produce response for ``request`` by calling target, possibly
+        through response cache
+        """
+        policy = trace.annotation('cache')
+        if policy is not None:
+            return self.cache.handle(request, trace, policy, self.execute)
+        return self.execute(request, trace)
+
+    def execute(self, request, trace):
+        """ Call target of matched ``trace`` coalescing identical concurrent
+        requests if route is annotated with ``coalesce`` annotation
+        """
+        policy = trace.annotation('coalesce')
+        if policy is not None:
+            return self.coalescer.handle(request, trace, policy, self.call)
+        return self.call(request, trace)
+
+    def call(self, request, trace):
+        """ Call target of matched ``trace``"""
+        target = trace.target
+        if trace.annotation('static_view'):
+            return target(request, *trace.args)
+        if isinstance(trace.endpoint, Mount):
+            return trace.endpoint.respond(request, trace)
+        return self.apply(target, request, trace)
+
+    def apply(self, func, request, trace):
+        """ Call ``func`` with ``trace.args`` and ``trace.kwargs`` injecting
+        ``request`` if ``func`` accepts it
+        """
+        position = self.request_position(func)
+        if position is None:
+            return func(*trace.args, **trace.kwargs)
+        args = list(trace.args)
+        args.insert(position, request)
+        return func(*args, **trace.kwargs)
+
+    def request_position(self, target):
+        """ Return position of ``request`` argument in ``target`` signature
+        or ``None`` if it doesn't accept one
+        """
+        try:
+            return self._request_positions[target]
+        except KeyError:
+            pass
+        except TypeError:
+            return _request_position(target)
+        position = self._request_positions[target] = _request_position(target)
+        return position
+
+
+def _request_position(target):
+    try:
+        args = positional_args(target)
+    except TypeError:
+        return None
+    return args.index('request') if 'request' in args else None
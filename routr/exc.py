@@ -3,15 +3,41 @@
     routr.exc -- exceptions
     =======================
 
+    Responses attached to exceptions are created on first access so importing
+    this module doesn't import :mod:`webob.exc`.
+
 """
 
-from webob import exc
+import sys
 
 
 __all__ = (
     'NoMatchFound', 'NoURLPatternMatched', 'RouteGuarded', 'MethodNotAllowed',
     'RouteConfigurationError', 'InvalidRoutePattern',
-    'RouteReversalError')
+    'RouteReversalError', 'PathTooLong', 'http_exceptions')
+
+
+def http_exceptions():
+    """ Return :class:`webob.exc.HTTPException` to be used in ``except``
+    clauses or empty tuple if :mod:`webob.exc` wasn't imported yet -- nothing
+    could raise such exception then
+    """
+    module = sys.modules.get('webob.exc')
+    return module.HTTPException if module is not None else ()
+
+
+class lazy_response(object):
+    """ Response from :mod:`webob.exc` created on first access"""
+
+    def __init__(self, name):
+        self.name = name
+        self.response = None
+
+    def __get__(self, obj, cls):
+        if self.response is None:
+            from webob import exc
+            self.response = getattr(exc, self.name)()
+        return self.response
 
 
 class NoMatchFound(Exception):
@@ -27,7 +53,7 @@ class NoMatchFound(Exception):
 class NoURLPatternMatched(NoMatchFound):
     """ Raised when request wasn't matched against any URL pattern"""
 
-    response = exc.HTTPNotFound()
+    response = lazy_response('HTTPNotFound')
 
 
 class RouteGuarded(NoMatchFound):
@@ -47,7 +73,17 @@ class RouteGuarded(NoMatchFound):
 class MethodNotAllowed(NoMatchFound):
     """ Raised when request was matched but request method isn't allowed"""
 
-    response = exc.HTTPMethodNotAllowed()
+    response = lazy_response('HTTPMethodNotAllowed')
+
+
+class PathTooLong(NoURLPatternMatched):
+    """ Raised when request path is too long to be matched safely
+
+    Route which raised it is treated as not matched, route group raises it
+    only if none of its routes matched.
+    """
+
+    response = lazy_response('HTTPRequestURITooLong')
 
 
 class RouteConfigurationError(Exception):
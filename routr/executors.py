@@ -0,0 +1,153 @@
+"""
+
+    routr.executors -- executor pools for offloading targets
+    ========================================================
+
+    This module provides :class:`Executors` -- a registry of named,
+    size-bounded executor pools which :class:`routr.aio.AsyncDispatcher` uses
+    to run targets of routes annotated with ``executor`` annotation off the
+    event loop::
+
+        from routr import route, GET
+        from routr.executors import Executors, Pool
+
+        routes = route(
+            route(GET, '/report.pdf',      render_pdf, executor='process'),
+            route(GET, '/thumb/{id:int}',  resize,     executor='images'),
+            )
+
+        executors = Executors(images=Pool('thread', max_workers=2))
+
+    Pools ``thread`` and ``process`` are always available, all pools are
+    started lazily on first use.
+
+"""
+
+import pickle
+import threading
+
+from routr.exc import RouteConfigurationError
+
+
+__all__ = ('Pool', 'Executors')
+
+
+class Pool(object):
+    """ Specification of executor pool
+
+    :param kind:
+        ``'thread'`` or ``'process'``
+    :param max_workers:
+        maximum number of workers, :mod:`concurrent.futures` default is used
+        if not supplied
+    """
+
+    kinds = ('thread', 'process')
+
+    def __init__(self, kind='thread', max_workers=None):
+        if kind not in self.kinds:
+            raise ValueError("invalid pool kind: %r" % kind)
+        self.kind = kind
+        self.max_workers = max_workers
+
+    @classmethod
+    def coerce(cls, value):
+        """ Make pool out of ``value`` which can be a pool itself or a number
+        of workers for thread pool
+        """
+        if isinstance(value, cls):
+            return value
+        return cls('thread', value)
+
+    def create(self):
+        """ Create executor for this pool"""
+        from concurrent import futures
+        if self.kind == 'process':
+            return futures.ProcessPoolExecutor(self.max_workers)
+        return futures.ThreadPoolExecutor(self.max_workers)
+
+    def __repr__(self):
+        return '%s(%r, max_workers=%r)' % (
+            self.__class__.__name__, self.kind, self.max_workers)
+
+
+class Executors(object):
+    """ Registry of named executor pools
+
+    Pools are passed as keyword arguments mapping names to :class:`.Pool`
+    objects or numbers of workers for thread pools, ``thread`` and ``process``
+    pools are defined by default.
+    """
+
+    default_pools = {
+        'thread': Pool('thread'),
+        'process': Pool('process'),
+    }
+
+    def __init__(self, **pools):
+        self.pools = dict(self.default_pools)
+        for name, pool in pools.items():
+            self.pools[name] = Pool.coerce(pool)
+        self._executors = {}
+        self._picklable = {}
+        self._lock = threading.Lock()
+
+    def pool(self, name):
+        """ Return :class:`.Pool` registered under ``name``"""
+        try:
+            return self.pools[name]
+        except KeyError:
+            raise RouteConfigurationError("unknown executor: %r" % name)
+
+    def executor(self, name):
+        """ Return executor for pool ``name`` starting it if needed"""
+        executor = self._executors.get(name)
+        if executor is None:
+            pool = self.pool(name)
+            with self._lock:
+                executor = self._executors.get(name)
+                if executor is None:
+                    executor = self._executors[name] = pool.create()
+        return executor
+
+    def submit(self, name, func, *args, **kwargs):
+        """ Submit ``func`` call to pool ``name`` and return
+        :class:`concurrent.futures.Future`
+
+        For process pools ``func`` is checked to be picklable so misconfigured
+        targets fail with clear error instead of broken pool.
+        """
+        if self.pool(name).kind == 'process':
+            self.check_picklable(func)
+        return self.executor(name).submit(func, *args, **kwargs)
+
+    def check_picklable(self, func):
+        """ Check that ``func`` can be sent to process pool"""
+        try:
+            picklable = self._picklable[func]
+        except (KeyError, TypeError):
+            picklable = _picklable(func)
+            try:
+                self._picklable[func] = picklable
+            except TypeError:
+                pass
+        if not picklable:
+            raise RouteConfigurationError(
+                "target %r can't be run in process pool as it isn't picklable"
+                " (only module level functions are)" % func)
+
+    def shutdown(self, wait=True):
+        """ Shutdown all started executors"""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
+def _picklable(func):
+    try:
+        pickle.dumps(func)
+    except Exception:
+        return False
+    return True
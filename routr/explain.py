@@ -0,0 +1,255 @@
+"""
+
+    routr.explain -- tracing of route matching
+    ==========================================
+
+    This module provides :func:`explain` which matches request against routes
+    just like ``routes(request)`` does but also records every route visited
+    along with the outcome and time spent::
+
+        from routr.explain import explain
+
+        explanation = explain(routes, request)
+        for step in explanation.steps:
+            print(step.depth, step.outcome, step.description)
+
+    For production use there's :class:`Sampler` which explains only every Nth
+    request and matches others as usual.
+
+"""
+
+import itertools
+from collections import deque
+
+from webob.exc import HTTPException
+from routr import Trace, Endpoint, RouteGroup, Route
+from routr.exc import (
+    NoURLPatternMatched, MethodNotAllowed, RouteGuarded, PathTooLong)
+from routr.utils import timer
+
+
+__all__ = ('explain', 'Explanation', 'Step', 'Sampler')
+
+
+MATCH = 'match'
+URL_MISS = 'url_miss'
+METHOD_MISS = 'method_miss'
+GUARDED = 'guarded'
+ERROR = 'error'
+
+
+def describe(route):
+    """ Return short human readable description of ``route``"""
+    pattern = route.pattern.pattern if route.pattern is not None else None
+    if isinstance(route, Endpoint):
+        return '%s %s -> %r' % (route.method, pattern or '/', route.target)
+    return '%s %s' % (route.__class__.__name__, pattern or '')
+
+
+class Step(object):
+    """ Single route visited during matching
+
+    :attr route:
+        visited route
+    :attr depth:
+        depth of route in routes tree, starting from 0
+    :attr outcome:
+        one of ``'match'``, ``'url_miss'``, ``'method_miss'``, ``'guarded'``
+        or ``'error'``
+    :attr reason:
+        description of why route was guarded or errored, ``None`` otherwise
+    :attr elapsed:
+        time spent matching route in seconds including its subroutes
+    """
+
+    def __init__(self, route, depth):
+        self.route = route
+        self.depth = depth
+        self.outcome = None
+        self.reason = None
+        self.elapsed = 0.0
+
+    @property
+    def description(self):
+        return describe(self.route)
+
+    def as_dict(self):
+        """ Return step as a dict of plain data"""
+        return {
+            'route': self.description,
+            'name': getattr(self.route, 'name', None),
+            'depth': self.depth,
+            'outcome': self.outcome,
+            'reason': self.reason,
+            'elapsed': self.elapsed,
+        }
+
+    def __repr__(self):
+        return '<%s %s %s>' % (
+            self.__class__.__name__, self.outcome, self.description)
+
+
+class Explanation(object):
+    """ Result of :func:`explain`
+
+    :attr steps:
+        a list of :class:`.Step` objects in order routes were visited
+    :attr trace:
+        matched :class:`routr.Trace` or ``None``
+    :attr error:
+        exception raised by matching or ``None``
+    :attr elapsed:
+        total time spent in matching in seconds
+    """
+
+    def __init__(self, request, path_info=None):
+        self.method = request.method
+        self.path_info = (
+            request.path_info if path_info is None else path_info)
+        self.steps = []
+        self.trace = None
+        self.error = None
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        """ Return explanation as a dict of plain data suitable for
+        serialization into JSON
+        """
+        return {
+            'method': self.method,
+            'path_info': self.path_info,
+            'matched': self.trace is not None,
+            'target': repr(self.trace.target) if self.trace else None,
+            'error': _reason(self.error) if self.error else None,
+            'elapsed': self.elapsed,
+            'steps': [s.as_dict() for s in self.steps],
+        }
+
+
+def explain(routes, request):
+    """ Match ``request`` against ``routes`` recording every visited route
+
+    Returns :class:`.Explanation` which contains matched trace or exception
+    which would be raised by ``routes(request)``.
+    """
+    path_info = routes.request_path(request)
+    explanation = Explanation(request, path_info)
+    start = timer()
+    try:
+        # the same check as in Route.__call__, nothing is visited then
+        if (routes.max_path_length is not None
+                and len(path_info) > routes.max_path_length):
+            raise PathTooLong()
+        explanation.trace = _match(
+            routes, path_info, request, 0, explanation.steps)
+    except Exception as e:
+        explanation.error = e
+    explanation.elapsed = timer() - start
+    return explanation
+
+
+class Sampler(object):
+    """ Routes wrapper which explains every ``every``-th request
+
+    Other requests are matched against ``routes`` as usual so overhead of
+    sampling is a single counter increment per request.
+
+    :param routes:
+        routes to match requests against
+    :param every:
+        explain one request out of this number
+    :param sink:
+        callable which receives :class:`.Explanation` objects, by default
+        explanations are stored in ``explanations`` bounded by ``maxlen``
+    """
+
+    def __init__(self, routes, every=100, sink=None, maxlen=100):
+        self.routes = routes
+        self.every = every
+        self.explanations = deque(maxlen=maxlen)
+        self.sink = sink or self.explanations.append
+        self._counter = itertools.count(1)
+
+    def __call__(self, request):
+        if next(self._counter) % self.every:
+            return self.routes(request)
+        explanation = explain(self.routes, request)
+        self.sink(explanation)
+        if explanation.error is not None:
+            raise explanation.error
+        return explanation.trace
+
+
+def _reason(e):
+    if isinstance(e, RouteGuarded):
+        e = e.response if e.response is not None else e.reason
+    if isinstance(e, HTTPException):
+        return e.status
+    return '%s: %s' % (e.__class__.__name__, e)
+
+
+def _match(route, path_info, request, depth, steps):
+    step = Step(route, depth)
+    steps.append(step)
+    start = timer()
+    try:
+        if type(route).match is Endpoint.match:
+            trace = _match_endpoint(route, path_info, request, step)
+        elif type(route).match is RouteGroup.match:
+            trace = _match_group(route, path_info, request, depth, steps, step)
+        else:
+            trace = route.match(path_info, request)
+    except PathTooLong as e:
+        step.outcome = step.outcome or URL_MISS
+        step.reason = step.reason or _reason(e)
+        raise
+    except NoURLPatternMatched:
+        step.outcome = step.outcome or URL_MISS
+        raise
+    except MethodNotAllowed:
+        step.outcome = step.outcome or METHOD_MISS
+        raise
+    except (RouteGuarded, HTTPException) as e:
+        step.outcome = step.outcome or GUARDED
+        step.reason = step.reason or _reason(e)
+        raise
+    except Exception as e:
+        step.outcome = ERROR
+        step.reason = _reason(e)
+        raise
+    else:
+        step.outcome = MATCH
+        return trace
+    finally:
+        step.elapsed = timer() - start
+
+
+def _match_guards(route, request, trace, step):
+    if type(route).match_guards is not Route.match_guards:
+        return route.match_guards(request, trace)
+    for guard in route.guards:
+        try:
+            trace = guard(request, trace) or trace
+        except Exception as e:
+            step.reason = '%s: %s' % (
+                getattr(guard, '__name__', repr(guard)), _reason(e))
+            raise
+    return trace
+
+
+def _match_endpoint(route, path_info, request, step):
+    path_info, args = route.match_pattern(path_info)
+    if path_info:
+        raise NoURLPatternMatched()
+    route.match_method(request)
+    trace = Trace(args, {}, [route])
+    return _match_guards(route, request, trace, step)
+
+
+def _match_group(route, path_info, request, depth, steps, step):
+    path_info, args = route.match_pattern(path_info)
+    trace = Trace(args, {}, [route])
+    trace = _match_guards(route, request, trace, step)
+    return route.match_routes(
+        trace, route.routes,
+        lambda r: _match(r, path_info, request, depth + 1, steps))
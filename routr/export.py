@@ -0,0 +1,286 @@
+"""
+
+    routr.export -- export route tables to reverse proxy configuration
+    ==================================================================
+
+    Some routing decisions can be made by reverse proxy in front of
+    application: static assets can be served from directories directly and
+    requests with methods no route accepts can be rejected with ``405 Method
+    Not Allowed``. This module walks route tree and produces rules for that::
+
+        from routr.export import rules, nginx
+
+        for rule in rules(routes):
+            print(rule.as_dict())
+
+        print(nginx(routes, upstream='http://app'))
+
+    or from command line::
+
+        % python -m routr.export myapp.routes:routes --upstream http://app
+
+    Export is conservative, rules are produced only for routes which the proxy
+    can handle exactly like routr does -- guarded routes, routes with custom
+    route or pattern classes, patterns with converters which can reject
+    matched values and routes which can match the same paths as any of those
+    are marked as upstream-only. Static directories are served by proxy only if
+    no other route can match paths under their prefix.
+
+"""
+
+import re
+import sys
+import json
+
+from routr import Endpoint, RouteGroup
+from routr.codegen import compilable
+from routr.urlpattern import IntConverter, UUIDConverter, value_converter
+from routr.utils import import_string
+
+
+__all__ = ('rules', 'nginx', 'Rule')
+
+GUARDED = 'guarded'
+OPAQUE = 'opaque'
+CONVERTER = 'converter'
+OVERLAP = 'overlap'
+
+_group_name_re = re.compile(r'(?<!\\)\(\?P<[a-zA-Z_0-9]+>')
+
+
+class Rule(object):
+    """ Proxy rule for endpoint (or opaque route) of route tree
+
+    :attr route:
+        endpoint or opaque route
+    :attr pattern:
+        full pattern of route
+    :attr regex:
+        regular expression which matches whole path or ``None`` for opaque
+        routes
+    :attr exact:
+        tuple of paths route matches if its pattern has no placeholders,
+        ``None`` otherwise
+    :attr prefix:
+        literal prefix of all paths route can match
+    :attr methods:
+        methods proxy should allow or ``None`` if rule is upstream-only
+    :attr directory:
+        directory static assets should be served from by proxy or ``None``
+    :attr reason:
+        why rule is upstream-only -- ``'guarded'``, ``'opaque'``,
+        ``'converter'`` or ``'overlap'``
+    """
+
+    def __init__(self, route, pattern, regex, exact, prefix, method, reason):
+        self.route = route
+        self.pattern = pattern
+        self.regex = regex
+        self.exact = exact
+        self.prefix = prefix
+        self.method = method
+        self.methods = None
+        self.directory = None
+        self.reason = reason
+
+    @property
+    def upstream_only(self):
+        return self.methods is None
+
+    def matches(self, path):
+        """ Check if rule can match ``path``"""
+        if self.exact is not None:
+            return path in self.exact
+        if self.regex is None:
+            return path.startswith(self.prefix)
+        return re.match('(?:%s)\\Z' % self.regex, path) is not None
+
+    def overlaps(self, other):
+        """ Check if rule and ``other`` rule can match the same path"""
+        if self.exact is not None:
+            return any(other.matches(p) for p in self.exact)
+        if other.exact is not None:
+            return other.overlaps(self)
+        return (self.prefix.startswith(other.prefix)
+                or other.prefix.startswith(self.prefix))
+
+    def as_dict(self):
+        """ Return rule as a dict suitable for serialization"""
+        return {
+            'pattern': self.pattern,
+            'regex': self.regex,
+            'exact': list(self.exact) if self.exact is not None else None,
+            'prefix': self.prefix,
+            'methods': self.methods,
+            'directory': self.directory,
+            'upstream_only': self.upstream_only,
+            'reason': self.reason,
+        }
+
+    def __repr__(self):
+        return '<%s %s %s>' % (
+            self.__class__.__name__, self.method or '*', self.pattern)
+
+
+def _can_reject(converter):
+    # check if converter can reject value matched by its regular expression
+    if type(converter) is IntConverter:
+        return converter.min is not None and (
+            converter.min < 0 or converter.max is None and converter.min > 0)
+    if type(converter) is UUIDConverter:
+        return False
+    return value_converter(converter) is not None
+
+
+def _parts(pattern):
+    """ Return regex, literal prefix and reject flag for ``pattern``"""
+    if pattern is None:
+        return '', '', False
+    if pattern.is_exact:
+        return re.escape(pattern.pattern), pattern.pattern, False
+    regex = _group_name_re.sub('(', pattern.compiled.pattern)
+    first = pattern._type_re.search(pattern.pattern)
+    reject = pattern.max_length is not None or any(
+        _can_reject(c) for c in pattern._converters)
+    return regex, pattern.pattern[:first.start()], reject
+
+
+def _collect(route, chain, collected):
+    # chain is (pattern, regex, prefix, literal, guarded, reject) of groups
+    pattern, regex, prefix, literal, guarded, reject = chain
+    if not compilable(route):
+        own = getattr(route.pattern, 'pattern', None) or ''
+        collected.append(Rule(
+            route, pattern + own or '/', None, None, prefix, None, OPAQUE))
+        return
+    r_regex, r_prefix, r_reject = _parts(route.pattern)
+    if literal:
+        prefix += r_prefix
+    chain = (
+        pattern + (route.pattern.pattern if route.pattern else ''),
+        regex + r_regex, prefix,
+        literal and (route.pattern is None or route.pattern.is_exact),
+        guarded or bool(route.guards), reject or r_reject)
+    if isinstance(route, RouteGroup):
+        for r in route.routes:
+            _collect(r, chain, collected)
+        return
+    pattern, regex, prefix, literal, guarded, reject = chain
+    exact = None
+    if route.pattern is None:
+        # endpoint without pattern matches the rest of path if it's empty
+        regex += '/?'
+        if literal:
+            exact = (prefix, prefix + '/') if prefix else ('/',)
+    elif literal:
+        exact = (prefix,)
+    reason = GUARDED if guarded else CONVERTER if reject else None
+    collected.append(Rule(
+        route, pattern or '/', regex, exact, prefix, route.method, reason))
+
+
+def _static_directory(rule):
+    target = rule.route.target
+    directory = getattr(target, 'directory', None)
+    if (directory is None or not getattr(target, 'static_view', False)
+            or not rule.pattern.endswith('{path:path}')
+            or rule.pattern[:-len('{path:path}')] != rule.prefix):
+        return None
+    return directory
+
+
+def rules(route):
+    """ Return proxy rules for ``route`` tree
+
+    :rtype:
+        list of :class:`.Rule`, in order of routes in tree
+    """
+    collected = []
+    _collect(route, ('', '', '', True, False, False), collected)
+    for rule in collected:
+        if rule.reason is not None:
+            continue
+        overlapping = [
+            other for other in collected
+            if other is not rule and rule.overlaps(other)]
+        if any(other.reason in (GUARDED, OPAQUE, CONVERTER)
+               for other in overlapping):
+            rule.reason = OVERLAP
+            continue
+        rule.methods = sorted(set(
+            [rule.method] + [other.method for other in overlapping]))
+        if not overlapping and isinstance(rule.route, Endpoint):
+            rule.directory = _static_directory(rule)
+    return collected
+
+
+def _quote(value):
+    if re.search(r'[\s;{}"\'\\$]', value):
+        return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    return value
+
+
+def _location(rule):
+    if rule.directory is not None:
+        return '^~ %s' % _quote(rule.prefix)
+    if rule.exact is not None and len(rule.exact) == 1:
+        return '= %s' % _quote(rule.exact[0])
+    return '~ "^%s$"' % rule.regex.replace('"', '\\"')
+
+
+def nginx(route, upstream='http://app'):
+    """ Return nginx ``location`` blocks for ``route`` tree
+
+    :param upstream:
+        address of application for ``proxy_pass`` directives
+    """
+    lines = ['# generated by routr.export']
+    blocks = {}
+    for rule in rules(route):
+        if rule.upstream_only:
+            lines.append('# upstream-only (%s): %s %s' % (
+                rule.reason, rule.method or '*', rule.pattern))
+            continue
+        location = _location(rule)
+        if location in blocks:
+            continue
+        blocks[location] = True
+        lines.append('location %s {' % location)
+        lines.append('    if ($request_method !~ ^(%s)$) {' % '|'.join(
+            rule.methods))
+        lines.append('        return 405;')
+        lines.append('    }')
+        if rule.directory is not None:
+            lines.append('    alias %s;' % _quote(
+                rule.directory.rstrip('/') + '/'))
+        else:
+            lines.append('    proxy_pass %s;' % upstream)
+        lines.append('}')
+    lines.append('location / {')
+    lines.append('    proxy_pass %s;' % upstream)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m routr.export',
+        description='export route tree to reverse proxy configuration')
+    parser.add_argument(
+        'routes', help='import path of route tree, like myapp:routes')
+    parser.add_argument(
+        '-f', '--format', choices=('nginx', 'json'), default='nginx')
+    parser.add_argument('-u', '--upstream', default='http://app')
+    args = parser.parse_args(argv)
+    routes = import_string(args.routes)
+    if args.format == 'json':
+        print(json.dumps(
+            [rule.as_dict() for rule in rules(routes)], indent=2))
+    else:
+        sys.stdout.write(nginx(routes, upstream=args.upstream))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""
+
+    routr.fuzz -- differential testing of matching engines
+    ======================================================
+
+    Alternative matching engines (like :mod:`routr.codegen`) should match
+    exactly like ``RouteGroup.match`` does. This module generates random route
+    trees with nested groups, typed placeholders, methods and guards which
+    accept, reject or modify trace, and random requests for them. Requests are
+    matched by reference and candidate engines and the first difference found
+    is shrunk to the smallest route tree which still reproduces it::
+
+        from routr.fuzz import fuzz
+        from routr.codegen import compile_matcher
+
+        mismatch = fuzz(compile_matcher, iterations=1000)
+        if mismatch is not None:
+            print(mismatch)
+
+    Engine is a function which accepts route tree and returns a callable which
+    matches request against it -- returns trace or raises exception. The same
+    can be done from command line::
+
+        % python -m routr.fuzz routr.codegen:compile_matcher
+
+"""
+
+import sys
+import random
+
+from webob import Request
+from webob.exc import HTTPForbidden
+from routr import Endpoint, RouteGroup
+from routr.exc import RouteGuarded
+from routr.utils import import_string
+
+
+__all__ = ('fuzz', 'Mismatch', 'Guard', 'outcome', 'reference')
+
+
+LITERALS = ('a', 'b', 'ab', 'news', '1')
+PLACEHOLDERS = (
+    '{x}', '{x:int}', '{x:int(min=1,max=20)}', '{x:slug}', '{x:path}',
+    '{x:any(a,ab)}', '{x:date}')
+VALUES = (
+    'a', 'b', 'ab', '1', '7', '20', '21', '007', 'a-b', '2012-10-01',
+    '2012-13-01', 'a/b', '')
+METHODS = ('GET', 'POST')
+REQUEST_METHODS = ('GET', 'POST', 'PUT')
+
+
+class Guard(object):
+    """ Guard with predictable behaviour used in generated route trees
+
+    :param kind:
+        ``'accept'`` -- does nothing, ``'reject'`` -- raises
+        ``403 Forbidden``, ``'param'`` -- rejects requests without ``key``
+        query param, ``'kwarg'`` -- puts ``key`` into ``trace.kwargs``,
+        ``'attr'`` -- sets ``key`` attribute on trace
+    """
+
+    kinds = ('accept', 'reject', 'param', 'kwarg', 'attr')
+
+    def __init__(self, kind, key='k'):
+        self.kind = kind
+        self.key = key
+
+    def __call__(self, request, trace):
+        if self.kind == 'reject':
+            raise HTTPForbidden()
+        if self.kind == 'param' and self.key not in request.GET:
+            raise HTTPForbidden()
+        if self.kind == 'kwarg':
+            trace.kwargs[self.key] = True
+        if self.kind == 'attr':
+            setattr(trace, self.key, True)
+
+    def __repr__(self):
+        return 'Guard(%r, %r)' % (self.kind, self.key)
+
+
+def reference(routes):
+    """ Reference engine -- matching with ``routes`` itself"""
+    return routes
+
+
+def outcome(match, request):
+    """ Match ``request`` with ``match`` and return comparable description of
+    result
+    """
+    try:
+        trace = match(request)
+    except RouteGuarded as e:
+        status = getattr(e.response, 'status', None)
+        return ('raise', type(e).__name__, type(e.reason).__name__, status)
+    except Exception as e:
+        return ('raise', type(e).__name__)
+    extra = dict(
+        (k, v) for k, v in trace.payload.items()
+        if k not in ('args', 'kwargs', 'routes'))
+    return (
+        'match', trace.args, trace.kwargs,
+        [id(r) for r in trace.routes], extra)
+
+
+# route trees are generated as specs which are cheap to copy while shrinking:
+# ('endpoint', target, method, pattern, guards) or
+# ('group', pattern, guards, children)
+
+def build(spec):
+    """ Build route tree from ``spec``"""
+    if spec[0] == 'endpoint':
+        _, target, method, pattern, guards = spec
+        return Endpoint(target, method, None, list(guards), pattern)
+    _, pattern, guards, children = spec
+    return RouteGroup([build(c) for c in children], list(guards), pattern)
+
+
+def render(spec, indent=0):
+    """ Render ``spec`` as :func:`routr.route` directive, it evaluates to the
+    same route tree as :func:`build` produces given names ``route``, ``GET``,
+    ``POST`` and ``Guard`` are in scope
+    """
+    pad = '    ' * indent
+    if spec[0] == 'endpoint':
+        _, target, method, pattern, guards = spec
+        args = [method]
+        if pattern is not None:
+            args.append(repr(pattern))
+        # guards are positional, keyword args of route() are annotations
+        args.extend(repr(g) for g in guards)
+        args.append(repr(target))
+        return '%sroute(%s)' % (pad, ', '.join(args))
+    _, pattern, guards, children = spec
+    head = [repr(pattern)] if pattern is not None else []
+    head.extend(repr(g) for g in guards)
+    head = ', '.join(head) + ',' if head else ''
+    body = ',\n'.join(render(c, indent + 1) for c in children)
+    return '%sroute(%s\n%s)' % (pad, head, body)
+
+
+def _size(spec):
+    if spec[0] == 'endpoint':
+        return 1
+    return 1 + sum(_size(c) for c in spec[3])
+
+
+class Generator(object):
+    """ Generator of random route trees and requests"""
+
+    def __init__(self, rng, depth=3, width=4):
+        self.rng = rng
+        self.depth = depth
+        self.width = width
+        self.counter = 0
+
+    def pattern(self, allow_none=True):
+        rng = self.rng
+        if allow_none and rng.random() < 0.2:
+            return None
+        parts = []
+        for _ in range(rng.randint(1, 2)):
+            if rng.random() < 0.4:
+                parts.append(rng.choice(PLACEHOLDERS))
+            else:
+                parts.append(rng.choice(LITERALS))
+        return '/' + '/'.join(parts)
+
+    def guards(self):
+        rng = self.rng
+        guards = []
+        while rng.random() < 0.25:
+            guards.append(Guard(rng.choice(Guard.kinds), rng.choice('kq')))
+        return guards
+
+    def routes(self, depth=None):
+        """ Generate spec of random route tree"""
+        depth = self.depth if depth is None else depth
+        children = []
+        for _ in range(self.rng.randint(1, self.width)):
+            if depth > 0 and self.rng.random() < 0.3:
+                children.append(self.routes(depth - 1))
+            else:
+                self.counter += 1
+                children.append((
+                    'endpoint', 't%d' % self.counter,
+                    self.rng.choice(METHODS), self.pattern(), self.guards()))
+        return ('group', self.pattern(), self.guards(), children)
+
+    def path(self, spec):
+        """ Generate path which probably matches some endpoint in ``spec``,
+        return path and the endpoint's method
+        """
+        rng = self.rng
+        if rng.random() < 0.2:
+            return '/' + '/'.join(
+                rng.choice(LITERALS + VALUES)
+                for _ in range(rng.randint(0, 4))), None
+        path = ''
+        while True:
+            pattern = spec[3] if spec[0] == 'endpoint' else spec[1]
+            if pattern:
+                for part in pattern.split('/')[1:]:
+                    if part.startswith('{'):
+                        part = rng.choice(VALUES)
+                    path += '/' + part
+            if spec[0] == 'endpoint':
+                break
+            spec = rng.choice(spec[3])
+        if rng.random() < 0.1:
+            path += '/'
+        return path or '/', spec[2]
+
+    def request(self, spec):
+        """ Generate request for route tree ``spec``"""
+        rng = self.rng
+        query = '&'.join(k for k in 'kq' if rng.random() < 0.5)
+        path, method = self.path(spec)
+        if method is None or rng.random() < 0.3:
+            method = rng.choice(REQUEST_METHODS)
+        return Request.blank(
+            path + ('?' + query if query else ''), method=method)
+
+
+class Mismatch(object):
+    """ Difference between reference and candidate engines
+
+    :attr spec:
+        spec of the smallest route tree found which reproduces difference
+    :attr request:
+        request which is matched differently
+    :attr expected:
+        outcome of reference engine
+    :attr actual:
+        outcome of candidate engine
+    """
+
+    def __init__(self, spec, request, expected, actual):
+        self.spec = spec
+        self.request = request
+        self.expected = expected
+        self.actual = actual
+
+    @property
+    def routes(self):
+        return build(self.spec)
+
+    @property
+    def size(self):
+        """ Number of routes in route tree"""
+        return _size(self.spec)
+
+    def __str__(self):
+        return '\n'.join([
+            'routes = %s' % render(self.spec).lstrip(),
+            'request: %s %s' % (self.request.method, self.request.path_qs),
+            'expected: %r' % (self.expected,),
+            'actual:   %r' % (self.actual,),
+        ])
+
+
+def _differs(spec, request, candidate, engine):
+    routes = build(spec)
+    try:
+        match = candidate(routes)
+    except Exception as e:
+        return ('raise', type(e).__name__), None
+    expected = _normalize(outcome(engine(routes), request), routes)
+    actual = _normalize(outcome(match, request), routes)
+    if expected != actual:
+        return expected, actual
+    return None
+
+
+def _normalize(result, routes):
+    # route ids differ between builds of the same spec, use positions instead
+    if result[0] != 'match':
+        return result
+    positions = {}
+
+    def walk(r, path):
+        positions[id(r)] = path
+        for n, sub in enumerate(getattr(r, 'routes', ())):
+            walk(sub, path + (n,))
+    walk(routes, ())
+    return result[:3] + ([positions.get(i) for i in result[3]],) + result[4:]
+
+
+def _smaller(spec):
+    """ Generate specs smaller than ``spec`` by one step"""
+    if spec[0] == 'endpoint':
+        _, target, method, pattern, guards = spec
+        for n in range(len(guards)):
+            yield spec[:4] + (guards[:n] + guards[n + 1:],)
+        return
+    _, pattern, guards, children = spec
+    for n in range(len(children)):
+        if len(children) > 1:
+            yield spec[:3] + (children[:n] + children[n + 1:],)
+        if children[n][0] == 'group':
+            # inline subgroup's children
+            yield spec[:3] + (
+                children[:n] + children[n][3] + children[n + 1:],)
+    for n in range(len(guards)):
+        yield (spec[0], pattern, guards[:n] + guards[n + 1:], children)
+    for n, child in enumerate(children):
+        for smaller in _smaller(child):
+            yield spec[:3] + (children[:n] + [smaller] + children[n + 1:],)
+
+
+def shrink(spec, request, candidate, engine=reference):
+    """ Return the smallest spec derived from ``spec`` which still reproduces
+    difference between engines on ``request``
+    """
+    changed = True
+    while changed:
+        changed = False
+        for smaller in _smaller(spec):
+            if _differs(smaller, request, candidate, engine):
+                spec = smaller
+                changed = True
+                break
+    return spec
+
+
+def fuzz(candidate, iterations=500, requests=10, seed=0, engine=reference,
+         depth=3, width=4):
+    """ Compare ``candidate`` engine against ``engine`` on random route trees
+
+    :param candidate:
+        function which accepts route tree and returns callable matching
+        requests against it
+    :param iterations:
+        number of route trees to generate
+    :param requests:
+        number of requests to match against each route tree
+    :param seed:
+        seed for random generator, runs with the same seed are identical
+    :param engine:
+        reference engine, matching with route tree itself by default
+    :return:
+        :class:`.Mismatch` for the smallest found difference or ``None``
+    """
+    for iteration in range(iterations):
+        generator = Generator(
+            random.Random('%s:%d' % (seed, iteration)), depth, width)
+        spec = generator.routes()
+        for _ in range(requests):
+            request = generator.request(spec)
+            if _differs(spec, request, candidate, engine):
+                spec = shrink(spec, request, candidate, engine)
+                expected, actual = _differs(
+                    spec, request, candidate, engine)
+                return Mismatch(spec, request, expected, actual)
+    return None
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m routr.fuzz',
+        description='compare matching engine against RouteGroup.match')
+    parser.add_argument(
+        'engine', help='import path of engine, like routr.codegen:'
+                       'compile_matcher')
+    parser.add_argument('-n', '--iterations', type=int, default=500)
+    parser.add_argument('-s', '--seed', default='0')
+    args = parser.parse_args(argv)
+    mismatch = fuzz(
+        import_string(args.engine), iterations=args.iterations,
+        seed=args.seed)
+    if mismatch is None:
+        print('no differences found in %d route trees' % args.iterations)
+        return 0
+    print(mismatch)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
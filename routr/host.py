@@ -0,0 +1,258 @@
+"""
+
+    routr.host -- host and subdomain dispatch
+    =========================================
+
+    This module provides routes which match against request's ``Host`` header
+    before any path matching is done::
+
+        from routr import route
+        from routr.host import hosts, host
+
+        routes = hosts(
+            host('example.com',          route('/', index)),
+            host('{tenant}.example.com', route('/', tenant_index)),
+            )
+
+    Exact hosts are resolved through a dict, wildcard patterns of form
+    ``{label}.example.com`` are resolved through a dict keyed by the host's
+    suffix. Values captured by wildcard patterns are prepended to
+    ``trace.args``.
+
+"""
+
+from routr import Route, RouteGroup, Trace, route
+from routr.urlpattern import URLPattern, Converter, parse_args
+from routr.utils import cached_property
+from routr.exc import (
+    NoURLPatternMatched, RouteConfigurationError, InvalidRoutePattern)
+
+
+__all__ = ('hosts', 'host', 'HostGroup', 'HostRoute', 'HostPattern')
+
+
+def handle_label(args):
+    args, kwargs = parse_args(args)
+    if kwargs or args:
+        raise InvalidRoutePattern("invalid args for 'str' type")
+    return Converter('[^.]+')
+
+
+class HostPattern(URLPattern):
+    """ Pattern for matching hosts
+
+    Same as :class:`routr.urlpattern.URLPattern` but ``str`` placeholders
+    match a single host label, i.e. they don't match ``.``.
+    """
+
+    typemap = {
+        None:     handle_label,
+        'str':    handle_label,
+        'string': handle_label,
+    }
+
+    def match_host(self, host):
+        """ Match entire ``host`` against pattern and return captured args"""
+        if self.is_exact:
+            if host != self.pattern:
+                raise NoURLPatternMatched(host)
+            return ()
+        remaining, args = self.match(host)
+        if remaining:
+            raise NoURLPatternMatched(host)
+        return args
+
+    @cached_property
+    def suffix(self):
+        """ Exact suffix which follows pattern's first label if the first label
+        consists of a single placeholder, ``None`` otherwise
+        """
+        if self.is_exact or '.' not in self.pattern:
+            return None
+        label, suffix = self.pattern.split('.', 1)
+        m = self._type_re.match(label)
+        if not m or m.end() != len(label) or m.group('type') == 'path':
+            return None
+        if self._type_re.search(suffix):
+            return None
+        return '.' + suffix
+
+
+def request_host(request):
+    """ Return normalized host of ``request`` without port"""
+    host = request.host.lower()
+    if host.startswith('['):
+        host = host[:host.find(']') + 1]
+    elif ':' in host:
+        host = host.split(':', 1)[0]
+    return host.rstrip('.')
+
+
+class HostRoute(RouteGroup):
+    """ Route group which matches only requests to specified host
+
+    Additional to :class:`routr.RouteGroup` params are:
+
+    :param host:
+        host pattern, can contain placeholders like
+        ``{tenant}.example.com``
+    """
+
+    def __init__(self, host, routes, guards, pattern, url_pattern_cls=None,
+                 **annotations):
+        super(HostRoute, self).__init__(
+            routes, guards, pattern,
+            url_pattern_cls=url_pattern_cls, **annotations)
+        self.host = host.lower()
+
+    @cached_property
+    def host_pattern(self):
+        """ Compiled host pattern"""
+        return HostPattern(self.host)
+
+    def match_with_host(self, host_args, path_info, request):
+        """ Match ``request`` against routes assuming host was already matched
+        and produced ``host_args``
+        """
+        trace = super(HostRoute, self).match(path_info, request)
+        if host_args:
+            trace = Trace(host_args, {}, []) + trace
+        return trace
+
+    def match_segments_with_host(self, host_args, segments, pos, request):
+        """ Same as :meth:`match_with_host` but matches path split into
+        ``segments``
+        """
+        trace = RouteGroup.match_segments(self, segments, pos, request)
+        if host_args:
+            trace = Trace(host_args, {}, []) + trace
+        return trace
+
+    def match(self, path_info, request):
+        host_args = self.host_pattern.match_host(request_host(request))
+        return self.match_with_host(host_args, path_info, request)
+
+    def match_segments(self, segments, pos, request):
+        host_args = self.host_pattern.match_host(request_host(request))
+        return self.match_segments_with_host(
+            host_args, segments, pos, request)
+
+    def __repr__(self):
+        return '%s(host=%r, routes=%r, guards=%r, pattern=%r)' % (
+            self.__class__.__name__, self.host, self.routes, self.guards,
+            self.pattern)
+
+    __str__ = __repr__
+
+
+class HostGroup(RouteGroup):
+    """ Group of :class:`.HostRoute` routes with constant time host lookup
+
+    Host resolution happens before any path matching and selects exactly one
+    host route, exact hosts take precedence over wildcard ones, wildcard
+    hosts are tried in order of declaration.
+    """
+
+    def _hosts(self):
+        exact = {}
+        suffixes = {}
+        wildcards = []
+        for n, r in enumerate(self.routes):
+            p = r.host_pattern
+            if p.is_exact:
+                exact.setdefault(p.pattern, r)
+            elif p.suffix is not None:
+                suffixes.setdefault(p.suffix, []).append((n, r))
+            else:
+                wildcards.append((n, r))
+        return exact, suffixes, wildcards
+
+    def resolve_host(self, host):
+        """ Return host route which matches ``host`` along with captured
+        arguments
+
+        :raises routr.exc.NoURLPatternMatched:
+            if no host route matches ``host``
+        """
+        exact, suffixes, wildcards = self._fresh(
+            '_cached_host_index', self._hosts)
+        r = exact.get(host)
+        if r is not None:
+            return r, ()
+        candidates = wildcards
+        if '.' in host:
+            bucket = suffixes.get('.' + host.split('.', 1)[1])
+            if bucket and wildcards:
+                candidates = sorted(bucket + wildcards)
+            elif bucket:
+                candidates = bucket
+        for _, r in candidates:
+            try:
+                return r, r.host_pattern.match_host(host)
+            except NoURLPatternMatched:
+                continue
+        raise NoURLPatternMatched(host)
+
+    def _match_host(self, args, request, match):
+        r, host_args = self.resolve_host(request_host(request))
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        return self.match_routes(trace, [r], lambda r: match(r, host_args))
+
+    def match(self, path_info, request):
+        path_info, args = self.match_pattern(path_info)
+        return self._match_host(
+            args, request,
+            lambda r, host_args: r.match_with_host(
+                host_args, path_info, request))
+
+    def match_segments(self, segments, pos, request):
+        if self.pattern is not None:
+            pos, args = self.pattern.match_segments(segments, pos)
+        else:
+            args = ()
+        return self._match_host(
+            args, request,
+            lambda r, host_args: r.match_segments_with_host(
+                host_args, segments, pos, request))
+
+
+def host(pattern, *args, **kwargs):
+    """ Directive for configuring routes which match only requests to hosts
+    which match ``pattern``
+
+    :param pattern:
+        host pattern, for example ``example.com`` or ``{tenant}.example.com``
+    :param args:
+        same as for :func:`routr.route`
+    :param kwargs:
+        same as for :func:`routr.route`
+    """
+    r = route(*args, **kwargs)
+    if type(r) is RouteGroup:
+        return HostRoute(
+            pattern, r.routes, r.guards, r._pattern,
+            url_pattern_cls=r.url_pattern_cls, **r.annotations)
+    return HostRoute(pattern, [r], [], None)
+
+
+def hosts(*args, **annotations):
+    """ Directive for grouping :func:`.host` routes
+
+    :param args:
+        ([*guards,] *routes) where routes are produced by :func:`.host`
+    :param annotations:
+        annotations for the group
+    """
+    args = list(args)
+    guards = []
+    while (args and not isinstance(args[0], Route)
+           and hasattr(args[0], '__call__')):
+        guards.append(args.pop(0))
+    if not args:
+        raise RouteConfigurationError('empty routes')
+    for r in args:
+        if not isinstance(r, HostRoute):
+            raise RouteConfigurationError(
+                "'hosts' directive accepts only routes defined by 'host'")
+    return HostGroup(args, guards, None, **annotations)
@@ -0,0 +1,255 @@
+"""
+
+    routr.limits -- per-route concurrency limits
+    ============================================
+
+    Routes annotated with ``concurrency`` annotation have number of requests
+    processed at the same time limited by :class:`routr.dispatch.Dispatcher`
+    (and :class:`routr.aio.AsyncDispatcher`)::
+
+        from routr import route, GET
+        from routr.limits import ConcurrencyPolicy
+
+        routes = route(
+            route(GET, '/reports/export', export, concurrency=2),
+            route(GET, '/search', search,
+                  concurrency=ConcurrencyPolicy(8, max_queue=16, timeout=2)),
+            )
+
+    Requests over the limit wait in a queue and are admitted in order of
+    arrival, requests which don't fit into queue or wait longer than
+    ``timeout`` are rejected with ``503 Service Unavailable`` response with
+    ``Retry-After`` header, so slow routes can't take all workers from others.
+    Annotation on route group limits all its routes together, ``False`` or
+    ``None`` disables limit.
+
+    Live numbers of in-flight, queued, admitted and rejected requests per route
+    are available through ``dispatcher.limiter.snapshot()``.
+
+"""
+
+import time
+import numbers
+import threading
+from collections import deque
+
+from routr.exc import RouteConfigurationError
+
+
+__all__ = ('ConcurrencyPolicy', 'Gauge', 'Limiter')
+
+
+class ConcurrencyPolicy(object):
+    """ Concurrency limit for a route
+
+    :param max_concurrency:
+        maximum number of requests processed at the same time
+    :param max_queue:
+        maximum number of requests waiting for processing
+    :param timeout:
+        maximum number of seconds request waits in queue, ``None`` to wait
+        until processed
+    :param retry_after:
+        value of ``Retry-After`` header of rejection responses
+    """
+
+    def __init__(self, max_concurrency, max_queue=0, timeout=None,
+                 retry_after=1):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+    @classmethod
+    def coerce(cls, value):
+        """ Make policy out of annotation ``value`` which can be a policy
+        itself, maximum number of concurrent requests or a dict of policy
+        params, ``None`` is returned for ``False`` or ``None`` which disable
+        limit
+        """
+        if value is None or value is False:
+            return None
+        if isinstance(value, cls):
+            policy = value
+        elif isinstance(value, dict):
+            policy = cls(**value)
+        elif isinstance(value, numbers.Integral) and value is not True:
+            policy = cls(value)
+        else:
+            raise RouteConfigurationError(
+                'invalid concurrency annotation %r' % (value,))
+        limit = policy.max_concurrency
+        if (not isinstance(limit, numbers.Integral) or isinstance(limit, bool)
+                or limit < 1):
+            raise RouteConfigurationError(
+                'concurrency limit should be a positive int, got %r'
+                % (limit,))
+        return policy
+
+
+class Gauge(object):
+    """ Live numbers of requests for a limited route
+
+    :attr route:
+        route annotated with ``concurrency`` annotation
+    :attr policy:
+        :class:`.ConcurrencyPolicy` of route
+    :attr in_flight:
+        number of requests being processed
+    :attr queued:
+        number of requests waiting in queue
+    :attr admitted:
+        total number of processed requests
+    :attr rejected:
+        total number of rejected requests
+    """
+
+    def __init__(self, route, policy, lock=None):
+        self.route = route
+        self.policy = policy
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.condition = threading.Condition(lock)
+        # requests waiting in queue, oldest first, release() hands slot over
+        # to the oldest one (futures are used by routr.aio.AsyncLimiter)
+        self.waiters = deque()
+
+    def as_dict(self):
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'max_concurrency': self.policy.max_concurrency,
+            'max_queue': self.policy.max_queue,
+        }
+
+
+def _owner(trace):
+    # the outermost route which has annotation, its value wins
+    for route in trace.routes:
+        if 'concurrency' in route.annotations:
+            return route
+    return trace.endpoint
+
+
+class Limiter(object):
+    """ Concurrency limits for threaded WSGI servers
+
+    :param clock:
+        function which returns current time in seconds
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def gauge(self, trace, policy):
+        """ Return :class:`.Gauge` for route limited by ``policy`` annotation
+        value in ``trace`` or ``None`` if annotation disables limit
+        """
+        route = _owner(trace)
+        try:
+            gauge = self.gauges[route]
+        except KeyError:
+            policy = ConcurrencyPolicy.coerce(policy)
+            if policy is None:
+                return None
+            with self._lock:
+                gauge = self.gauges.get(route)
+                if gauge is None:
+                    gauge = self.gauges[route] = self.create_gauge(
+                        route, policy)
+        return gauge
+
+    def create_gauge(self, route, policy):
+        return Gauge(route, policy, self._lock)
+
+    def acquire(self, gauge):
+        """ Wait for a free slot and return ``True`` or ``False`` if request
+        should be rejected
+        """
+        policy = gauge.policy
+        with gauge.condition:
+            if (gauge.in_flight < policy.max_concurrency
+                    and not gauge.waiters):
+                gauge.in_flight += 1
+                gauge.admitted += 1
+                return True
+            if len(gauge.waiters) >= policy.max_queue:
+                gauge.rejected += 1
+                return False
+            # slot is handed over by release() without decrementing in_flight
+            waiter = [False]
+            gauge.waiters.append(waiter)
+            gauge.queued += 1
+            deadline = (
+                self.clock() + policy.timeout
+                if policy.timeout is not None else None)
+            try:
+                while not waiter[0]:
+                    if deadline is None:
+                        gauge.condition.wait()
+                        continue
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        gauge.waiters.remove(waiter)
+                        gauge.rejected += 1
+                        return False
+                    gauge.condition.wait(remaining)
+            except BaseException:
+                if waiter[0]:
+                    self._hand_over(gauge)
+                else:
+                    gauge.waiters.remove(waiter)
+                raise
+            finally:
+                gauge.queued -= 1
+            gauge.admitted += 1
+            return True
+
+    def _hand_over(self, gauge):
+        # called with gauge.condition held
+        if gauge.waiters:
+            gauge.waiters.popleft()[0] = True
+            gauge.condition.notify_all()
+        else:
+            gauge.in_flight -= 1
+
+    def release(self, gauge):
+        """ Free slot taken by :meth:`acquire`, it goes to the oldest request
+        waiting in queue if any
+        """
+        with gauge.condition:
+            self._hand_over(gauge)
+
+    def reject(self, gauge):
+        """ Return ``503 Service Unavailable`` response"""
+        from webob.exc import HTTPServiceUnavailable
+        response = HTTPServiceUnavailable()
+        response.retry_after = gauge.policy.retry_after
+        return response
+
+    def handle(self, request, trace, policy, call):
+        """ Produce response with ``call(request, trace)`` if route isn't
+        over its limit, reject request otherwise
+        """
+        gauge = self.gauge(trace, policy)
+        if gauge is None:
+            return call(request, trace)
+        if not self.acquire(gauge):
+            return self.reject(gauge)
+        try:
+            return call(request, trace)
+        finally:
+            self.release(gauge)
+
+    def snapshot(self):
+        """ Return numbers of all gauges keyed by route descriptions"""
+        from routr.explain import describe
+        return dict(
+            (describe(gauge.route), gauge.as_dict())
+            for gauge in list(self.gauges.values()))
@@ -0,0 +1,399 @@
+"""
+
+    routr.loadtest -- end-to-end load harness
+    =========================================
+
+    Benchmarks of ``match`` alone don't show the whole cost of serving a
+    request -- request construction, guards, injection of arguments into
+    targets and serving static files. This module generates routr application
+    and drives it with concurrent clients over a configurable mix of URLs::
+
+        from routr.loadtest import run
+
+        report = run(requests=2000, concurrency=8,
+                     mix={'dynamic': 70, 'static': 10,
+                          'notfound': 10, 'notallowed': 10})
+        print(report)
+
+    or from command line::
+
+        % python -m routr.loadtest -n 2000 -c 8 --mix dynamic=70,static=30
+
+    Application is served by ``wsgiref`` server on a local socket (or called
+    directly with ``--in-process``), everything runs offline. Report contains
+    throughput, latency percentiles overall and per kind of URL, response
+    statuses and CPU time of the process per request -- the latter includes
+    CPU time of clients which run in the same process.
+
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import threading
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from six.moves import socketserver, http_client
+from webob import Request, Response
+
+from routr import route, GET, POST
+from routr.schema import qs, opt, Int
+from routr.static import static
+from routr.dispatch import Dispatcher
+from routr.utils import percentile, timer
+
+
+__all__ = ('run', 'application', 'generate', 'Report', 'KINDS')
+
+cpu_timer = getattr(time, 'process_time', None) or time.clock
+
+# kinds of URLs in mix with status application responds with
+KINDS = {
+    'dynamic': 200,
+    'static': 200,
+    'notfound': 404,
+    'notallowed': 405,
+}
+
+DEFAULT_MIX = {'dynamic': 70, 'static': 10, 'notfound': 10, 'notallowed': 10}
+
+ASSET = 'asset.css'
+
+
+def index():
+    return Response('index')
+
+
+def item(id):
+    return Response('item %d' % id)
+
+
+def create_item(request):
+    return Response('created', status=201)
+
+
+def user_post(request, name, n, page=1):
+    return Response('%s %d %d %s' % (name, n, page, request.method))
+
+
+def application(directory):
+    """ Return :class:`routr.dispatch.Dispatcher` with routes of different
+    kinds, static files are served from ``directory``
+    """
+    return Dispatcher(route(
+        route(GET, '/', index),
+        route('/items',
+              route(GET, '/{id:int}', item),
+              route(POST, '/', create_item)),
+        route(GET, '/users/{name}/posts/{n:int}', qs(page=opt(Int, 1)),
+              user_post),
+        static('/static', directory),
+    ))
+
+
+def generate(mix, count, seed=0):
+    """ Return ``count`` requests for application as ``(kind, method, url)``
+    tuples, kinds are chosen according to weights in ``mix``
+    """
+    rnd = random.Random(seed)
+    kinds = sorted(k for k in mix if mix[k] > 0)
+    for kind in kinds:
+        if kind not in KINDS:
+            raise ValueError("unknown kind of URL '%s'" % kind)
+    if not kinds:
+        raise ValueError('mix is empty')
+    weights = [mix[k] for k in kinds]
+    total = float(sum(weights))
+    generated = []
+    for _ in range(count):
+        x = rnd.random() * total
+        for kind, weight in zip(kinds, weights):
+            x -= weight
+            if x < 0:
+                break
+        n = rnd.randint(1, 1000)
+        if kind == 'dynamic':
+            url = rnd.choice((
+                '/', '/items/%d' % n,
+                '/users/u%d/posts/%d?page=%d' % (n, n % 7, n % 3 + 1)))
+            generated.append((kind, 'GET', url))
+        elif kind == 'static':
+            generated.append((kind, 'GET', '/static/' + ASSET))
+        elif kind == 'notfound':
+            generated.append((kind, 'GET', '/missing/%d' % n))
+        else:
+            generated.append((kind, 'DELETE', '/items/%d' % n))
+    return generated
+
+
+def _ms(value):
+    if value is None:
+        return '%10s' % '-'
+    return '%8.3fms' % (value * 1000)
+
+
+class Report(object):
+    """ Results of load test
+
+    :attr requests:
+        number of requests made
+    :attr elapsed:
+        wall clock time of the test in seconds
+    :attr cpu:
+        CPU time of the process spent during the test in seconds
+    :attr latencies:
+        dict of sorted lists of latencies in seconds keyed by kind of URL
+    :attr statuses:
+        dict of numbers of responses keyed by status code, ``None`` for
+        requests which failed without response
+    :attr unexpected:
+        number of responses with status other than expected for their kind
+    """
+
+    def __init__(self, requests, elapsed, cpu, latencies, statuses,
+                 unexpected):
+        self.requests = requests
+        self.elapsed = elapsed
+        self.cpu = cpu
+        self.latencies = latencies
+        self.statuses = statuses
+        self.unexpected = unexpected
+
+    @property
+    def throughput(self):
+        """ Requests per second"""
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cpu_per_request(self):
+        return self.cpu / self.requests if self.requests else 0.0
+
+    def percentile(self, p, kind=None):
+        """ Return ``p``-th percentile of latency for ``kind`` of URLs or
+        for all requests
+        """
+        if kind is not None:
+            return percentile(self.latencies.get(kind, []), p)
+        return percentile(
+            sorted(v for vs in self.latencies.values() for v in vs), p)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput,
+            'cpu_per_request': self.cpu_per_request,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'kinds': dict(
+                (kind, {
+                    'requests': len(values),
+                    'p50': percentile(values, 50),
+                    'p99': percentile(values, 99)})
+                for kind, values in self.latencies.items()),
+            'statuses': dict(
+                (str(status), n) for status, n in self.statuses.items()),
+            'unexpected': self.unexpected,
+        }
+
+    def __str__(self):
+        ms = _ms
+        lines = [
+            'requests:     %d in %.3fs' % (self.requests, self.elapsed),
+            'throughput:   %.1f req/s' % self.throughput,
+            'cpu/request:  %.1fus' % (self.cpu_per_request * 1000000),
+            'latency:      p50 %s  p99 %s' % (
+                ms(self.percentile(50)), ms(self.percentile(99))),
+        ]
+        for kind in sorted(self.latencies):
+            values = self.latencies[kind]
+            lines.append('  %-10s  p50 %s  p99 %s  (%d)' % (
+                kind, ms(percentile(values, 50)), ms(percentile(values, 99)),
+                len(values)))
+        lines.append('statuses:     %s' % ', '.join(
+            '%s: %d' % (status, n) for status, n in sorted(
+                self.statuses.items(), key=lambda item: str(item[0]))))
+        lines.append('unexpected:   %d' % self.unexpected)
+        return '\n'.join(lines)
+
+
+class _Handler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(app, host='127.0.0.1', port=0):
+    """ Serve ``app`` with threaded ``wsgiref`` server in background thread
+    and return server, call ``server.shutdown()`` to stop it
+    """
+    server = _Server((host, port), _Handler)
+    server.set_app(app)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _socket_client(server):
+    host, port = server.server_address[:2]
+
+    def send(method, url):
+        conn = http_client.HTTPConnection(host, port)
+        try:
+            conn.request(method, url)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    return send
+
+
+def _in_process_client(app):
+    environs = {}
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split(' ', 1)[0]))
+
+    def send(method, url):
+        key = (method, url)
+        if key not in environs:
+            environs[key] = Request.blank(url, method=method).environ
+        environ = dict(environs[key])
+        result = app(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return statuses.pop()
+
+    return send
+
+
+def _drive(send, requests, results):
+    for kind, method, url in requests:
+        start = timer()
+        try:
+            status = send(method, url)
+        except Exception:
+            status = None
+        results.append((kind, status, timer() - start))
+
+
+def run(app=None, mix=None, requests=1000, concurrency=4, in_process=False,
+        seed=0):
+    """ Run load test and return :class:`.Report`
+
+    :param app:
+        application to test, generated with :func:`application` if not
+        supplied, it should serve URLs produced by :func:`generate`
+    :param mix:
+        dict of weights of URL kinds -- ``'dynamic'``, ``'static'``,
+        ``'notfound'`` and ``'notallowed'``
+    :param requests:
+        total number of requests
+    :param concurrency:
+        number of concurrent clients
+    :param in_process:
+        call application directly instead of through local socket
+    """
+    directory = None
+    if app is None:
+        directory = tempfile.mkdtemp(prefix='routr-loadtest-')
+        with open(os.path.join(directory, ASSET), 'w') as f:
+            f.write('body { color: black; }\n' * 40)
+        app = application(directory)
+    generated = generate(mix or DEFAULT_MIX, requests, seed=seed)
+    server = None
+    try:
+        if not in_process:
+            server = serve(app)
+        results = [[] for _ in range(concurrency)]
+        clients = []
+        for n in range(concurrency):
+            send = (
+                _in_process_client(app) if in_process else
+                _socket_client(server))
+            clients.append(threading.Thread(
+                target=_drive,
+                args=(send, generated[n::concurrency], results[n])))
+        cpu = cpu_timer()
+        start = timer()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = timer() - start
+        cpu = cpu_timer() - cpu
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+    latencies = {}
+    statuses = {}
+    unexpected = 0
+    for kind, status, latency in (r for rs in results for r in rs):
+        latencies.setdefault(kind, []).append(latency)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status != KINDS[kind]:
+            unexpected += 1
+    for values in latencies.values():
+        values.sort()
+    return Report(
+        len(generated), elapsed, cpu, latencies, statuses, unexpected)
+
+
+def parse_mix(value):
+    """ Parse mix like ``dynamic=70,static=30`` into a dict"""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        mix[kind.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def main(argv=None):
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m routr.loadtest',
+        description='load test generated routr application')
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument(
+        '-m', '--mix', type=parse_mix, default=DEFAULT_MIX,
+        help='weights of URL kinds, like dynamic=70,static=10,notfound=10,'
+             'notallowed=10')
+    parser.add_argument(
+        '--in-process', action='store_true',
+        help='call application directly instead of through local socket')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    report = run(
+        mix=args.mix, requests=args.requests, concurrency=args.concurrency,
+        in_process=args.in_process, seed=args.seed)
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=2, sort_keys=True))
+    else:
+        print(report)
+    return 1 if report.unexpected else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+
+    routr.mount -- mounting WSGI applications
+    =========================================
+
+    This module provides :func:`mount` directive which mounts WSGI application
+    on URL prefix::
+
+        from routr import route
+        from routr.mount import mount
+        from routr.dispatch import Dispatcher
+
+        application = Dispatcher(route(
+            mount('/legacy', legacy_app),
+            route('/news', news),
+            ))
+
+    Mounted application is called with prefix moved from ``PATH_INFO`` to
+    ``SCRIPT_NAME``. Prefix matches whole path segments only, so
+    ``/legacy`` matches ``/legacy`` and ``/legacy/page`` but not
+    ``/legacypage``.
+
+    Unguarded mounts at the top level of routes are resolved by
+    :class:`routr.dispatch.Dispatcher` through a dict keyed by the first path
+    segment before request is even constructed -- ``environ`` is adjusted in
+    place and application is called directly. Mounts which can't be resolved
+    that way (guarded, annotated, nested into groups or shadowed by preceding
+    routes) are matched as usual routes, so annotations like ``concurrency``
+    or ``cache`` are honoured for them.
+
+"""
+
+import six
+
+from routr import Route, Endpoint, RouteGroup, Trace
+from routr.exc import (
+    NoURLPatternMatched, RouteReversalError, RouteConfigurationError)
+
+
+__all__ = ('mount', 'Mount', 'MountIndex')
+
+
+class Mount(Route):
+    """ Route which matches paths under ``prefix`` and delegates them to
+    WSGI application
+
+    Additional to :class:`routr.Route` params are:
+
+    :param app:
+        WSGI application
+    :param prefix:
+        URL prefix
+    """
+
+    # mounts aren't named, but can be seen by code which looks routes up by
+    # name, like routr.cache.ResponseCache.invalidate
+    name = None
+
+    def __init__(self, app, prefix, guards, **annotations):
+        prefix = '/' + prefix.strip('/')
+        if prefix == '/':
+            raise RouteConfigurationError(
+                'mount prefix should contain at least one path segment')
+        super(Mount, self).__init__(guards, None, **annotations)
+        self.app = app
+        self.target = app
+        self.prefix = prefix
+        self.segment = prefix[1:].split('/', 1)[0]
+        self.raw_prefix = (
+            prefix.encode('utf-8').decode('latin-1') if six.PY3 else prefix)
+
+    def split(self, path_info, prefix=None):
+        """ Return part of ``path_info`` after prefix or ``None`` if it
+        doesn't start with prefix
+        """
+        prefix = prefix or self.prefix
+        if not path_info.startswith(prefix):
+            return None
+        rest = path_info[len(prefix):]
+        if rest and rest[0] != '/':
+            return None
+        return rest
+
+    def match(self, path_info, request):
+        rest = self.split(
+            path_info, self.raw_prefix if self.raw_path else None)
+        if rest is None:
+            raise NoURLPatternMatched()
+        trace = Trace((), {}, [self])
+        trace = self.match_guards(request, trace)
+        trace.mount_path_info = rest
+        return trace
+
+    def respond(self, request, trace):
+        """ Call application with ``request`` matched with ``trace``"""
+        rest = trace.mount_path_info
+        if self.raw_path:
+            environ = request.environ
+            path_info = environ.get('PATH_INFO', '')
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + (
+                path_info[:len(path_info) - len(rest)])
+            environ['PATH_INFO'] = rest
+        else:
+            path_info = request.path_info
+            request.script_name += path_info[:len(path_info) - len(rest)]
+            request.path_info = rest
+        return request.get_response(self.app)
+
+    def reverse(self, name, *args, **kwargs):
+        raise RouteReversalError("no route with name '%s'" % name)
+
+    def reverse_for(self, target, *args, **kwargs):
+        raise RouteReversalError("no route with target %r" % (target,))
+
+    def __iter__(self):
+        return iter([self])
+
+    def __repr__(self):
+        return '%s(app=%r, prefix=%r, guards=%r)' % (
+            self.__class__.__name__, self.app, self.prefix, self.guards)
+
+    __str__ = __repr__
+
+
+def mount(prefix, *args, **annotations):
+    """ Directive for mounting WSGI application on URL ``prefix``
+
+    :param args:
+        ([*guards,] app)
+    :param annotations:
+        annotations for the route
+    """
+    if not args:
+        raise RouteConfigurationError("mount of '%s' lacks app" % prefix)
+    args = list(args)
+    app = args.pop()
+    return Mount(app, prefix, args, **annotations)
+
+
+def _first_segment(route):
+    """ Return ``(text, exact)`` describing first path segments ``route`` can
+    match -- a segment itself if ``exact`` is true or its prefix otherwise,
+    ``text`` is ``None`` if route can match any path
+    """
+    from routr.codegen import compilable
+    if isinstance(route, Mount):
+        return route.segment, True
+    if not compilable(route):
+        return None, False
+    pattern = route.pattern
+    if pattern is None:
+        return ('', True) if isinstance(route, Endpoint) else (None, False)
+    text = pattern.pattern
+    if not pattern.is_exact:
+        text = text[:pattern._type_re.search(text).start()]
+    end = text.find('/', 1)
+    if end != -1:
+        return text[1:end], True
+    # endpoints with exact patterns match whole path
+    return text[1:], isinstance(route, Endpoint) and pattern.is_exact
+
+
+class MountIndex(object):
+    """ Index of mounts which can be resolved by first path segment"""
+
+    def __init__(self, mounts, max_path_length=None):
+        self.max_path_length = max_path_length
+        self.index = {}
+        for m in mounts:
+            segment = m.raw_prefix[1:].split('/', 1)[0]
+            self.index.setdefault(segment, []).append(m)
+
+    def __len__(self):
+        return sum(len(ms) for ms in self.index.values())
+
+    @classmethod
+    def from_routes(cls, routes):
+        """ Build index of mounts among top-level ``routes`` which are
+        matched before any other route can match the same paths
+        """
+        if isinstance(routes, Mount):
+            candidates = [routes]
+        elif (type(routes) is RouteGroup and not routes.guards
+                and not routes.annotations and routes.pattern is None):
+            candidates = routes.routes
+        else:
+            return cls([], routes.max_path_length)
+        segments = set()    # first segments preceding routes match
+        prefixes = []       # prefixes of first segments they can match
+        mounts = []
+        for r in candidates:
+            # annotations are honoured only when dispatching matched trace
+            if (isinstance(r, Mount) and not r.guards and not r.annotations
+                    and r.segment not in segments
+                    and not any(r.segment.startswith(p) for p in prefixes)):
+                mounts.append(r)
+                continue
+            text, exact = _first_segment(r)
+            if text is None:
+                break
+            if exact:
+                segments.add(text)
+            else:
+                prefixes.append(text)
+        return cls(mounts, routes.max_path_length)
+
+    def resolve(self, environ):
+        """ Return mount which matches ``environ`` adjusting its
+        ``SCRIPT_NAME`` and ``PATH_INFO`` in place or ``None``
+        """
+        path_info = environ.get('PATH_INFO', '')
+        end = path_info.find('/', 1)
+        mounts = self.index.get(
+            path_info[1:end] if end != -1 else path_info[1:])
+        if mounts is None:
+            return None
+        if (self.max_path_length is not None
+                and len(path_info) > self.max_path_length):
+            return None
+        for m in mounts:
+            rest = m.split(path_info, m.raw_prefix)
+            if rest is not None:
+                environ['SCRIPT_NAME'] = (
+                    environ.get('SCRIPT_NAME', '') + m.raw_prefix)
+                environ['PATH_INFO'] = rest
+                return m
+        return None
@@ -0,0 +1,242 @@
+"""
+
+    routr.negotiation -- content negotiation
+    ========================================
+
+    This module provides :func:`variants` directive which groups endpoints
+    serving different representations of the same resource::
+
+        from routr import route, GET
+        from routr.negotiation import variants
+
+        routes = variants("/report",
+            route(GET, report_json, produces='application/json'),
+            route(GET, report_html, produces='text/html'),
+            route(GET, report_csv,  produces='text/csv'),
+            )
+
+    Endpoints are grouped by pattern and method, for each request ``Accept``
+    and ``Content-Type`` headers are parsed once and the best variant is
+    selected by quality through a precomputed media type index instead of
+    trying endpoints with guards one by one. Selected media type is available
+    as ``trace.media_type``.
+
+"""
+
+from webob.exc import (
+    HTTPException, HTTPNotAcceptable, HTTPUnsupportedMediaType)
+from routr import Endpoint, RouteGroup, Trace, route
+from routr.exc import (
+    NoURLPatternMatched, MethodNotAllowed, RouteGuarded, PathTooLong,
+    RouteConfigurationError)
+
+
+__all__ = ('variants', 'VariantGroup', 'parse_accept')
+
+
+def parse_accept(header):
+    """ Parse ``Accept`` header into a list of ``(media_range, q)`` tuples
+
+        >>> parse_accept('text/html, application/json;q=0.5')
+        [('text/html', 1.0), ('application/json', 0.5)]
+
+    """
+    result = []
+    for item in header.split(','):
+        params = item.split(';')
+        media = params[0].strip().lower()
+        if not media:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            k, _, v = param.partition('=')
+            if k.strip() == 'q':
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        result.append((media, q))
+    return result
+
+
+def request_accept(request):
+    """ Return parsed ``Accept`` header of ``request`` or ``None`` if it's
+    absent, result is cached in request's environ
+    """
+    environ = request.environ
+    header = environ.get('HTTP_ACCEPT')
+    if header is None:
+        return None
+    cached = environ.get('routr.accept')
+    if cached is not None and cached[0] == header:
+        return cached[1]
+    accept = parse_accept(header)
+    environ['routr.accept'] = (header, accept)
+    return accept
+
+
+def _media_types(value):
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(v.lower() for v in value)
+    return (value.lower(),)
+
+
+class Variants(object):
+    """ Endpoints sharing the same pattern and method along with index of media
+    types they produce and consume
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.routes = []
+        self.offers = []
+        self.types = {}
+        self.majors = {}
+        self.default = None
+        self.consumes = {}
+        self.consumes_any = []
+
+    def add(self, r):
+        self.routes.append(r)
+        produces = _media_types(r.annotations.get('produces'))
+        if not produces and self.default is None:
+            self.default = r
+        for media in produces:
+            if media in self.types:
+                continue
+            self.types[media] = len(self.offers)
+            self.majors.setdefault(media.split('/', 1)[0], []).append(
+                len(self.offers))
+            self.offers.append((media, r))
+        consumes = _media_types(r.annotations.get('consumes'))
+        for media in consumes:
+            self.consumes.setdefault(media, set()).add(r)
+        if not consumes:
+            self.consumes_any.append(r)
+
+    def candidates(self, request):
+        if not self.consumes:
+            return None
+        allowed = self.consumes.get((request.content_type or '').lower())
+        if not allowed and not self.consumes_any:
+            raise HTTPUnsupportedMediaType()
+        return set(self.consumes_any).union(allowed or ())
+
+    def select(self, request):
+        """ Select the best endpoint for ``request`` and its media type"""
+        candidates = self.candidates(request)
+        accept = request_accept(request)
+        best = None
+        if accept is not None and self.offers:
+            n = len(self.offers)
+            qs = [0.0] * n
+            specificity = [-1] * n
+            for media, q in accept:
+                if media == '*/*':
+                    idxs, spec = range(n), 0
+                elif media.endswith('/*'):
+                    idxs, spec = self.majors.get(media[:-2], ()), 1
+                elif media in self.types:
+                    idxs, spec = (self.types[media],), 2
+                else:
+                    continue
+                for i in idxs:
+                    if spec > specificity[i]:
+                        specificity[i] = spec
+                        qs[i] = q
+            best_q = 0.0
+            for i, (media, r) in enumerate(self.offers):
+                if qs[i] > best_q and (candidates is None or r in candidates):
+                    best, best_q = i, qs[i]
+        if best is not None:
+            return self.offers[best]
+        if accept is None:
+            for r in self.routes:
+                if candidates is None or r in candidates:
+                    media = _media_types(r.annotations.get('produces'))
+                    return (media[0] if media else None), r
+        if self.default is not None and (
+                candidates is None or self.default in candidates):
+            return None, self.default
+        raise HTTPNotAcceptable()
+
+
+class VariantGroup(RouteGroup):
+    """ Group of endpoints which serve variants of the same resource
+
+    Endpoints are annotated with ``produces`` and optionally ``consumes``
+    annotations which are media types (or lists of media types) of response
+    and request body correspondingly. Endpoint without ``produces`` annotation
+    is used when no other variant is acceptable.
+    """
+
+    def _variants(self):
+        index = {}
+        result = []
+        for r in self.routes:
+            key = (r.pattern.pattern if r.pattern else None, r.method)
+            if key not in index:
+                index[key] = Variants(r)
+                result.append(index[key])
+            index[key].add(r)
+        return result
+
+    def match(self, path_info, request):
+        path_info, args = self.match_pattern(path_info)
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        guarded = None
+        too_long = None
+        for variants in self._fresh('_cached_variants', self._variants):
+            try:
+                rest, endpoint_args = variants.route.match_pattern(path_info)
+            except PathTooLong as e:
+                too_long = e
+                continue
+            except NoURLPatternMatched:
+                continue
+            if rest:
+                continue
+            if variants.route.method != request.method:
+                e = MethodNotAllowed()
+                guarded = RouteGuarded(e, e.response)
+                continue
+            try:
+                media_type, endpoint = variants.select(request)
+                subtrace = Trace(endpoint_args, {}, [endpoint])
+                subtrace = endpoint.match_guards(request, subtrace)
+            except RouteGuarded as e:
+                guarded = e
+                continue
+            except HTTPException as e:
+                guarded = RouteGuarded(e, e)
+                continue
+            trace = trace + subtrace
+            trace.media_type = media_type
+            return trace
+        if guarded is not None:
+            raise guarded
+        if too_long is not None:
+            raise too_long
+        raise NoURLPatternMatched()
+
+
+def variants(*args, **kwargs):
+    """ Directive for grouping endpoints which serve variants of the same
+    resource
+
+    Accepts the same arguments as :func:`routr.route` does for defining route
+    groups but all routes should be endpoints.
+    """
+    r = route(*args, **kwargs)
+    if not isinstance(r, RouteGroup):
+        raise RouteConfigurationError("'variants' requires endpoint routes")
+    for sub in r.routes:
+        if not isinstance(sub, Endpoint):
+            raise RouteConfigurationError(
+                "'variants' accepts only endpoint routes")
+    return VariantGroup(
+        r.routes, r.guards, r._pattern,
+        url_pattern_cls=r.url_pattern_cls, **r.annotations)
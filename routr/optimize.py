@@ -0,0 +1,218 @@
+"""
+
+    routr.optimize -- traffic-driven route reordering
+    =================================================
+
+    Routes are matched in order of declaration so frequently requested routes
+    declared at the bottom of a long list pay for every sibling above them.
+    This module provides :func:`reorder` which moves such routes up but only
+    past siblings which are proven to never match the same URL, so the result
+    of matching stays exactly the same as with declaration order::
+
+        from routr.optimize import HitCounter, reorder
+
+        counter = HitCounter()
+        for request in sample:
+            counter.record(routes(request))
+        reorder(routes, counter)
+
+"""
+
+import re
+import heapq
+
+from routr import Endpoint, RouteGroup
+from routr.urlpattern import URLPattern
+from routr.exc import NoURLPatternMatched, InvalidRoutePattern
+
+
+__all__ = ('reorder', 'HitCounter', 'profile', 'disjoint')
+
+
+class HitCounter(object):
+    """ Counter of route hits
+
+    Counts how many times each route appeared in matched traces, can be
+    passed to :func:`reorder` as ``hits`` mapping.
+    """
+
+    def __init__(self):
+        self.hits = {}
+
+    def record(self, trace):
+        """ Record matched ``trace``"""
+        hits = self.hits
+        for r in trace.routes:
+            hits[r] = hits.get(r, 0) + 1
+        return trace
+
+    def get(self, route, default=0):
+        return self.hits.get(route, default)
+
+    def __getitem__(self, route):
+        return self.hits.get(route, 0)
+
+
+def profile(routes, requests):
+    """ Match ``requests`` against ``routes`` and return :class:`.HitCounter`
+    with collected hits, requests which weren't matched are skipped
+    """
+    counter = HitCounter()
+    for request in requests:
+        try:
+            counter.record(routes(request))
+        except Exception:
+            continue
+    return counter
+
+
+def reorder(route, hits):
+    """ Reorder routes in ``route`` tree by number of ``hits`` in place
+
+    Routes which can match the same URL keep their relative order, others are
+    moved so routes with more hits are tried first. Routes with equal number of
+    hits keep declaration order.
+
+    :param route:
+        route to reorder, usually a :class:`routr.RouteGroup`
+    :param hits:
+        mapping from route to number of hits, like :class:`.HitCounter`
+    """
+    if isinstance(route, RouteGroup):
+        for r in route.routes:
+            reorder(r, hits)
+        route.routes = _reorder(route.routes, hits)
+    return route
+
+
+def _reorder(routes, hits):
+    n = len(routes)
+    blocked = [0] * n
+    after = [[] for _ in routes]
+    for i in range(n):
+        for j in range(i):
+            if not disjoint(routes[j], routes[i]):
+                blocked[i] += 1
+                after[j].append(i)
+    ready = [(-hits.get(routes[i], 0), i) for i in range(n) if not blocked[i]]
+    heapq.heapify(ready)
+    result = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        result.append(routes[i])
+        for j in after[i]:
+            blocked[j] -= 1
+            if not blocked[j]:
+                heapq.heappush(ready, (-hits.get(routes[j], 0), j))
+    return result
+
+
+def disjoint(a, b):
+    """ Check if sibling routes ``a`` and ``b`` can never match the same URL
+
+    The check is conservative -- ``False`` is returned if it can't be proven
+    that routes are disjoint.
+    """
+    if not (_is_plain(a) and _is_plain(b)):
+        return False
+    try:
+        for x, y in ((a, b), (b, a)):
+            exact = _exact_paths(x)
+            if exact is not None:
+                return not any(_matches(y, path) for path in exact)
+        pa, pb = a.pattern, b.pattern
+        if pa is None or pb is None:
+            return False
+        la, lb = _literal_prefix(pa), _literal_prefix(pb)
+        if not (la.startswith(lb) or lb.startswith(la)):
+            return True
+        return _disjoint_segments(a, b)
+    except InvalidRoutePattern:
+        return False
+
+
+def _is_plain(r):
+    if type(r) not in (Endpoint, RouteGroup):
+        return False
+    return r.pattern is None or type(r.pattern).match is URLPattern.match
+
+
+def _exact_paths(r):
+    if not isinstance(r, Endpoint):
+        return None
+    if r.pattern is None:
+        return ('', '/')
+    if r.pattern.is_exact:
+        return (r.pattern.pattern,)
+    return None
+
+
+def _matches(r, path):
+    try:
+        rest, _ = r.match_pattern(path)
+    except NoURLPatternMatched:
+        return False
+    return not rest if isinstance(r, Endpoint) else True
+
+
+def _literal_prefix(p):
+    m = p._type_re.search(p.pattern)
+    return p.pattern[:m.start()] if m else p.pattern
+
+
+def _segments(r):
+    """ Return a list of ``(closed, literal, converter)`` for leading segments
+    of route's pattern which are either literal or a single placeholder
+    matching within a segment, and a flag if there are no more segments
+    """
+    p = r.pattern
+    parts = p.pattern.split('/')[1:]
+    result = []
+    for n, part in enumerate(parts):
+        closed = n < len(parts) - 1 or isinstance(r, Endpoint)
+        m = p._type_re.search(part)
+        if m is None:
+            result.append((closed, part, None))
+            continue
+        if m.start() != 0 or m.end() != len(part):
+            return result, False
+        c = p.lookup_converter(m.group('type'), m.group('args'))
+        if not c.segment:
+            return result, False
+        result.append((closed, None, c))
+    return result, True
+
+
+def _converts(c, value):
+    if not re.match('(?:%s)\\Z' % c.regex, value):
+        return False
+    try:
+        c.to_python(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _disjoint_segments(a, b):
+    sa, complete_a = _segments(a)
+    sb, complete_b = _segments(b)
+    # endpoint with segment bound placeholders only matches URLs with exact
+    # number of segments while other route needs at least its own number
+    if complete_a and complete_b:
+        if isinstance(a, Endpoint) and len(sb) > len(sa):
+            return True
+        if isinstance(b, Endpoint) and len(sa) > len(sb):
+            return True
+    for (ca, la, cva), (cb, lb, cvb) in zip(sa, sb):
+        if not (ca and cb):
+            break
+        if la is not None and lb is not None:
+            if la != lb:
+                return True
+        elif la is not None:
+            if not _converts(cvb, la):
+                return True
+        elif lb is not None:
+            if not _converts(cva, lb):
+                return True
+    return False
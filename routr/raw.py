@@ -0,0 +1,145 @@
+"""
+
+    routr.raw -- matching undecoded paths
+    =====================================
+
+    WSGI servers pass ``PATH_INFO`` percent-decoded but not decoded from bytes
+    -- on Python 3 it's a native string with each byte stored as a latin-1
+    character. By default routes match against ``request.path_info`` which
+    decodes whole path from UTF-8 for every request. Route trees passed through
+    :func:`raw` match ``PATH_INFO`` as is instead::
+
+        from routr import route
+        from routr.raw import raw
+
+        routes = raw(route(
+            route('/news', news),
+            route('/news/{id:int}', news_item),
+            route('/tags/{tag}', tag),
+            ))
+
+    Patterns are compiled against UTF-8 encoded form of their text, so
+    literals match without decoding path at all. Only values captured by
+    placeholders are decoded, and only if they contain non-ASCII characters,
+    values which are not valid UTF-8 make pattern not to match. Traces are the
+    same as without :func:`raw` for any path which is valid UTF-8.
+
+    Placeholder types operate on encoded form of values, so custom types with
+    regular expressions which depend on non-ASCII characters behave
+    differently, routes with URL pattern classes other than
+    :class:`routr.urlpattern.URLPattern` can't be matched that way.
+
+"""
+
+import re
+
+import six
+
+from routr.utils import cached_property, walk
+from routr.urlpattern import URLPattern
+from routr.exc import (
+    NoURLPatternMatched, PathTooLong, RouteConfigurationError)
+
+
+__all__ = ('raw', 'RawURLPattern', 'encode', 'decode')
+
+_non_ascii_re = re.compile(r'[^\x00-\x7f]')
+
+
+if six.PY3:
+
+    def encode(text):
+        """ Return ``text`` in the form it has in undecoded ``PATH_INFO``"""
+        return text.encode('utf-8').decode('latin-1')
+
+    def decode(value):
+        """ Decode ``value`` taken from undecoded ``PATH_INFO``"""
+        if _non_ascii_re.search(value) is None:
+            return value
+        return value.encode('latin-1').decode('utf-8')
+
+else:
+
+    def encode(text):
+        """ Return ``text`` in the form it has in undecoded ``PATH_INFO``"""
+        if isinstance(text, six.text_type):
+            return text.encode('utf-8')
+        return text
+
+    def decode(value):
+        """ Decode ``value`` taken from undecoded ``PATH_INFO``"""
+        if _non_ascii_re.search(value) is None:
+            return value
+        return value.decode('utf-8')
+
+
+class RawURLPattern(URLPattern):
+    """ URL pattern which matches undecoded ``PATH_INFO``"""
+
+    @cached_property
+    def raw_pattern(self):
+        return encode(self.pattern)
+
+    @cached_property
+    def _pattern_len(self):
+        return len(self.raw_pattern)
+
+    @cached_property
+    def _prefix(self):
+        return encode(URLPattern._prefix.func(self))
+
+    def compile(self):
+        super(RawURLPattern, self).compile()
+        if self._compiled is not None:
+            self._compiled = re.compile(encode(self._compiled.pattern))
+
+    def match(self, path_info):
+        if self.is_exact:
+            if not path_info.startswith(self.raw_pattern):
+                raise NoURLPatternMatched(path_info)
+            return path_info[self._pattern_len:], ()
+
+        if self.max_length is not None and len(path_info) > self.max_length:
+            if not path_info.startswith(self._prefix):
+                raise NoURLPatternMatched(path_info)
+            raise PathTooLong("path is too long for '%s'" % self.pattern)
+        m = self.compiled.match(path_info)
+        if not m:
+            raise NoURLPatternMatched("no match for '%s' against '%s'" % (
+                path_info, self._compiled.pattern))
+        groups = m.groupdict()
+        try:
+            # UnicodeDecodeError is a ValueError too
+            args = tuple(
+                c(decode(groups[n])) if c else decode(groups[n])
+                for (n, c, l) in self._names)
+        except ValueError:
+            raise NoURLPatternMatched()
+        return path_info[m.end():], args
+
+
+def raw(route):
+    """ Make ``route`` tree match undecoded ``PATH_INFO``
+
+    Patterns of routes are recompiled with :class:`.RawURLPattern`, so it's
+    better to call it before matching any request. Returns ``route``.
+    """
+    routes = list(walk(route))
+    for r in routes:
+        cls = r.url_pattern_cls
+        if cls not in (None, URLPattern) and not issubclass(
+                cls, RawURLPattern):
+            raise RouteConfigurationError(
+                "route %r uses URL pattern class %r which can't match"
+                " undecoded paths" % (r, cls))
+    for r in routes:
+        if not r.raw_path:
+            r.url_pattern_cls = RawURLPattern
+            pattern = r.__dict__.pop('pattern', None)
+            if getattr(pattern, 'max_length', None) is not None:
+                # keep limits set by routr.complexity.limit
+                r.pattern.max_length = pattern.max_length
+            r.raw_path = True
+    if hasattr(route, 'invalidate'):
+        route.invalidate()
+    return route
@@ -0,0 +1,319 @@
+"""
+
+    routr.replay -- replaying access logs through routes
+    ====================================================
+
+    Synthetic route trees and URL mixes don't reproduce real distribution of
+    requests. This module replays requests from access log in common or
+    combined format through real route tree and reports time spent matching
+    per route, how many routes are visited per request and which URL shapes are
+    the slowest to match::
+
+        from routr import include
+        from routr.replay import replay
+
+        with open('access.log') as log:
+            report = replay(include('myapp.routes:routes'), log)
+        print(report)
+
+    or from command line::
+
+        % python -m routr.replay myapp.routes:routes access.log --top 20
+
+    Routes visited by request are counted with :func:`routr.explain.explain`,
+    match latency is measured with plain ``routes(request)`` call. URL shape is
+    request's method and path with numeric, UUID and long hexadecimal segments
+    replaced by placeholders, so ``/news/42`` and ``/news/43`` have the same
+    shape ``GET /news/{int}``.
+
+"""
+
+import re
+import sys
+
+from webob import Request
+from routr.explain import explain
+from routr.utils import percentile, timer
+
+
+__all__ = ('replay', 'parse_line', 'shape', 'Replay', 'Stats')
+
+
+# common log format, combined format only adds fields at the end
+_line_re = re.compile(r"""
+    ^\S+\s+\S+\s+\S+\s+             # host, ident and user
+    \[[^\]]*\]\s+                   # time
+    "(?P<method>[A-Z]+)\s+          # request line
+     (?P<uri>\S+)
+     (?:\s+HTTP/[0-9.]+)?"
+    """, re.VERBOSE)
+
+_shapes = (
+    (re.compile(r'\A[0-9]+\Z'), '{int}'),
+    (re.compile(
+        r'\A[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+        r'[0-9a-fA-F]{12}\Z'), '{uuid}'),
+    (re.compile(r'\A[0-9a-fA-F]{16,}\Z'), '{hex}'),
+)
+
+
+def parse_line(line):
+    """ Return ``(method, uri)`` of request logged in ``line`` or ``None`` if
+    line isn't in common or combined log format
+    """
+    m = _line_re.match(line)
+    if m is None:
+        return None
+    return m.group('method'), m.group('uri')
+
+
+def _segment_shape(segment):
+    for regex, placeholder in _shapes:
+        if regex.match(segment):
+            return placeholder
+    return segment
+
+
+def shape(method, path):
+    """ Return shape of URL -- ``method`` and ``path`` with numeric, UUID and
+    long hexadecimal segments replaced by placeholders
+    """
+    path = path.split('?', 1)[0]
+    return '%s %s' % (
+        method, '/'.join(_segment_shape(s) for s in path.split('/')))
+
+
+def _route_key(trace):
+    # full pattern of matched chain along with endpoint's method and target
+    pattern = ''.join(
+        r.pattern.pattern for r in trace.routes
+        if getattr(r, 'pattern', None) is not None)
+    endpoint = trace.endpoint
+    return '%s %s -> %r' % (
+        getattr(endpoint, 'method', None), pattern or '/', trace.target)
+
+
+def _error_key(e):
+    response = getattr(e, 'response', None)
+    status = getattr(response, 'status', None) or getattr(e, 'status', None)
+    if status is not None:
+        return '<%s>' % status
+    return '<%s>' % e.__class__.__name__
+
+
+class Stats(object):
+    """ Match latencies of a group of requests
+
+    :attr latencies:
+        sorted list of latencies in seconds
+    """
+
+    def __init__(self, latencies):
+        self.latencies = sorted(latencies)
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def total(self):
+        return sum(self.latencies)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.latencies else None
+
+    def percentile(self, p):
+        return percentile(self.latencies, p)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+
+class Replay(object):
+    """ Results of :func:`replay`
+
+    :attr requests:
+        number of replayed requests
+    :attr skipped:
+        number of log lines which couldn't be parsed
+    :attr routes:
+        dict of :class:`.Stats` keyed by description of matched route or
+        ``<status>`` of matching failure
+    :attr shapes:
+        dict of :class:`.Stats` keyed by URL shape
+    :attr visited:
+        dict of numbers of requests keyed by number of routes visited while
+        matching them
+    """
+
+    def __init__(self, requests, skipped, routes, shapes, visited):
+        self.requests = requests
+        self.skipped = skipped
+        self.routes = routes
+        self.shapes = shapes
+        self.visited = visited
+
+    @property
+    def mean_visited(self):
+        """ Mean number of routes visited per request"""
+        if not self.requests:
+            return None
+        return float(sum(n * c for n, c in self.visited.items())) / sum(
+            self.visited.values())
+
+    def slowest(self, n=10):
+        """ Return ``n`` URL shapes with the highest mean match latency as
+        ``(shape, stats)`` pairs
+        """
+        return sorted(
+            self.shapes.items(), key=lambda item: -item[1].mean)[:n]
+
+    def as_dict(self, top=10):
+        return {
+            'requests': self.requests,
+            'skipped': self.skipped,
+            'mean_visited': self.mean_visited,
+            'visited': dict(
+                (str(n), c) for n, c in self.visited.items()),
+            'routes': dict(
+                (key, stats.as_dict()) for key, stats in self.routes.items()),
+            'slowest': [
+                dict(stats.as_dict(), shape=key)
+                for key, stats in self.slowest(top)],
+        }
+
+    def format(self, top=10):
+        """ Return report as text with ``top`` slowest URL shapes"""
+        lines = [
+            'requests: %d (%d lines skipped)' % (self.requests, self.skipped),
+            '',
+            'routes by total match time:',
+        ]
+        for key, stats in sorted(
+                self.routes.items(), key=lambda item: -item[1].total):
+            lines.append('  %8d  mean %s  p99 %s  %s' % (
+                stats.count, _us(stats.mean), _us(stats.percentile(99)),
+                key))
+        lines.append('')
+        mean = self.mean_visited
+        lines.append('routes visited per request (mean %s):' % (
+            '%.1f' % mean if mean is not None else '-'))
+        for n in sorted(self.visited):
+            lines.append('  %4d  %d' % (n, self.visited[n]))
+        lines.append('')
+        lines.append('slowest URL shapes:')
+        for key, stats in self.slowest(top):
+            lines.append('  %8d  mean %s  p99 %s  %s' % (
+                stats.count, _us(stats.mean), _us(stats.percentile(99)),
+                key))
+        return '\n'.join(lines)
+
+    __str__ = format
+
+
+def _us(value):
+    if value is None:
+        return '%9s' % '-'
+    return '%7.1fus' % (value * 1000000)
+
+
+def replay(routes, lines, repeat=1):
+    """ Replay requests from access log ``lines`` through ``routes`` and
+    return :class:`.Replay`
+
+    :param routes:
+        route tree, for example loaded with :func:`routr.include`
+    :param lines:
+        iterable of lines in common or combined log format
+    :param repeat:
+        number of times each request is matched, the fastest time is taken
+    """
+    requests = 0
+    skipped = 0
+    routes_latencies = {}
+    shapes_latencies = {}
+    visited = {}
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            skipped += 1
+            continue
+        method, uri = parsed
+        try:
+            request = Request.blank(uri, method=method)
+        except Exception:
+            skipped += 1
+            continue
+        requests += 1
+        # explaining also compiles patterns on the way, so they aren't
+        # compiled while time is measured
+        try:
+            steps = len(
+                explain(routes, Request(dict(request.environ))).steps)
+        except Exception:
+            # path can't be decoded, no route was visited
+            steps = 0
+        visited[steps] = visited.get(steps, 0) + 1
+        key = None
+        best = None
+        for _ in range(repeat):
+            environ = dict(request.environ)
+            matched = Request(environ)
+            start = timer()
+            try:
+                trace = routes(matched)
+            except Exception as e:
+                elapsed = timer() - start
+                key = _error_key(e)
+            else:
+                elapsed = timer() - start
+                key = _route_key(trace)
+            if best is None or elapsed < best:
+                best = elapsed
+        routes_latencies.setdefault(key, []).append(best)
+        shapes_latencies.setdefault(
+            shape(method, request.path), []).append(best)
+    return Replay(
+        requests, skipped,
+        dict((k, Stats(v)) for k, v in routes_latencies.items()),
+        dict((k, Stats(v)) for k, v in shapes_latencies.items()),
+        visited)
+
+
+def main(argv=None):
+    import json
+    import argparse
+    from routr import include
+    parser = argparse.ArgumentParser(
+        prog='python -m routr.replay',
+        description='replay access log through route tree')
+    parser.add_argument(
+        'routes', help='import path of route tree, like myapp:routes')
+    parser.add_argument(
+        'log', help='access log in common or combined format, - for stdin')
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('-t', '--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    routes = include(args.routes)
+    if args.log == '-':
+        report = replay(routes, sys.stdin, repeat=args.repeat)
+    else:
+        with open(args.log) as log:
+            report = replay(routes, log, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(
+            report.as_dict(top=args.top), indent=2, sort_keys=True))
+    else:
+        print(report.format(top=args.top))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
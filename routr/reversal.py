@@ -0,0 +1,101 @@
+"""
+
+    routr.reversal -- memoized URL reversal
+    =======================================
+
+    Pages usually reverse the same routes with the same arguments over and over
+    again (navigation bars, breadcrumbs). Reversal results can be memoized in
+    size-bounded LRU cache::
+
+        cache = routes.memoize_reversal(maxsize=512)
+
+        routes.reverse('news', 42)      # computed
+        routes.reverse('news', 42)      # taken from cache
+        cache.hit_rate                  # 0.5
+
+    Cache is cleared automatically when routes of the route tree it belongs to
+    are reassigned or :meth:`routr.RouteGroup.invalidate` is called, changes
+    of unrelated trees don't affect it.
+
+"""
+
+import threading
+from collections import OrderedDict
+
+
+__all__ = ('ReversalCache',)
+
+
+class ReversalCache(object):
+    """ LRU cache of URLs produced by ``reverse(name, args, kwargs)``
+
+    :param reverse:
+        function which computes URL
+    :param maxsize:
+        maximum number of cached URLs
+    :param version:
+        function which returns version of routes, cache is cleared when it
+        changes
+    """
+
+    def __init__(self, reverse, maxsize=1024, version=lambda: 0):
+        self.reverse = reverse
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.generation = version()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """ Ratio of calls served from cache"""
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def __call__(self, name, args, kwargs):
+        # types are part of key as 1, True and 1.0 are equal but are
+        # formatted differently
+        key = (
+            name,
+            tuple((type(v), v) for v in args),
+            tuple(sorted((k, type(v), v) for k, v in kwargs.items()))
+            if kwargs else ())
+        with self._lock:
+            generation = self.version()
+            if self.generation != generation:
+                self._entries.clear()
+                self.generation = generation
+            try:
+                url = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+            except TypeError:
+                # unhashable arguments
+                self.misses += 1
+                key = None
+            else:
+                self._entries[key] = url
+                self.hits += 1
+                return url
+        url = self.reverse(name, args, kwargs)
+        if key is None:
+            return url
+        with self._lock:
+            # routes could change while reversing
+            if generation == self.version():
+                self._entries[key] = url
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return url
+
+    def clear(self):
+        """ Clear cache and reset stats"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
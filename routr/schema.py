@@ -0,0 +1,195 @@
+"""
+
+    routr.schema -- query string validation
+    =======================================
+
+    This module provides :class:`QueryParams` guard (also available as ``qs``)
+    which validates request's query string against schema and puts converted
+    values into ``trace.kwargs``::
+
+        from routr import route
+        from routr.schema import qs, opt, many, Int, String
+
+        routes = route("/search",
+            qs(q=String, page=opt(Int, 1), tag=many(String)),
+            search)
+
+    Schema is compiled once when guard is created and query string is parsed
+    at most once per request no matter how many guards examine it.
+
+"""
+
+import re
+
+from six import text_type
+from webob.exc import HTTPBadRequest
+from routr.urlpattern import Converter
+
+
+__all__ = (
+    'QueryParams', 'qs', 'Optional', 'opt', 'Many', 'many',
+    'String', 'Int', 'Float', 'Bool', 'parse_query')
+
+
+String = text_type
+Int = int
+Float = float
+
+
+def Bool(value):
+    """ Convert query string value into boolean"""
+    value = value.lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(value)
+
+
+class Optional(object):
+    """ Mark schema field as optional
+
+    :param typ:
+        type of the field
+    :param default:
+        value to use if field wasn't supplied
+    """
+
+    def __init__(self, typ, default=None):
+        self.typ = typ
+        self.default = default
+
+
+class Many(object):
+    """ Mark schema field as accepting multiple values, converted values are
+    collected into a list
+
+    :param typ:
+        type of each value
+    :param min:
+        minimal number of values required
+    """
+
+    def __init__(self, typ, min=0):
+        self.typ = typ
+        self.min = min
+
+
+opt = Optional
+many = Many
+
+
+def parse_query(request):
+    """ Return request's query string as a dict mapping names to lists of
+    values
+
+    Result is cached in request's environ so query string is parsed only once
+    per request.
+    """
+    environ = request.environ
+    query = environ.get('QUERY_STRING', '')
+    cached = environ.get('routr.query')
+    if cached is not None and cached[0] == query:
+        return cached[1]
+    params = {}
+    for k, v in request.GET.items():
+        params.setdefault(k, []).append(v)
+    environ['routr.query'] = (query, params)
+    return params
+
+
+def _converter(converter):
+    # value should match converter's regex as a whole, like in URL patterns
+    match = re.compile('(?:%s)\\Z' % converter.regex).match
+    to_python = converter.to_python
+
+    def convert(value):
+        if match(value) is None:
+            raise ValueError('invalid value %r' % (value,))
+        return to_python(value)
+
+    return convert
+
+
+def compile_field(name, spec):
+    """ Compile schema field into tuple of ``(name, convert, required,
+    default, multiple)`` where ``multiple`` is minimal number of values for
+    :class:`.Many` fields and ``None`` otherwise
+    """
+    required = True
+    default = None
+    multiple = None
+    if isinstance(spec, Optional):
+        required = False
+        default = spec.default
+        spec = spec.typ
+    if isinstance(spec, Many):
+        required = required and spec.min > 0
+        multiple = spec.min
+        spec = spec.typ
+    if isinstance(spec, Converter):
+        spec = _converter(spec)
+    if not hasattr(spec, '__call__'):
+        raise TypeError("invalid type for '%s' field: %r" % (name, spec))
+    return (name, spec, required, default, multiple)
+
+
+class QueryParams(object):
+    """ Guard which validates query string against schema
+
+    Schema is specified via keyword arguments which map parameter names to
+    types -- callables which convert string into value and raise
+    ``ValueError`` on invalid input, :class:`routr.urlpattern.Converter`
+    objects are also accepted. Types can be wrapped with :class:`.Optional`
+    and :class:`.Many`.
+
+    Converted values are stored into ``trace.kwargs``, in case of invalid or
+    missing values exception produced by ``exception_factory`` is raised.
+    """
+
+    exception_factory = HTTPBadRequest
+
+    def __init__(self, **schema):
+        self.schema = schema
+        self.fields = [
+            compile_field(name, spec)
+            for name, spec in sorted(schema.items())]
+
+    def __call__(self, request, trace):
+        params = parse_query(request)
+        kwargs = {}
+        errors = []
+        for name, convert, required, default, multiple in self.fields:
+            values = params.get(name)
+            if not values:
+                if required:
+                    errors.append("missing '%s' parameter" % name)
+                elif multiple is not None and default is None:
+                    kwargs[name] = []
+                else:
+                    kwargs[name] = default
+                continue
+            try:
+                if multiple is not None:
+                    if len(values) < multiple:
+                        errors.append(
+                            "not enough values for '%s' parameter" % name)
+                        continue
+                    kwargs[name] = [convert(v) for v in values]
+                else:
+                    kwargs[name] = convert(values[-1])
+            except (ValueError, TypeError):
+                errors.append("invalid value for '%s' parameter" % name)
+        if errors:
+            raise self.exception_factory('; '.join(errors))
+        trace.kwargs.update(kwargs)
+        return trace
+
+    def __repr__(self):
+        schema = sorted(self.schema.items())
+        return '%s(%s)' % (
+            self.__class__.__name__,
+            ', '.join('%s=%r' % (k, v) for k, v in schema))
+
+
+qs = QueryParams
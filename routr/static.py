@@ -10,7 +10,6 @@
 
 from os.path import join
 from webob import Response
-from webob.static import FileApp
 from routr import route, GET
 
 
@@ -45,6 +44,8 @@ def static(prefix, directory, **kw):
 def make_static_view(directory):
     def static_view(request, path):
         """ View for serving static files"""
+        from webob.static import FileApp
         return _ForceResponse(FileApp(join(directory, path))(request))
     static_view.static_view = True  # b/c
+    static_view.directory = directory
     return static_view
@@ -0,0 +1,214 @@
+"""
+
+    routr.template -- route trees shared between tenants
+    ====================================================
+
+    Multi-tenant applications often serve the same routes for each tenant
+    under its own prefix. Building a route tree per tenant makes memory grow
+    with the number of tenants -- each tree has its own routes and compiled
+    patterns -- and makes matching try tenants one by one.
+    :class:`RouteTemplate` is a route tree which is served for all tenants by a
+    single group instead::
+
+        from routr import route, GET
+        from routr.template import RouteTemplate
+
+        template = RouteTemplate(route(
+            route(GET, '/',          index,  name='index'),
+            route(GET, '/news/{id}', news,   name='news'),
+            ))
+
+        routes = route(
+            template.group('/{tenant}', tenants=['acme', 'initech'],
+                           overrides={'initech': {'index': initech_index}}),
+            route(GET, '/about', about),
+            )
+
+    Group pattern should end with a placeholder, value it captures is the
+    tenant and is passed in ``trace.args`` like any other captured value.
+    Tenant is then resolved through a dict to template routes or to a copy of
+    them made for tenant with ``overrides`` -- routes named there are replaced
+    with a copy of endpoint with another target or with any other route and
+    only groups on the way to them are copied while all other routes and
+    compiled patterns are still shared.
+
+    Routes are reversed through group with tenant as the first argument, like
+    ``routes.reverse('news', 'acme', 1)``, patterns of template routes are
+    used for all tenants.
+
+"""
+
+import copy
+
+from routr import Route, Endpoint, RouteGroup, Trace
+from routr.exc import NoURLPatternMatched, RouteConfigurationError
+
+
+__all__ = ('RouteTemplate', 'TenantGroup')
+
+# attributes which hold caches built for particular route objects
+_caches = (
+    '_cached_annotations_index', '_cached_index', '_cached_target_index',
+    '_cached_host_index', '_cached_variants', 'reversal_cache', '_parents',
+    'version')
+
+
+def _copy(route):
+    # pattern is compiled first so copy shares it with original
+    route.pattern
+    copied = copy.copy(route)
+    for name in _caches:
+        copied.__dict__.pop(name, None)
+    return copied
+
+
+def _override(route, overrides, found):
+    """ Return ``route`` with routes named in ``overrides`` replaced, routes
+    which have nothing to replace are returned as is
+    """
+    if isinstance(route, Endpoint) and route.name in overrides:
+        found.add(route.name)
+        value = overrides[route.name]
+        if isinstance(value, Route):
+            return value
+        copied = _copy(route)
+        copied.target = value
+        return copied
+    if isinstance(route, RouteGroup):
+        routes = [_override(r, overrides, found) for r in route.routes]
+        if any(r is not o for r, o in zip(routes, route.routes)):
+            copied = _copy(route)
+            copied.routes = routes
+            return copied
+    return route
+
+
+class TenantGroup(RouteGroup):
+    """ Route group which serves template routes for tenants, tenant is the
+    value captured by the last placeholder of group's pattern
+
+    Additional to :class:`routr.RouteGroup` params are:
+
+    :param template:
+        :class:`.RouteTemplate` group serves
+    :param tenants:
+        tenants served by group or ``None`` to serve any tenant
+    :attr trees:
+        dict of route trees of tenants which have overrides
+    """
+
+    def __init__(self, template, tenants, guards, pattern,
+                 url_pattern_cls=None, **annotations):
+        if not pattern or '{' not in pattern:
+            raise RouteConfigurationError(
+                "pattern of tenant group should capture tenant, got %r"
+                % (pattern,))
+        super(TenantGroup, self).__init__(
+            [template.routes], guards, pattern,
+            url_pattern_cls=url_pattern_cls, **annotations)
+        self.template = template
+        self.tenants = set(tenants) if tenants is not None else None
+        self.trees = {}
+
+    def add(self, tenant, overrides=None):
+        """ Serve template routes for ``tenant`` with routes named in
+        ``overrides`` replaced
+        """
+        if overrides:
+            self.trees[tenant] = self.template.override(overrides)
+        else:
+            self.trees.pop(tenant, None)
+        if self.tenants is not None:
+            self.tenants.add(tenant)
+
+    def resolve(self, tenant):
+        """ Return route tree of ``tenant``
+
+        :raises routr.exc.NoURLPatternMatched:
+            if group doesn't serve ``tenant``
+        """
+        tree = self.trees.get(tenant)
+        if tree is not None:
+            return tree
+        if self.tenants is not None and tenant not in self.tenants:
+            raise NoURLPatternMatched("no tenant '%s'" % (tenant,))
+        return self.routes[0]
+
+    def _match_tree(self, args, request, match):
+        tree = self.resolve(args[-1])
+        trace = Trace(args, {}, [self])
+        trace = self.match_guards(request, trace)
+        return self.match_routes(trace, [tree], match)
+
+    def match(self, path_info, request):
+        path_info, args = self.match_pattern(path_info)
+        return self._match_tree(
+            args, request, lambda tree: tree.match(path_info, request))
+
+    def match_segments(self, segments, pos, request):
+        pos, args = self.pattern.match_segments(segments, pos)
+        return self._match_tree(
+            args, request,
+            lambda tree: tree.match_segments(segments, pos, request))
+
+    def __repr__(self):
+        return '%s(pattern=%r, tenants=%r)' % (
+            self.__class__.__name__, self._pattern, self.tenants)
+
+    __str__ = __repr__
+
+
+class RouteTemplate(object):
+    """ Route tree shared by tenants
+
+    :param routes:
+        route tree, usually produced by :func:`routr.route`
+    """
+
+    def __init__(self, routes):
+        if not isinstance(routes, Route):
+            raise RouteConfigurationError(
+                'route template should be a route, got %r' % (routes,))
+        self.routes = routes
+
+    def override(self, overrides):
+        """ Return template routes with routes named in ``overrides``
+        replaced
+
+        :param overrides:
+            dict which maps names of template routes to targets or routes
+            which replace them
+        """
+        found = set()
+        routes = _override(self.routes, overrides, found)
+        missing = set(overrides) - found
+        if missing:
+            raise RouteConfigurationError(
+                'no routes to override with names: %s' % ', '.join(
+                    "'%s'" % name for name in sorted(missing)))
+        return routes
+
+    def group(self, pattern, tenants=None, overrides=None, guards=(),
+              **annotations):
+        """ Return :class:`.TenantGroup` which serves template routes under
+        ``pattern``
+
+        :param pattern:
+            URL pattern of group, value captured by its last placeholder is
+            the tenant
+        :param tenants:
+            tenants served by group, any tenant is served if ``None``
+        :param overrides:
+            dict which maps tenants to dicts of overrides for
+            :meth:`override`
+        :param guards:
+            guards of group
+        :param annotations:
+            annotations of group
+        """
+        group = TenantGroup(
+            self, tenants, list(guards), pattern,
+            url_pattern_cls=self.routes.url_pattern_cls, **annotations)
+        for tenant, replaced in (overrides or {}).items():
+            group.add(tenant, replaced)
+        return group
@@ -10,6 +10,9 @@ try:
 except ImportError:
     from unittest import TestCase
 
+import os
+import sys
+
 import six
 
 from webob import Request, exc
@@ -20,7 +23,8 @@ from routr import POST, GET
 from routr.utils import (
     ImportStringError, positional_args, inject_args, import_string)
 from routr.exc import (
-    NoURLPatternMatched, RouteGuarded, MethodNotAllowed, RouteReversalError)
+    NoURLPatternMatched, RouteGuarded, MethodNotAllowed, RouteReversalError,
+    InvalidRoutePattern)
 
 
 __all__ = ()
@@ -205,6 +209,97 @@ class TestRouteGroup(TestRouting):
         r = route(route('news', name='news'))
         self.assertEqual(r.reverse('news'), '/')
 
+    def test_reverse_for(self):
+        def news():
+            pass
+
+        def comments():
+            pass
+
+        r = route(
+            'api',
+            route('news/{id:int}', news),
+            route(route('comments', comments), route(POST, 'c', 'create')),
+            route('other/{id}', comments),
+            route(route('index', name='index')))
+        self.assertEqual(r.reverse_for(news, 1), '/api/news/1')
+        self.assertEqual(
+            r.reverse_for('index', q=1), r.reverse('index', q=1))
+        self.assertEqual(r.reverse_for('create'), '/api/c')
+        self.assertRaises(RouteReversalError, r.reverse_for, 'missing')
+        self.assertRaises(RouteReversalError, r.reverse_for, [])
+        try:
+            r.reverse_for(comments)
+        except RouteReversalError as e:
+            self.assertIn('more than one route', str(e))
+            self.assertIn('/api/other/{id}', str(e))
+        else:
+            self.fail('ambiguous target reversed')
+        self.assertEqual(
+            route('news/{id}', news).reverse_for(news, 'a'), '/news/a')
+
+    def test_memoize_reversal(self):
+        r = route(
+            route('news/{id}', 'news', name='news'),
+            route('api', route('index', name='index')))
+        cache = r.memoize_reversal(maxsize=2)
+        self.assertEqual(r.reverse('news', 1, q=2), '/news/1?q=2')
+        self.assertEqual(r.reverse('news', 1, q=2), '/news/1?q=2')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.hit_rate, 0.5)
+        r.reverse('news', 2)
+        r.reverse('index')
+        self.assertEqual(len(cache), 2)
+        r.reverse('news', 1, q=2)
+        self.assertEqual(cache.hits, 1)
+        r.reverse('news', [1])
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(RouteReversalError, r.reverse, 'missing')
+
+        # cache is cleared when route tree changes
+        r.routes[1].routes = [route('other', 'index', name='index')]
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(r.reverse('index'), '/api/other')
+        self.assertEqual(len(cache), 1)
+        r.routes.append(route('news/old/{id}', 'news', name='old'))
+        r.invalidate()
+        self.assertEqual(r.reverse('old', 1), '/news/old/1')
+        self.assertEqual(r.reverse_for('index'), '/api/other')
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_memoize_reversal_types(self):
+        r = route(route('n/{x}', 'n', name='n'))
+        r.memoize_reversal()
+        self.assertEqual(r.reverse('n', 1), '/n/1')
+        self.assertEqual(r.reverse('n', True), '/n/True')
+        self.assertEqual(r.reverse('n', 1.0), '/n/1.0')
+        self.assertEqual(r.reverse('n', 1, q=True), '/n/1?q=True')
+        self.assertEqual(r.reverse('n', 1, q=1), '/n/1?q=1')
+
+    def test_memoize_reversal_per_tree(self):
+        shared = route('api', route('index', name='index'))
+        r = route(route('news/{id}', 'news', name='news'), shared)
+        other = route(shared)
+        cache = r.memoize_reversal()
+        r.reverse('news', 1)
+        version = r.version
+
+        # building and changing unrelated trees leaves cache alone
+        unrelated = route(route('x', 'y'))
+        unrelated.routes = [route('z', 'y')]
+        unrelated.invalidate()
+        self.assertEqual(r.version, version)
+        self.assertEqual(len(cache), 1)
+
+        # changes of nested group are seen by all trees which include it
+        shared.routes = [route('other', 'index', name='index')]
+        self.assertNotEqual(r.version, version)
+        self.assertEqual(other.reverse('index'), '/api/other')
+        self.assertEqual(r.reverse('index'), '/api/other')
+        self.assertEqual(len(cache), 1)
+
     def test_simple(self):
         r = route(
             route('news', 'news'),
@@ -230,7 +325,7 @@ class TestRouteGroup(TestRouting):
         r = route(
             'news',
             route('{id:int}',
-            route('comments', 'view')))
+                  route('comments', 'view')))
         req = Request.blank('/news/42/comments')
         tr = r(req)
         self.assertEqual(
@@ -482,6 +577,67 @@ class TestURLPattern(TestCase):
         self.assertRaises(NoURLPatternMatched, p.match, '/a')
         self.assertRaises(NoURLPatternMatched, p.match, '/a/abc/b/')
 
+    def test_int_bounds(self):
+        p = URLPattern('/a/{id:int(min=1, max=100)}/b/')
+        self.assertEqual(p.match('/a/1/b/'), ('', (1,)))
+        self.assertEqual(p.match('/a/100/b/'), ('', (100,)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/0/b/')
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/101/b/')
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/007/b/')
+
+        p = URLPattern('/a/{id:int(min=-5)}')
+        self.assertEqual(p.match('/a/-5'), ('', (-5,)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/-6')
+
+        self.assertRaises(InvalidRoutePattern,
+                          URLPattern('/{id:int(x)}').compile)
+        self.assertRaises(InvalidRoutePattern,
+                          URLPattern('/{id:int(max=a)}').compile)
+
+    def test_uuid(self):
+        import uuid
+        u = uuid.UUID('12345678-1234-5678-1234-567812345678')
+        p = URLPattern('/a/{id:uuid}')
+        self.assertEqual(p.match('/a/%s' % u), ('', (u,)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/1234')
+        self.assertEqual(p.reverse(u), '/a/%s' % u)
+
+    def test_slug(self):
+        p = URLPattern('/a/{id:slug}')
+        self.assertEqual(p.match('/a/hello-world_1'), ('', ('hello-world_1',)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/$hello')
+
+    def test_date(self):
+        import datetime
+        p = URLPattern('/a/{d:date}/')
+        d = datetime.date(2012, 2, 29)
+        self.assertEqual(p.match('/a/2012-02-29/'), ('', (d,)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/2012-13-01/')
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/2013-02-29/')
+        self.assertEqual(p.reverse(d), '/a/2012-02-29/')
+
+    def test_register_converter(self):
+        from routr.urlpattern import Converter
+
+        class MyURLPattern(URLPattern):
+            pass
+
+        MyURLPattern.register_converter('hex', Converter(
+            '[0-9a-f]+',
+            to_python=lambda v: int(v, 16),
+            to_url=lambda v: '%x' % v))
+        p = MyURLPattern('/a/{id:hex}')
+        self.assertEqual(p.match('/a/ff'), ('', (255,)))
+        self.assertRaises(NoURLPatternMatched, p.match, '/a/gf')
+        self.assertEqual(p.reverse(255), '/a/ff')
+        self.assertRaises(InvalidRoutePattern, URLPattern('/{id:hex}').compile)
+        self.assertFalse('hex' in URLPattern.typemap)
+
+    def test_reverse(self):
+        p = URLPattern('/a/{id:int}/{name}')
+        self.assertEqual(p.reverse(42, 'x'), '/a/42/x')
+        self.assertRaises(RouteReversalError, p.reverse, 42)
+
 
 class TestPositionalArgs(TestCase):
 
@@ -594,3 +750,1599 @@ class TestImportString(TestCase):
 
         klass = import_string(six.u('routr.Route'))
         self.assertEqual(klass, Route)
+
+
+class TestHost(TestRouting):
+
+    def make_routes(self):
+        from routr.host import hosts, host
+        return hosts(
+            host('example.com',
+                 route('/', 'index'),
+                 route(POST, '/', 'create')),
+            host('{tenant}.example.com', route('/', 'tenant')),
+            host('api.example.com', route('/', 'api')),
+            host('{a}-{b:int}.example.org', route('/', 'pair')))
+
+    def blank(self, host, path='/', **kw):
+        req = Request.blank(path, **kw)
+        req.host = host
+        return req
+
+    def test_exact(self):
+        r = self.make_routes()
+        tr = r(self.blank('example.com'))
+        self.assertEqual((tr.args, tr.target), ((), 'index'))
+        tr = r(self.blank('Example.COM:8080'))
+        self.assertEqual((tr.args, tr.target), ((), 'index'))
+        tr = r(self.blank('api.example.com'))
+        self.assertEqual((tr.args, tr.target), ((), 'api'))
+
+    def test_wildcard(self):
+        r = self.make_routes()
+        tr = r(self.blank('acme.example.com'))
+        self.assertEqual((tr.args, tr.target), (('acme',), 'tenant'))
+        tr = r(self.blank('x-42.example.org'))
+        self.assertEqual((tr.args, tr.target), (('x', 42), 'pair'))
+        self.assertNoMatch(r, self.blank('a.b.example.com'))
+        self.assertNoMatch(r, self.blank('x-y.example.org'))
+        self.assertNoMatch(r, self.blank('example.net'))
+
+    def test_path_and_method(self):
+        r = self.make_routes()
+        self.assertNoMatch(r, self.blank('acme.example.com', '/news'))
+        tr = r(self.blank('example.com', method='POST'))
+        self.assertEqual(tr.target, 'create')
+        self.assertRaises(
+            RouteGuarded, r, self.blank('acme.example.com', method='POST'))
+
+    def test_changed_routes(self):
+        from routr.host import host
+        r = self.make_routes()
+        self.assertEqual(r(self.blank('api.example.com')).target, 'api')
+        r.routes = [host('api.example.com', route('/', 'new api'))]
+        self.assertEqual(r(self.blank('api.example.com')).target, 'new api')
+        self.assertNoMatch(r, self.blank('example.com'))
+
+    def test_standalone_host_route(self):
+        from routr.host import host
+        r = route(
+            host('{tenant}.example.com', route('/', 'tenant')),
+            route('/', 'default'))
+        tr = r(self.blank('acme.example.com'))
+        self.assertEqual((tr.args, tr.target), (('acme',), 'tenant'))
+        tr = r(self.blank('example.com'))
+        self.assertEqual((tr.args, tr.target), ((), 'default'))
+
+    def test_invalid(self):
+        from routr.host import hosts
+        self.assertRaises(RouteConfigurationError, hosts)
+        self.assertRaises(
+            RouteConfigurationError, hosts, route('/', 'index'))
+
+
+class TestOptimize(TestCase):
+
+    def test_disjoint(self):
+        from routr.optimize import disjoint
+        self.assertTrue(disjoint(route('news', 'a'), route('comments', 'b')))
+        self.assertTrue(disjoint(route('news', 'a'), route('newsweek', 'b')))
+        self.assertFalse(disjoint(
+            route('news', route('a', 'a')),
+            route('newsweek', 'b')))
+        self.assertTrue(disjoint(
+            route('news/{id:int}', 'a'),
+            route('news/new', 'b')))
+        self.assertFalse(disjoint(
+            route('news/{id}', 'a'),
+            route('news/new', 'b')))
+        self.assertTrue(disjoint(
+            route('news/{id:int}/edit', 'a'),
+            route('news/{slug}', 'b')))
+        self.assertTrue(disjoint(
+            route('{id:int}/', route('edit', 'a')),
+            route('news/', route('list', 'b'))))
+        self.assertFalse(disjoint(
+            route('news/{p:path}', 'a'),
+            route('news/{id:int}/edit', 'b')))
+        self.assertFalse(disjoint(route(GET, 'a'), route(POST, 'b')))
+        self.assertFalse(disjoint(route(route('a', 'a')), route('b', 'b')))
+
+    def test_reorder(self):
+        from routr.optimize import reorder, profile
+        r = route(
+            route('news/{id:int}', 'news'),
+            route('news/{slug}', 'news_by_slug'),
+            route('comments', 'comments'),
+            route('api',
+                  route('users', 'users'),
+                  route('posts', 'posts')))
+        paths = (
+            ['/api/posts'] * 3 + ['/news/a'] * 2 +
+            ['/news/1', '/comments', '/api/users', '/nothing'])
+        expected = []
+        for path in paths:
+            try:
+                expected.append(r(Request.blank(path)).target)
+            except NoURLPatternMatched:
+                expected.append(None)
+
+        hits = profile(r, [Request.blank(p) for p in paths])
+        reorder(r, hits)
+
+        self.assertEqual(
+            [x.target if isinstance(x, Endpoint) else x.routes[0].target
+             for x in r.routes],
+            ['posts', 'news', 'news_by_slug', 'comments'])
+        self.assertEqual(
+            [x.target for x in r.routes[0].routes], ['posts', 'users'])
+        for path, target in zip(paths, expected):
+            if target is None:
+                self.assertRaises(
+                    NoURLPatternMatched, r, Request.blank(path))
+            else:
+                self.assertEqual(r(Request.blank(path)).target, target)
+
+
+class TestExplain(TestCase):
+
+    def make_routes(self):
+        def admin_only(request, trace):
+            raise exc.HTTPForbidden()
+        return route(
+            route('news', 'news'),
+            route(POST, 'comments', 'comments'),
+            route('admin', admin_only, route('users', 'users')),
+            route('api', route('{id:int}', 'api')))
+
+    def test_match(self):
+        from routr.explain import explain
+        r = self.make_routes()
+        e = explain(r, Request.blank('/api/42'))
+        self.assertEqual(e.trace.target, 'api')
+        self.assertEqual(e.trace.args, (42,))
+        self.assertEqual(e.error, None)
+        self.assertEqual(
+            [(s.depth, s.outcome) for s in e.steps],
+            [(0, 'match'), (1, 'url_miss'), (1, 'url_miss'), (1, 'url_miss'),
+             (1, 'match'), (2, 'match')])
+        data = e.as_dict()
+        self.assertTrue(data['matched'])
+        self.assertEqual(len(data['steps']), 6)
+
+    def test_no_match(self):
+        from routr.explain import explain
+        r = self.make_routes()
+
+        e = explain(r, Request.blank('/comments'))
+        self.assertTrue(isinstance(e.error, RouteGuarded))
+        self.assertEqual(e.steps[2].outcome, 'method_miss')
+
+        e = explain(r, Request.blank('/admin/users'))
+        self.assertTrue(isinstance(e.error, RouteGuarded))
+        self.assertEqual(e.steps[3].outcome, 'guarded')
+        self.assertEqual(e.steps[3].reason, 'admin_only: 403 Forbidden')
+
+        e = explain(r, Request.blank('/nothing'))
+        self.assertTrue(isinstance(e.error, NoURLPatternMatched))
+        self.assertEqual(e.steps[0].outcome, 'url_miss')
+
+    def test_sampler(self):
+        from routr.explain import Sampler
+        r = self.make_routes()
+        sampler = Sampler(r, every=2)
+        for _ in range(4):
+            self.assertEqual(sampler(Request.blank('/news')).target, 'news')
+        self.assertRaises(
+            NoURLPatternMatched, sampler, Request.blank('/nothing'))
+        self.assertRaises(
+            NoURLPatternMatched, sampler, Request.blank('/nothing'))
+        self.assertEqual(len(sampler.explanations), 3)
+
+
+class TestSegments(TestRouting):
+
+    def test_split_path(self):
+        from routr.utils import split_path, join_segments
+        for path in ('', '/', '/a', '/a/', '/a/b/c'):
+            self.assertEqual(join_segments(split_path(path)), path)
+        self.assertEqual(split_path('/a/b/'), ('a', 'b', ''))
+
+    def test_match(self):
+        r = route(
+            route('api',
+                  route('news', 'news'),
+                  route('news/{id:int}', 'news_item'),
+                  route('{a}-{b:int}', 'pair'),
+                  route('files/{p:path}/raw', 'raw')),
+            route('/', 'index'))
+        for path, target, args in (
+                ('/api/news', 'news', ()),
+                ('/api/news/42', 'news_item', (42,)),
+                ('/api/x-1', 'pair', ('x', 1)),
+                ('/api/files/a/b/raw', 'raw', ('a/b',)),
+                ('/', 'index', ())):
+            tr = r(Request.blank(path), segments=True)
+            self.assertEqual((tr.target, tr.args), (target, args))
+            self.assertEqual(len(tr.routes), 2 if target == 'index' else 3)
+
+        for path in ('/apifoo/news', '/api/newsfoo', '/api/news/42/',
+                     '/api/news/x', '/api/files/a/rawx'):
+            self.assertRaises(
+                NoURLPatternMatched, r, Request.blank(path), segments=True)
+
+    def test_method(self):
+        r = route(
+            route(GET, 'news', 'news_get'),
+            route(POST, 'news', 'news_post'))
+        req = Request.blank('/news', {'REQUEST_METHOD': 'POST'})
+        self.assertEqual(r(req, segments=True).target, 'news_post')
+        req = Request.blank('/news', {'REQUEST_METHOD': 'PUT'})
+        self.assertRaises(RouteGuarded, r, req, segments=True)
+
+    def test_host(self):
+        from routr.host import hosts, host
+        r = hosts(host('{tenant}.example.com', route('api', 'api')))
+        req = Request.blank('/api')
+        req.host = 'acme.example.com'
+        tr = r(req, segments=True)
+        self.assertEqual((tr.target, tr.args), ('api', ('acme',)))
+        req = Request.blank('/apifoo')
+        req.host = 'acme.example.com'
+        self.assertRaises(NoURLPatternMatched, r, req, segments=True)
+
+
+class TestQueryParams(TestRouting):
+
+    def test_match(self):
+        from routr.schema import qs, opt, many, Int, String, Bool
+        r = route(
+            'search',
+            qs(q=String, page=opt(Int, 1), tag=many(String),
+               exact=opt(Bool, False)),
+            'search')
+        tr = r(Request.blank('/search?q=news&tag=a&tag=b&exact=yes'))
+        self.assertEqual(
+            tr.kwargs,
+            {'q': 'news', 'page': 1, 'tag': ['a', 'b'], 'exact': True})
+        tr = r(Request.blank('/search?q=news&page=3'))
+        self.assertEqual(
+            tr.kwargs, {'q': 'news', 'page': 3, 'tag': [], 'exact': False})
+
+        self.assertRaises(
+            exc.HTTPBadRequest, r, Request.blank('/search?page=3'))
+        self.assertRaises(
+            exc.HTTPBadRequest, r, Request.blank('/search?q=a&page=x'))
+
+    def test_guarded(self):
+        from routr.schema import qs, Int
+        r = route(
+            route('search', qs(id=Int), 'by_id'),
+            route('search', qs(q=Int), 'by_q'))
+        self.assertEqual(r(Request.blank('/search?q=1')).target, 'by_q')
+        self.assertEqual(r(Request.blank('/search?id=1')).target, 'by_id')
+        self.assertRaises(RouteGuarded, r, Request.blank('/search?x=1'))
+
+    def test_converter(self):
+        from routr.schema import qs
+        from routr.urlpattern import Converter
+        r = route('items', qs(id=Converter('[0-9]+', int)), 'items')
+        self.assertEqual(r(Request.blank('/items?id=12')).kwargs, {'id': 12})
+        self.assertRaises(
+            exc.HTTPBadRequest, r, Request.blank('/items?id=abc'))
+        self.assertRaises(
+            exc.HTTPBadRequest, r, Request.blank('/items?id=12a'))
+
+    def test_parsed_once(self):
+        from routr.schema import parse_query
+        req = Request.blank('/?a=1&a=2&b=3')
+        params = parse_query(req)
+        self.assertEqual(params, {'a': ['1', '2'], 'b': ['3']})
+        self.assertTrue(parse_query(req) is params)
+        req.query_string = 'a=4'
+        self.assertEqual(parse_query(req), {'a': ['4']})
+
+
+class TestNegotiation(TestRouting):
+
+    def make_routes(self):
+        from routr.negotiation import variants
+        return variants(
+            'report',
+            route(GET, 'json', produces='application/json'),
+            route(GET, 'html',
+                  produces=['text/html', 'application/xhtml+xml']),
+            route(GET, 'csv', produces='text/csv'),
+            route(POST, 'upload_json', consumes='application/json'),
+            route(POST, 'upload_csv', consumes='text/csv'))
+
+    def accept(self, r, accept, method='GET', **kw):
+        req = Request.blank('/report', method=method, **kw)
+        if accept is not None:
+            req.headers['Accept'] = accept
+        return r(req)
+
+    def test_accept(self):
+        r = self.make_routes()
+        self.assertEqual(self.accept(r, None).target, 'json')
+        self.assertEqual(self.accept(r, 'text/html').target, 'html')
+        tr = self.accept(r, 'text/*;q=0.5, text/csv')
+        self.assertEqual((tr.target, tr.media_type), ('csv', 'text/csv'))
+        tr = self.accept(r, 'application/xhtml+xml;q=0.9, */*;q=0.1')
+        self.assertEqual(tr.target, 'html')
+        self.assertEqual(tr.media_type, 'application/xhtml+xml')
+        tr = self.accept(r, 'text/html;q=0, */*')
+        self.assertEqual(tr.target, 'json')
+        self.assertRaises(RouteGuarded, self.accept, r, 'image/png')
+
+    def test_content_type(self):
+        r = self.make_routes()
+        tr = self.accept(
+            r, None, method='POST', content_type='text/csv', body=b'a')
+        self.assertEqual(tr.target, 'upload_csv')
+        tr = self.accept(
+            r, None, method='POST', content_type='application/json',
+            body=b'{}')
+        self.assertEqual(tr.target, 'upload_json')
+        self.assertRaises(
+            RouteGuarded, self.accept, r, None, method='POST',
+            content_type='text/plain', body=b'a')
+
+    def test_no_match(self):
+        r = self.make_routes()
+        self.assertRaises(RouteGuarded, self.accept, r, None, method='PUT')
+        self.assertNoMatch(r, '/reports')
+
+    def test_changed_routes(self):
+        r = self.make_routes()
+        self.assertEqual(self.accept(r, 'text/csv').target, 'csv')
+        r.routes = [route(GET, 'new_csv', produces='text/csv')]
+        self.assertEqual(self.accept(r, 'text/csv').target, 'new_csv')
+        self.assertRaises(RouteGuarded, self.accept, r, 'application/json')
+
+
+class TestDispatcher(TestCase):
+
+    def test_dispatch(self):
+        from webob import Response
+        from routr.dispatch import Dispatcher
+
+        def news(id):
+            return Response('news %d' % id)
+
+        def comments(request, id):
+            return Response('comments %d %s' % (id, request.method))
+
+        app = Dispatcher(route(
+            route('news/{id:int}', news),
+            route(POST, 'news/{id:int}/comments', comments)))
+        self.assertEqual(
+            Request.blank('/news/1').get_response(app).text, 'news 1')
+        self.assertEqual(
+            Request.blank('/news/1/comments', method='POST')
+            .get_response(app).text, 'comments 1 POST')
+        self.assertEqual(
+            Request.blank('/news/1/comments').get_response(app).status_int,
+            405)
+        self.assertEqual(
+            Request.blank('/news').get_response(app).status_int, 404)
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        from webob import Response
+        from routr.cache import ResponseCache, CachePolicy
+        from routr.dispatch import Dispatcher
+        self.now = 0
+        self.calls = []
+
+        def view(id, request):
+            self.calls.append(id)
+            return Response('%s %s' % (id, request.accept))
+
+        self.app = Dispatcher(
+            route(
+                route('a/{id}', view, name='a', cache=10),
+                route('b/{id}', view, name='b',
+                      cache=CachePolicy(10, vary=['Accept'], max_entries=2)),
+                route(POST, 'a/{id}', view, cache=10)),
+            cache=ResponseCache(max_bytes=1000, clock=lambda: self.now))
+
+    def get(self, path, **kw):
+        return Request.blank(path, **kw).get_response(self.app)
+
+    def test_hit(self):
+        self.assertEqual(self.get('/a/1').text, self.get('/a/1').text)
+        self.assertEqual(self.calls, ['1'])
+        self.get('/a/2')
+        self.assertEqual(self.calls, ['1', '2'])
+        self.assertEqual(
+            (self.app.cache.hits, self.app.cache.misses), (1, 2))
+        self.get('/a/1', method='POST')
+        self.get('/a/1', method='POST')
+        self.assertEqual(self.calls, ['1', '2', '1', '1'])
+
+    def test_ttl(self):
+        self.get('/a/1')
+        self.now = 9
+        self.get('/a/1')
+        self.now = 10
+        self.get('/a/1')
+        self.assertEqual(self.calls, ['1', '1'])
+
+    def test_vary_and_max_entries(self):
+        self.get('/b/1', headers={'Accept': 'text/html'})
+        self.get('/b/1', headers={'Accept': 'application/json'})
+        self.get('/b/1', headers={'Accept': 'text/html'})
+        self.assertEqual(self.calls, ['1', '1'])
+        self.get('/b/2')
+        self.assertEqual(len(self.app.cache), 2)
+        self.get('/b/1', headers={'Accept': 'text/html'})
+        self.assertEqual(self.calls, ['1', '1', '2'])
+        self.get('/b/1', headers={'Accept': 'application/json'})
+        self.assertEqual(self.calls, ['1', '1', '2', '1'])
+
+    def test_max_bytes(self):
+        for i in range(100):
+            self.get('/a/%d' % i)
+        self.assertTrue(0 < self.app.cache.size <= 1000)
+        self.assertTrue(len(self.app.cache) < 100)
+        self.get('/a/99')
+        self.assertEqual(len(self.calls), 100)
+
+    def test_key(self):
+        from routr.dispatch import Dispatcher
+
+        class AnyMethod(Endpoint):
+            def match_method(self, request):
+                pass
+
+        view = self.app.routes.routes[0].target
+        self.app = Dispatcher(
+            AnyMethod(view, GET, None, [], '/{id}', cache=10))
+        self.get('/1')
+        self.get('/1', method='HEAD')
+        self.get('/1?x=1')
+        self.get('/1?x=2')
+        self.assertEqual(self.calls, ['1'] * 4)
+        self.assertEqual(len(self.app.cache), 4)
+        self.get('/1?x=1')
+        self.get('/1', method='HEAD')
+        self.assertEqual(self.calls, ['1'] * 4)
+
+    def test_not_stored(self):
+        from webob import Response
+        from routr.dispatch import Dispatcher
+
+        def view(kind):
+            self.calls.append(kind)
+            response = Response(kind)
+            if kind == 'cookie':
+                response.set_cookie('session', 'x')
+            else:
+                response.headers['Cache-Control'] = kind.replace('_', '-')
+            return response
+
+        self.app = Dispatcher(route('{kind}', view, cache=10))
+        kinds = ['cookie', 'private', 'no_store', 'no_cache']
+        for kind in kinds * 2:
+            self.assertEqual(self.get('/' + kind).text, kind)
+        self.assertEqual(self.calls, kinds * 2)
+        self.assertEqual(len(self.app.cache), 0)
+        self.get('/public')
+        self.get('/public')
+        self.assertEqual(self.calls[-1:], ['public'])
+        self.assertEqual(len(self.app.cache), 1)
+
+    def test_policy(self):
+        from routr.cache import CachePolicy
+        self.assertEqual(CachePolicy.coerce(5).ttl, 5)
+        self.assertEqual(CachePolicy.coerce({'ttl': 1.5}).ttl, 1.5)
+        self.assertIsNone(CachePolicy.coerce(False))
+        self.assertIsNone(CachePolicy.coerce(None))
+        self.assertRaises(RouteConfigurationError, CachePolicy.coerce, True)
+        self.assertRaises(RouteConfigurationError, CachePolicy.coerce, '5')
+
+    def test_disabled(self):
+        from routr.dispatch import Dispatcher
+        self.app = Dispatcher(route(
+            route('a', route('{id}', self.app.routes.routes[0].target,
+                             cache=10), cache=False)))
+        self.get('/a/1')
+        self.get('/a/1')
+        self.assertEqual(self.calls, ['1', '1'])
+        self.assertEqual(len(self.app.cache), 0)
+
+    def test_invalidate(self):
+        self.get('/a/1')
+        self.get('/b/1')
+        self.app.cache.invalidate('a')
+        self.get('/a/1')
+        self.get('/b/1')
+        self.assertEqual(self.calls, ['1', '1', '1'])
+        self.app.cache.invalidate()
+        self.assertEqual(
+            (len(self.app.cache), self.app.cache.size), (0, 0))
+
+
+class TestConditional(TestCase):
+
+    def setUp(self):
+        from datetime import datetime
+        from webob import Response
+        from routr.dispatch import Dispatcher
+        self.calls = []
+        self.versions = {1: 'v1', 2: None}
+
+        def view(id):
+            self.calls.append(id)
+            return Response('news %d' % id)
+
+        def version(id):
+            return self.versions[id]
+
+        def modified(request, id):
+            return datetime(2012, 1, id, 12, 0, 0, 500)
+
+        self.app = Dispatcher(route(
+            route('news/{id:int}', view, validator=version),
+            route('posts/{id:int}', view, validator=modified),
+            route(POST, 'news/{id:int}', view, validator=version)))
+
+    def get(self, path, **kw):
+        return Request.blank(path, **kw).get_response(self.app)
+
+    def test_etag(self):
+        response = self.get('/news/1')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.etag, 'v1')
+        response = self.get('/news/1', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.etag, 'v1')
+        self.assertEqual(self.calls, [1])
+        self.versions[1] = 'v2'
+        response = self.get('/news/1', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_no_validator(self):
+        response = self.get('/news/2', headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.etag, None)
+
+    def test_unsafe_method(self):
+        response = self.get(
+            '/news/1', method='POST', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_int, 200)
+
+    def test_last_modified(self):
+        response = self.get('/posts/2')
+        last_modified = response.headers['Last-Modified']
+        self.assertEqual(last_modified, 'Mon, 02 Jan 2012 12:00:00 GMT')
+        response = self.get(
+            '/posts/2', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_int, 304)
+        response = self.get(
+            '/posts/3', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(self.calls, [2, 3])
+
+
+class TestImportTime(TestCase):
+
+    # microseconds of cumulative import time with bytecode cached, it is
+    # about 15ms on a typical machine
+    budget = 40000
+
+    def run_python(self, *args, **kwargs):
+        import subprocess
+        process = subprocess.Popen(
+            (sys.executable,) + args,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=kwargs.get('env'))
+        out, err = process.communicate()
+        self.assertEqual(process.returncode, 0, err)
+        return out.decode('utf-8'), err.decode('utf-8')
+
+    def test_no_heavy_imports(self):
+        out, _ = self.run_python('-c', (
+            'import sys, routr\n'
+            'print(" ".join(sorted(sys.modules)))'))
+        modules = out.split()
+        for name in ('pkg_resources', 'webob', 'webob.exc', 'inspect',
+                     'routr.codegen', 'routr.schema', 'routr.explain',
+                     'routr.dispatch'):
+            self.assertNotIn(name, modules)
+
+    def import_time(self, env):
+        _, err = self.run_python(
+            '-X', 'importtime', '-c', 'import routr', env=env)
+        for line in err.splitlines():
+            parts = [p.strip() for p in line.split('|')]
+            if len(parts) == 3 and parts[2] == 'routr':
+                return int(parts[1])
+        self.fail('no import time reported for routr')
+
+    def test_budget(self):
+        if sys.version_info < (3, 8):
+            self.skipTest('requires Python 3.8')
+        import shutil
+        import tempfile
+        # bytecode is cached in a private directory first, so compiling
+        # sources isn't measured even if source tree isn't writable
+        cache = tempfile.mkdtemp(prefix='routr-pycache-')
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        try:
+            self.run_python('-c', 'import routr', env=env)
+            # the fastest of a few runs, so a busy machine doesn't fail it
+            best = min(self.import_time(env) for _ in range(3))
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+        self.assertLess(best, self.budget)
+
+
+class TestCodegen(TestCase):
+
+    def outcome(self, routes, path, method='GET'):
+        request = Request.blank(path, method=method)
+        try:
+            trace = routes(request)
+        except RouteGuarded as e:
+            return type(e), type(e.reason), e.response.status
+        except Exception as e:
+            return type(e), None, None
+        return trace.args, trace.kwargs, trace.routes, trace.payload
+
+    def test_same_as_routes(self):
+        from routr.codegen import compile_matcher
+        from routr.host import host
+
+        def forbid(request, trace):
+            if 'forbid' in request.GET:
+                raise exc.HTTPForbidden()
+            trace.kwargs['checked'] = True
+
+        def mark(request, trace):
+            trace.marked = True
+
+        routes = route(
+            route('/', 'index'),
+            route('/news/{id:int}', 'news'),
+            route(POST, '/news/{id:int}', 'news_post'),
+            route('/api', forbid,
+                  route('/users/{name}', 'user'),
+                  route('/items/{id:int}/{slug:slug}', mark, 'item'),
+                  route('/any/{x:any(a,ab)}', 'any')),
+            route('/{year:int(min=2000)}', mark,
+                  route('/{month:int}', 'month'),
+                  route('/', 'year')),
+            host('docs.example.com', route('/docs', 'docs')),
+            route('/files/{path:path}', 'files'))
+        matcher = compile_matcher(routes)
+        self.assertIn("path.startswith('/api')", matcher.source)
+        for path, method in [
+                ('/', 'GET'), ('/', 'POST'), ('/news/1', 'GET'),
+                ('/news/1', 'POST'), ('/news/1', 'PUT'), ('/news/x', 'GET'),
+                ('/api/users/a', 'GET'), ('/api/users/a?forbid', 'GET'),
+                ('/api/items/1/a-b', 'GET'), ('/api/items/1/a-b/', 'GET'),
+                ('/api/any/a', 'GET'), ('/api/any/ab', 'GET'),
+                ('/2012/10', 'GET'), ('/2012/', 'GET'), ('/1999/1', 'GET'),
+                ('/docs', 'GET'), ('/files/a/b.txt', 'GET'),
+                ('/files/', 'GET'), ('/nothing', 'GET')]:
+            self.assertEqual(
+                self.outcome(matcher, path, method),
+                self.outcome(routes, path, method), path)
+
+    def test_endpoint(self):
+        from routr.codegen import compile_matcher
+        r = route('/a', 'a')
+        matcher = compile_matcher(r)
+        self.assertEqual(matcher(Request.blank('/a')).target, 'a')
+        self.assertRaises(
+            NoURLPatternMatched, matcher, Request.blank('/b'))
+
+
+class TestComplexity(TestCase):
+
+    def setUp(self):
+        from routr.urlpattern import Converter
+
+        class Pattern(URLPattern):
+            typemap = {'evil': Converter('(a+)+')}
+
+        self.Pattern = Pattern
+
+    def complexity(self, pattern):
+        from routr.complexity import pattern_complexity
+        degree, problems = pattern_complexity(self.Pattern(pattern))
+        return degree, [kind for kind, _ in problems]
+
+    def test_pattern_complexity(self):
+        self.assertEqual(self.complexity('/a/{x}/{y:int}'), (1, []))
+        self.assertEqual(self.complexity('/{s:slug}'), (1, []))
+        self.assertEqual(self.complexity('/{d:date}/{u:uuid}'), (1, []))
+        self.assertEqual(
+            self.complexity('/{p:path}/edit'), (1, ['ambiguous']))
+        self.assertEqual(
+            self.complexity('/{a:int}{b:int}'), (1, ['ambiguous']))
+        self.assertEqual(
+            self.complexity('/{a:path}/{b:path}/edit'),
+            (2, ['ambiguous', 'ambiguous', 'polynomial']))
+        self.assertEqual(
+            self.complexity('/{x:evil}/z'), (None, ['exponential']))
+
+    def test_check(self):
+        import warnings
+        from routr.complexity import check, PatternComplexityWarning
+        routes = route(
+            route('/news/{id:int}', 'news'),
+            route('/{a:path}/{b:path}/edit', 'edit'))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            issues = check(routes)
+        self.assertEqual(len(issues), 3)
+        self.assertEqual(issues[0].route, routes.routes[1])
+        self.assertTrue(all(
+            w.category is PatternComplexityWarning for w in caught))
+        self.assertRaises(InvalidRoutePattern, check, routes, strict=True)
+        check(route('/news/{id:int}', 'news'), strict=True)
+
+    def test_limit(self):
+        from routr.complexity import limit
+        from routr.codegen import compile_matcher
+        from routr.dispatch import Dispatcher
+        from routr.exc import PathTooLong
+        routes = route(
+            route('/news/{id:int}', 'news'),
+            route('/{a:path}/{b:path}/edit', 'edit'))
+        limit(routes, max_path_length=200, max_work=10000)
+        self.assertEqual(routes.routes[0].pattern.max_length, None)
+        self.assertEqual(routes.routes[1].pattern.max_length, 100)
+        matcher = compile_matcher(routes)
+        for match in (routes, matcher):
+            self.assertEqual(
+                match(Request.blank('/a/b/edit')).args, ('a', 'b'))
+            self.assertRaises(
+                PathTooLong, match, Request.blank('/' + 'a/' * 60))
+            self.assertRaises(
+                PathTooLong, match, Request.blank('/news/' + '1' * 200))
+            self.assertEqual(
+                match(Request.blank('/news/1' + '0' * 150)).args,
+                (10 ** 150,))
+        response = Request.blank('/' + 'a/' * 60).get_response(
+            Dispatcher(routes))
+        self.assertEqual(response.status_int, 414)
+
+    def test_limit_is_per_route(self):
+        from routr.complexity import limit
+        from routr.codegen import compile_matcher
+        from routr.explain import explain
+        from routr.raw import raw
+        from routr.exc import PathTooLong
+
+        def routes():
+            return limit(route(
+                route('a/{x:path}/{y:path}/edit', 'slow'),
+                route('b', route('/{p:path}', 'fine'))), max_work=10000)
+
+        tree = routes()
+        self.assertEqual(tree.routes[0].pattern.max_length, 100)
+        long_path = '/b/' + 'x' * 2000
+        for match in (tree, compile_matcher(tree), raw(routes())):
+            trace = match(Request.blank(long_path))
+            self.assertEqual(trace.target, 'fine')
+            # too long for the only route which could match
+            self.assertRaises(
+                PathTooLong, match, Request.blank('/a/' + 'x/' * 100))
+            try:
+                match(Request.blank('/c/' + 'x' * 2000))
+            except PathTooLong:
+                self.fail('path without matching prefix is too long')
+            except NoURLPatternMatched:
+                pass
+        self.assertEqual(
+            explain(tree, Request.blank(long_path)).trace.target, 'fine')
+        self.assertIsInstance(
+            explain(tree, Request.blank('/a/' + 'x/' * 100)).error,
+            PathTooLong)
+
+    def test_max_path_length(self):
+        from routr.complexity import limit
+        from routr.explain import explain, Sampler
+        from routr.exc import PathTooLong
+
+        routes = limit(route(route('/{p:path}', 'any')), max_path_length=10)
+        request = Request.blank('/' + 'x' * 20)
+        self.assertRaises(PathTooLong, routes, request)
+        explanation = explain(routes, request)
+        self.assertIsInstance(explanation.error, PathTooLong)
+        self.assertIsNone(explanation.trace)
+        self.assertEqual(explanation.steps, [])
+        sampler = Sampler(routes, every=1)
+        self.assertRaises(PathTooLong, sampler, request)
+        self.assertEqual(sampler(Request.blank('/short')).target, 'any')
+
+
+class TestFuzz(TestCase):
+
+    def test_codegen(self):
+        from routr.fuzz import fuzz
+        from routr.codegen import compile_matcher
+        mismatch = fuzz(compile_matcher, iterations=60, seed='test')
+        self.assertIsNone(mismatch, str(mismatch))
+
+    def test_shrink(self):
+        from routr.fuzz import fuzz
+
+        def broken(routes):
+            def match(request):
+                try:
+                    return routes(request)
+                except MethodNotAllowed:
+                    raise NoURLPatternMatched()
+                except RouteGuarded as e:
+                    if isinstance(e.reason, MethodNotAllowed):
+                        raise NoURLPatternMatched()
+                    raise
+            return match
+
+        mismatch = fuzz(broken, iterations=60, seed='test')
+        self.assertIsNotNone(mismatch)
+        self.assertEqual(mismatch.expected[2], 'MethodNotAllowed')
+        self.assertEqual(mismatch.actual, ('raise', 'NoURLPatternMatched'))
+        self.assertEqual(mismatch.size, 2)
+        self.assertIn('request: ', str(mismatch))
+
+    def test_render(self):
+        import random
+        from routr.fuzz import (
+            Generator, Guard, build, render, outcome, _normalize)
+        for iteration in range(30):
+            generator = Generator(random.Random('render:%d' % iteration))
+            spec = generator.routes()
+            rendered = eval(render(spec), {
+                'route': route, 'GET': GET, 'POST': POST, 'Guard': Guard})
+            built = build(spec)
+            for _ in range(10):
+                request = generator.request(spec)
+                self.assertEqual(
+                    _normalize(outcome(rendered, request), rendered),
+                    _normalize(outcome(built, request), built),
+                    render(spec))
+
+
+class TestAnnotations(TestCase):
+
+    def setUp(self):
+        self.routes = route(
+            route('/api',
+                  route('/users', 'users', level='user', cache=10),
+                  route('/admin', 'admin', level='admin', rate=None),
+                  level='api', rate='low'),
+            route('/', 'index', cache=60))
+
+    def match(self, path):
+        return self.routes(Request.blank(path))
+
+    def test_outer_wins(self):
+        trace = self.match('/api/users')
+        self.assertEqual(trace.annotation('level'), 'api')
+        self.assertEqual(trace.annotation('cache'), 10)
+        self.assertEqual(trace.annotation('rate'), 'low')
+        self.assertEqual(trace.annotation('missing', 'default'), 'default')
+        self.assertEqual(
+            dict(trace.annotations),
+            {'level': 'api', 'cache': 10, 'rate': 'low'})
+        trace = self.match('/')
+        self.assertEqual(dict(trace.annotations), {'cache': 60})
+
+    def test_index(self):
+        shared = route('/e', 'e', level='endpoint')
+        r = route(
+            route('/a', shared, level='a'),
+            route('/b', shared))
+        index = r.annotations_index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(
+            r(Request.blank('/a/e')).annotation('level'), 'a')
+        self.assertEqual(
+            r(Request.blank('/b/e')).annotation('level'), 'endpoint')
+        self.assertNotIn('_chain_annotations', shared.__dict__)
+        self.assertIs(r.annotations_index(), index)
+
+        # index is rebuilt when route tree changes
+        r.routes[1].routes = [route('/e', 'e', level='new')]
+        self.assertIsNot(r.annotations_index(), index)
+        self.assertEqual(
+            r(Request.blank('/b/e')).annotation('level'), 'new')
+
+    def test_memoized(self):
+        a, b = self.match('/api/admin'), self.match('/api/admin')
+        self.assertIs(a._annotations(), b._annotations())
+        self.assertEqual(a.annotation('rate'), 'low')
+        if six.PY3:
+            from operator import setitem
+            self.assertRaises(
+                TypeError, setitem, a.annotations, 'rate', 'high')
+
+    def test_routes_changed(self):
+        trace = self.match('/api/admin')
+        self.assertEqual(trace.annotation('level'), 'api')
+        trace.routes = trace.routes[2:]
+        self.assertEqual(trace.annotation('level'), 'admin')
+        self.assertEqual(trace.annotation('rate'), None)
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        from routr.static import static
+
+        def guard(request, trace):
+            pass
+
+        self.routes = route(
+            route('/', 'index'),
+            route('news', 'news'),
+            route(POST, 'news', 'create'),
+            route('news/{id:int}', 'get'),
+            route('news/{id:int(min=5)}/edit', 'edit'),
+            route('admin', guard, route('users', 'users')),
+            route('api', route('v/{x}', 'v'), route('health', 'health')),
+            static('/static', '/var/www'),
+            static('/admin/static', '/var/admin'),
+            static('/api/v', '/var/api'))
+
+    def test_rules(self):
+        from routr.export import rules
+        result = dict(
+            ('%s %s' % (r.method, r.pattern), r) for r in rules(self.routes))
+        self.assertEqual(result['GET /'].exact, ('/',))
+        self.assertEqual(result['GET /news'].methods, ['GET', 'POST'])
+        self.assertEqual(result['POST /news'].methods, ['GET', 'POST'])
+        self.assertEqual(result['GET /news/{id:int}'].reason, 'overlap')
+        self.assertEqual(
+            result['GET /news/{id:int(min=5)}/edit'].reason, 'converter')
+        self.assertEqual(result['GET /admin/users'].reason, 'guarded')
+        self.assertTrue(result['GET /admin/users'].upstream_only)
+        rule = result['GET /api/v/{x}']
+        self.assertEqual(rule.methods, ['GET'])
+        self.assertTrue(rule.matches('/api/v/1'))
+        self.assertFalse(rule.matches('/api/v/1/2'))
+        self.assertEqual(
+            result['GET /static/{path:path}'].directory, '/var/www')
+        self.assertEqual(
+            result['GET /admin/static/{path:path}'].directory, '/var/admin')
+        # /api/v/{x} can match the same paths
+        rule = result['GET /api/v/{path:path}']
+        self.assertIsNone(rule.directory)
+        self.assertEqual(rule.methods, ['GET'])
+        self.assertEqual(rule.as_dict()['upstream_only'], False)
+
+    def test_opaque(self):
+        from routr.host import host
+        from routr.export import rules
+        result = rules(route(
+            route('news', 'news'),
+            route('api', host('example.com', route('x', 'x')))))
+        self.assertEqual(result[0].methods, ['GET'])
+        self.assertEqual(result[1].reason, 'opaque')
+        self.assertEqual(result[1].prefix, '/api')
+
+    def test_nginx(self):
+        from routr.export import nginx
+        config = nginx(self.routes, upstream='http://backend')
+        self.assertIn('location = /news {', config)
+        self.assertIn('^(GET|POST)$', config)
+        self.assertEqual(config.count('location = /news {'), 1)
+        self.assertIn('location ~ "^/api/v/([^/]+)$" {', config)
+        self.assertIn('location ^~ /static/ {\n', config)
+        self.assertIn('    alias /var/www/;\n', config)
+        self.assertIn('# upstream-only (guarded): GET /admin/users', config)
+        self.assertNotIn('/admin/users {', config)
+        self.assertTrue(config.endswith(
+            'location / {\n    proxy_pass http://backend;\n}\n'))
+
+
+class TestMount(TestCase):
+
+    def app(self, environ, start_response):
+        body = ('%s|%s' % (
+            environ['SCRIPT_NAME'], environ['PATH_INFO'])).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [body]
+
+    def call(self, dispatcher, path, **kw):
+        return Request.blank(path, **kw).get_response(dispatcher)
+
+    def test_prefix(self):
+        from routr.mount import mount
+        r = mount('/legacy/', self.app)
+        self.assertEqual(r.split('/legacy'), '')
+        self.assertEqual(r.split('/legacy/a'), '/a')
+        self.assertIsNone(r.split('/legacya'))
+        self.assertRaises(RouteConfigurationError, mount, '/', self.app)
+        self.assertRaises(RouteConfigurationError, mount, '/a')
+
+    def test_fast_path(self):
+        from routr.mount import mount, MountIndex
+        from routr.dispatch import Dispatcher
+
+        def news():
+            return 'news'
+
+        routes = route(
+            mount('/legacy/old', self.app),
+            mount('/legacy', self.app),
+            route('/news', news),
+            mount('/news', self.app),
+            route('/ab{x}', news),
+            mount('/abc', self.app),
+            mount('/other', self.app))
+        index = MountIndex.from_routes(routes)
+        self.assertEqual(
+            [m.prefix for ms in index.index.values() for m in ms],
+            ['/legacy/old', '/legacy', '/other'])
+
+        environ = Request.blank('/legacy/old/page').environ
+        environ['SCRIPT_NAME'] = '/app'
+        self.assertIs(index.resolve(environ), routes.routes[0])
+        self.assertEqual(environ['SCRIPT_NAME'], '/app/legacy/old')
+        self.assertEqual(environ['PATH_INFO'], '/page')
+        self.assertIsNone(index.resolve(Request.blank('/news').environ))
+
+        class Dispatcher(Dispatcher):
+            def request_cls(self, environ):
+                raise AssertionError('request constructed')
+
+        dispatcher = Dispatcher(routes)
+        self.assertEqual(
+            self.call(dispatcher, '/legacy/a').text, '/legacy|/a')
+        self.assertEqual(self.call(dispatcher, '/legacy').text, '/legacy|')
+        self.assertEqual(self.call(dispatcher, '/other/').text, '/other|/')
+
+    def test_matched(self):
+        from routr.mount import mount
+        from routr.dispatch import Dispatcher
+
+        def guard(request, trace):
+            if 'key' not in request.GET:
+                raise exc.HTTPForbidden()
+
+        routes = route(
+            route('/api', mount('/v1', self.app)),
+            mount('/admin', guard, self.app),
+            route('/{x}', 'x'))
+        dispatcher = Dispatcher(routes)
+        self.assertEqual(len(dispatcher.mounts), 0)
+        self.assertEqual(
+            self.call(dispatcher, '/api/v1/a').text, '/api/v1|/a')
+        self.assertEqual(
+            self.call(dispatcher, '/admin/a?key').text, '/admin|/a')
+        self.assertEqual(self.call(dispatcher, '/admin/a').status_int, 403)
+
+        # index is rebuilt when routes change
+        routes.routes = [mount('/api', self.app)] + routes.routes
+        self.assertEqual(len(dispatcher.mounts), 1)
+        self.assertEqual(self.call(dispatcher, '/api/v1').text, '/api|/v1')
+
+    def test_annotated(self):
+        from routr.mount import mount
+        from routr.dispatch import Dispatcher
+
+        dispatcher = Dispatcher(route(
+            mount('/legacy', self.app, concurrency=1),
+            mount('/other', self.app)))
+        self.assertEqual(
+            [m.prefix for ms in dispatcher.mounts.index.values() for m in ms],
+            ['/other'])
+        self.assertEqual(self.call(dispatcher, '/legacy/a').text, '/legacy|/a')
+        self.assertEqual(self.call(dispatcher, '/other/a').text, '/other|/a')
+        gauge, = dispatcher.limiter.gauges.values()
+        self.assertEqual(gauge.admitted, 1)
+
+        # annotations of top level group apply to all mounts in it
+        dispatcher = Dispatcher(route(
+            mount('/legacy', self.app), concurrency=1))
+        self.assertEqual(len(dispatcher.mounts), 0)
+        self.assertEqual(self.call(dispatcher, '/legacy/a').text, '/legacy|/a')
+        gauge, = dispatcher.limiter.gauges.values()
+        self.assertEqual(gauge.admitted, 1)
+
+    def test_cached(self):
+        from webob import Response
+        from routr.mount import mount
+        from routr.dispatch import Dispatcher
+
+        dispatcher = Dispatcher(route(
+            mount('/legacy', self.app, cache=60),
+            route('news', lambda: Response('news'), name='news', cache=60)))
+        self.assertEqual(self.call(dispatcher, '/legacy/a').text, '/legacy|/a')
+        self.assertEqual(self.call(dispatcher, '/news').text, 'news')
+        self.assertEqual(len(dispatcher.cache), 2)
+        dispatcher.cache.invalidate('news')
+        self.assertEqual(len(dispatcher.cache), 1)
+        dispatcher.cache.invalidate()
+        self.assertEqual(len(dispatcher.cache), 0)
+
+
+class TestLimits(TestCase):
+
+    def wait_for(self, predicate):
+        import time
+        for _ in range(500):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail('condition not reached')
+
+    def test_policy(self):
+        from routr.dispatch import Dispatcher
+        from routr.limits import ConcurrencyPolicy
+        self.assertIsNone(ConcurrencyPolicy.coerce(False))
+        self.assertIsNone(ConcurrencyPolicy.coerce(None))
+        self.assertEqual(ConcurrencyPolicy.coerce(2).max_concurrency, 2)
+        self.assertEqual(
+            ConcurrencyPolicy.coerce(dict(max_concurrency=3)).max_concurrency,
+            3)
+        for value in (0, -1, True, 1.5, '2', dict(max_concurrency=0),
+                      ConcurrencyPolicy(None)):
+            self.assertRaises(
+                RouteConfigurationError, ConcurrencyPolicy.coerce, value)
+
+        app = Dispatcher(route('a', lambda: 'a', concurrency=False))
+        self.assertEqual(app.dispatch(Request.blank('/a')), 'a')
+        self.assertEqual(app.limiter.gauges, {})
+
+    def test_hand_over(self):
+        import threading
+        from routr.limits import Limiter, ConcurrencyPolicy
+        limiter = Limiter()
+        gauge = limiter.create_gauge(
+            None, ConcurrencyPolicy(1, max_queue=1, timeout=5))
+        self.assertTrue(limiter.acquire(gauge))
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(limiter.acquire(gauge)))
+        waiter.start()
+        self.wait_for(lambda: gauge.queued == 1)
+
+        # freed slot goes to the waiting request, not to a new one
+        limiter.release(gauge)
+        self.assertEqual(gauge.in_flight, 1)
+        gauge.policy.timeout = 0.01
+        self.assertFalse(limiter.acquire(gauge))
+        waiter.join()
+        self.assertEqual(results, [True])
+        limiter.release(gauge)
+        self.assertEqual(
+            (gauge.in_flight, gauge.queued, gauge.admitted, gauge.rejected),
+            (0, 0, 2, 1))
+
+    def test_threaded(self):
+        import threading
+        from routr.dispatch import Dispatcher
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return 'slow'
+
+        app = Dispatcher(route(
+            route('slow', slow,
+                  concurrency=dict(max_concurrency=1, max_queue=1,
+                                   retry_after=7)),
+            route('fast', lambda: 'fast'),
+            route('timeout', slow, concurrency=dict(
+                max_concurrency=1, max_queue=1, timeout=0.01))))
+        results = []
+
+        def get(path='/slow'):
+            results.append(app.dispatch(Request.blank(path)))
+
+        threads = [threading.Thread(target=get) for _ in range(2)]
+        for t in threads:
+            t.start()
+        gauge = lambda: app.limiter.snapshot()['GET /slow -> %r' % slow]
+        self.wait_for(lambda: app.limiter.gauges and gauge()['queued'] == 1)
+        self.assertEqual(gauge()['in_flight'], 1)
+
+        response = app.dispatch(Request.blank('/slow'))
+        self.assertEqual(response.status_int, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+        self.assertEqual(app.dispatch(Request.blank('/fast')), 'fast')
+
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['slow', 'slow'])
+        self.assertEqual(
+            (gauge()['in_flight'], gauge()['admitted'], gauge()['rejected']),
+            (0, 2, 1))
+
+        release.clear()
+        blocker = threading.Thread(target=get, args=('/timeout',))
+        blocker.start()
+        timeout = lambda: app.limiter.snapshot()['GET /timeout -> %r' % slow]
+        self.wait_for(lambda: len(app.limiter.gauges) == 2
+                      and timeout()['in_flight'] == 1)
+        response = app.dispatch(Request.blank('/timeout'))
+        self.assertEqual(response.status_int, 503)
+        release.set()
+        blocker.join()
+        self.assertEqual(results[-1], 'slow')
+
+    def test_group(self):
+        from routr.dispatch import Dispatcher
+        from routr.limits import Limiter
+        app = Dispatcher(route(
+            'reports',
+            route('a', lambda: 'a'), route('b', lambda: 'b'),
+            concurrency=1))
+        self.assertIsInstance(app.limiter, Limiter)
+        app.dispatch(Request.blank('/reports/a'))
+        app.dispatch(Request.blank('/reports/b'))
+        gauge, = app.limiter.gauges.values()
+        self.assertIs(gauge.route, app.routes)
+        self.assertEqual(gauge.admitted, 2)
+
+
+class TestCoalesce(TestCase):
+
+    def wait_for(self, predicate):
+        import time
+        for _ in range(500):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail('condition not reached')
+
+    def test_policy(self):
+        from routr.coalesce import CoalescePolicy
+        self.assertEqual(CoalescePolicy.coerce(True).timeout, 30)
+        self.assertEqual(CoalescePolicy.coerce(5).timeout, 5)
+        self.assertEqual(
+            CoalescePolicy.coerce({'vary': ['Accept']}).vary, ('Accept',))
+        self.assertIsNone(CoalescePolicy.coerce(False))
+        self.assertIsNone(CoalescePolicy.coerce(None))
+        self.assertRaises(
+            RouteConfigurationError, CoalescePolicy.coerce, '5')
+
+    def test_disabled(self):
+        from routr.dispatch import Dispatcher
+        calls = []
+
+        def page(id):
+            calls.append(id)
+            return 'page %s' % id
+
+        app = Dispatcher(route(
+            route('page/{id}', page, coalesce=False),
+            route('off', route('{id}', page, coalesce=True),
+                  coalesce=False)))
+        self.assertEqual(
+            app.dispatch(Request.blank('/page/1')), 'page 1')
+        self.assertEqual(app.dispatch(Request.blank('/off/2')), 'page 2')
+        self.assertEqual(calls, ['1', '2'])
+        self.assertEqual(app.coalescer.executions, 0)
+
+    def test_threaded(self):
+        import threading
+        from webob import Response
+        from routr.dispatch import Dispatcher
+        release = threading.Event()
+        calls = []
+
+        def page(id):
+            calls.append(id)
+            release.wait(5)
+            if id == 'error':
+                raise ValueError(id)
+            return Response('page %s' % id)
+
+        app = Dispatcher(route(
+            route('page/{id}', page, coalesce=True),
+            route(POST, 'page/{id}', page, coalesce=True),
+            route('wait/{id}', page, coalesce=0.01)))
+        results = []
+
+        def get(path, method='GET'):
+            try:
+                response = app.dispatch(Request.blank(path, method=method))
+            except ValueError as e:
+                response = e
+            results.append((path, response))
+
+        threads = [
+            threading.Thread(target=get, args=args)
+            for args in [('/page/1',)] * 3 + [
+                ('/page/1?q',), ('/page/2',), ('/page/1', 'POST'),
+                ('/wait/w',)]]
+        for t in threads:
+            t.start()
+        self.wait_for(lambda: app.coalescer.coalesced == 2 and len(calls) == 5)
+        # follower of /wait/w doesn't wait for too long
+        response = app.dispatch(Request.blank('/wait/w'))
+        self.assertEqual(response.status_int, 504)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(calls), ['1', '1', '1', '2', 'w'])
+        bodies = sorted(r.text for _, r in results)
+        self.assertEqual(bodies, ['page 1'] * 5 + ['page 2', 'page w'])
+        self.assertEqual(len(set(id(r) for _, r in results)), 7)
+        self.assertEqual(app.coalescer.timeouts, 1)
+
+        release.clear()
+        del results[:]
+        threads = [
+            threading.Thread(target=get, args=('/page/error',))
+            for _ in range(2)]
+        for t in threads:
+            t.start()
+        self.wait_for(lambda: app.coalescer.coalesced == 4)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(
+            [type(r) for _, r in results], [ValueError, ValueError])
+
+
+class TestRaw(TestCase):
+
+    def routes(self):
+        from routr.raw import raw
+        return raw(route(
+            route('/news', 'news'),
+            route('/news/{id:int}', 'item'),
+            route(u'/caf\xe9/{x}', 'cafe', name='cafe'),
+            route('/tags', route('/{tag}', 'tag'))))
+
+    def test_match(self):
+        r = self.routes()
+        for path, target, args in (
+                ('/news', 'news', ()),
+                ('/news/1', 'item', (1,)),
+                ('/caf%C3%A9/x', 'cafe', ('x',)),
+                ('/tags/%C3%A9t%C3%A9', 'tag', (u'\xe9t\xe9',))):
+            for segments in (False, True):
+                trace = r(Request.blank(path), segments=segments)
+                self.assertEqual(trace.target, target)
+                self.assertEqual(trace.args, args)
+                self.assertEqual(
+                    [type(a) for a in trace.args],
+                    [type(a) for a in args])
+        self.assertRaises(
+            NoURLPatternMatched, r, Request.blank('/caf%E9/x'))
+        # not valid UTF-8
+        self.assertRaises(
+            NoURLPatternMatched, r, Request.blank('/tags/%FF'))
+        self.assertEqual(r.reverse('cafe', u'\xe9'), u'/caf\xe9/\xe9')
+
+    def test_same_as_decoded(self):
+        from routr.codegen import compile_matcher
+        from routr.explain import explain
+        r = self.routes()
+        matcher = compile_matcher(r)
+        decoded = route(
+            route('/news', 'news'),
+            route('/news/{id:int}', 'item'),
+            route(u'/caf\xe9/{x}', 'cafe'),
+            route('/tags', route('/{tag}', 'tag')))
+        for path in ('/news/1', '/caf%C3%A9/%C3%A9', '/tags/a%C3%A9'):
+            request = Request.blank(path)
+            self.assertEqual(r(request).args, decoded(request).args)
+            self.assertEqual(matcher(request).args, decoded(request).args)
+            self.assertEqual(
+                explain(r, request).trace.args, decoded(request).args)
+
+    def test_mount(self):
+        from routr.raw import raw
+        from routr.mount import mount
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            body = environ['SCRIPT_NAME'] + '|' + environ['PATH_INFO']
+            return [body.encode('latin-1') if six.PY3 else body]
+
+        r = raw(route(route('/a', mount(u'/\xe9', app))))
+        request = Request.blank('/a/%C3%A9/%C3%A9')
+        trace = r(request)
+        self.assertEqual(trace.endpoint.prefix, u'/\xe9')
+        response = trace.endpoint.respond(request, trace)
+        self.assertEqual(
+            response.body, (u'/a/\xe9|/\xe9').encode('utf-8'))
+
+    def test_custom_pattern_class(self):
+        from routr.raw import raw, RawURLPattern
+
+        class Pattern(URLPattern):
+            pass
+
+        self.assertRaises(
+            RouteConfigurationError, raw,
+            route(route('/a', 'a', url_pattern_cls=Pattern)))
+        r = raw(route('/a', 'a', url_pattern_cls=RawURLPattern))
+        self.assertTrue(r.raw_path)
+
+
+class TestLoadTest(TestCase):
+
+    def test_generate(self):
+        from routr.loadtest import generate
+        generated = generate({'dynamic': 1, 'notallowed': 1}, 50, seed=1)
+        self.assertEqual(generated, generate(
+            {'dynamic': 1, 'notallowed': 1}, 50, seed=1))
+        self.assertEqual(
+            set(kind for kind, _, _ in generated),
+            set(['dynamic', 'notallowed']))
+        self.assertRaises(ValueError, generate, {'other': 1}, 1)
+        self.assertRaises(ValueError, generate, {'static': 0}, 1)
+
+    def test_run(self):
+        from routr.loadtest import run
+        for in_process in (True, False):
+            report = run(requests=40, concurrency=3, in_process=in_process)
+            self.assertEqual(report.requests, 40)
+            self.assertEqual(report.unexpected, 0)
+            self.assertEqual(
+                sum(report.statuses.values()), 40)
+            self.assertEqual(
+                sum(len(v) for v in report.latencies.values()), 40)
+            self.assertTrue(report.throughput > 0)
+            self.assertTrue(
+                report.percentile(50) <= report.percentile(99))
+            self.assertEqual(report.as_dict()['requests'], 40)
+            self.assertIn('p99', str(report))
+
+
+class TestReplay(TestCase):
+
+    log = [
+        '127.0.0.1 - - [10/Oct/2012:13:55:36 +0400] "GET /news/42 HTTP/1.1"'
+        ' 200 2326',
+        '127.0.0.1 - frank [10/Oct/2012:13:55:37 +0400] "GET /news/43?x=1'
+        ' HTTP/1.1" 200 2326 "http://example.com/" "Mozilla/5.0"',
+        '127.0.0.1 - - [10/Oct/2012:13:55:38 +0400] "POST /news/43 HTTP/1.0"'
+        ' 405 0',
+        '127.0.0.1 - - [10/Oct/2012:13:55:39 +0400] "GET /missing HTTP/1.1"'
+        ' 404 0',
+        '127.0.0.1 - - [10/Oct/2012:13:55:40 +0400] "GET /api/items/'
+        '6ba7b810-9dad-11d1-80b4-00c04fd430c8 HTTP/1.1" 200 10',
+        'garbage',
+    ]
+
+    def routes(self):
+        return route(
+            route(GET, '/', 'index'),
+            route(GET, '/news/{id:int}', 'news'),
+            route('/api', route(GET, '/items/{id:uuid}', 'item')))
+
+    def test_parse(self):
+        from routr.replay import parse_line, shape
+        self.assertEqual(parse_line(self.log[0]), ('GET', '/news/42'))
+        self.assertEqual(parse_line(self.log[1]), ('GET', '/news/43?x=1'))
+        self.assertIsNone(parse_line(self.log[-1]))
+        self.assertEqual(shape('GET', '/news/42?x=1'), 'GET /news/{int}')
+        self.assertEqual(
+            shape('GET', '/a/6ba7b810-9dad-11d1-80b4-00c04fd430c8/'
+                         '0123456789abcdef0'),
+            'GET /a/{uuid}/{hex}')
+
+    def test_replay(self):
+        from routr.replay import replay
+        report = replay(self.routes(), self.log, repeat=2)
+        self.assertEqual(report.requests, 5)
+        self.assertEqual(report.skipped, 1)
+        self.assertEqual(
+            dict((k, s.count) for k, s in report.routes.items()),
+            {"GET /news/{id:int} -> 'news'": 2,
+             "GET /api/items/{id:uuid} -> 'item'": 1,
+             '<405 Method Not Allowed>': 1,
+             '<404 Not Found>': 1})
+        self.assertEqual(
+            sorted((k, s.count) for k, s in report.shapes.items()),
+            [('GET /api/items/{uuid}', 1), ('GET /missing', 1),
+             ('GET /news/{int}', 2), ('POST /news/{int}', 1)])
+        # matching GET /news/* stops at news endpoint, POST /news/43 and
+        # /missing visit api group as well
+        self.assertEqual(report.visited, {3: 2, 4: 2, 5: 1})
+        self.assertEqual(len(report.slowest(2)), 2)
+        self.assertEqual(report.as_dict(top=1)['requests'], 5)
+        self.assertIn('slowest URL shapes', str(report))
+
+
+class TestTemplate(TestCase):
+
+    def template(self):
+        from routr.template import RouteTemplate
+        return RouteTemplate(route(
+            route(GET, '/', 'index', name='index'),
+            route('/news',
+                  route(GET, '/{id:int}', 'news', name='news'),
+                  route(POST, '/', 'create', name='create')),
+            route('/about', route(GET, '/', 'about', name='about'))))
+
+    def test_group(self):
+        template = self.template()
+        tenants = template.group('/{tenant}', tenants=['acme', 'initech'], x=1)
+        r = route(tenants, route(GET, '/other', 'other'))
+        for segments in (False, True):
+            trace = r(Request.blank('/acme/news/1'), segments=segments)
+            self.assertEqual(trace.target, 'news')
+            self.assertEqual(trace.args, ('acme', 1))
+            trace = r(Request.blank('/initech/'), segments=segments)
+            self.assertEqual(trace.target, 'index')
+            self.assertEqual(trace.args, ('initech',))
+            self.assertEqual(trace.annotation('x'), 1)
+            self.assertEqual(
+                r(Request.blank('/other'), segments=segments).target,
+                'other')
+            self.assertRaises(
+                NoURLPatternMatched, r, Request.blank('/globex/news/1'),
+                segments=segments)
+            self.assertRaises(
+                RouteGuarded, r, Request.blank('/acme/news/1', method='PUT'),
+                segments=segments)
+        self.assertIs(tenants.resolve('acme'), template.routes)
+        self.assertIs(tenants.resolve('initech'), template.routes)
+        self.assertEqual(r.reverse('news', 'acme', 2), '/acme/news/2')
+
+        tenants.add('globex')
+        self.assertEqual(
+            r(Request.blank('/globex/news/1')).args, ('globex', 1))
+
+        # any tenant is served if they aren't listed
+        anyone = template.group('/t/{tenant:int}')
+        self.assertEqual(
+            anyone(Request.blank('/t/42/about/')).args, (42,))
+        self.assertRaises(
+            RouteConfigurationError, template.group, '/tenants')
+
+    def test_version(self):
+        template = self.template()
+        r = route(template.group('/{tenant}'))
+        version = r.version
+        template.group('/{tenant}')
+        template.group('/t/{tenant}', overrides={'c': {'news': 'custom'}})
+        self.assertEqual(r.version, version)
+
+    def test_overrides(self):
+        template = self.template()
+        shared = template.routes
+        news_group = shared.routes[1]
+        tenants = template.group('/{tenant}', overrides={'c': {
+            'news': 'custom_news',
+            'about': route(GET, '/', 'custom_about')}})
+        root = tenants.trees['c']
+        self.assertIsNot(root, shared)
+        # only groups on the way to overridden routes are copied
+        self.assertIs(root.routes[0], shared.routes[0])
+        self.assertIsNot(root.routes[1], news_group)
+        self.assertIs(root.routes[1].routes[1], news_group.routes[1])
+        self.assertIs(root.routes[1].pattern, news_group.pattern)
+        overridden = root.routes[1].routes[0]
+        self.assertIs(overridden.pattern, news_group.routes[0].pattern)
+        self.assertEqual(overridden.name, 'news')
+
+        trace = tenants(Request.blank('/c/news/1'))
+        self.assertEqual((trace.target, trace.args), ('custom_news', ('c', 1)))
+        self.assertEqual(
+            tenants(Request.blank('/c/about/')).target, 'custom_about')
+        # template is intact
+        self.assertEqual(tenants(Request.blank('/p/news/1')).target, 'news')
+        self.assertEqual(tenants(Request.blank('/p/about/')).target, 'about')
+        tenants.add('c')
+        self.assertEqual(tenants(Request.blank('/c/news/1')).target, 'news')
+
+        self.assertRaises(
+            RouteConfigurationError, template.group, '/{tenant}',
+            overrides={'c': {'nope': 'x'}})
+
+
+if sys.version_info >= (3, 5):
+    # asyncio tests use syntax which doesn't compile on older Pythons
+    from routr.tests_aio import *  # noqa
@@ -0,0 +1,183 @@
+"""
+
+    routr.tests_aio -- test suite for asyncio support
+    =================================================
+
+    Tests use ``async def`` syntax so this module is imported by
+    :mod:`routr.tests` only on Python 3.5 or later.
+
+"""
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import os
+import asyncio
+import threading
+
+from webob import Request
+
+from routr import route, RouteConfigurationError
+from routr.aio import AsyncDispatcher, AsyncLimiter, AsyncCoalescer
+from routr.executors import Executors
+
+
+__all__ = ('TestAsyncDispatcher', 'TestAsyncLimits', 'TestAsyncCoalesce')
+
+
+def offloaded(id, page=1):
+    return (id, page, os.getpid())
+
+
+class TestAsyncDispatcher(TestCase):
+
+    def setUp(self):
+
+        async def coro(id):
+            return ('coro', id)
+
+        def inline(request, id):
+            return ('inline', id, threading.current_thread().name)
+
+        def threaded(id, request):
+            return ('thread', id, threading.current_thread().name)
+
+        async def version(id):
+            return 'v%d' % id
+
+        self.app = AsyncDispatcher(
+            route(
+                route('coro/{id:int}', coro),
+                route('inline/{id:int}', inline),
+                route('thread/{id:int}', threaded, executor='small'),
+                route('process/{id:int}', offloaded, executor='process'),
+                route('lambda/{id:int}', lambda id: id, executor='process'),
+                route('bad/{id:int}', inline, executor='process'),
+                route('validated/{id:int}', coro, validator=version)),
+            executors=Executors(small=1))
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.app.close()
+        self.loop.close()
+
+    def get(self, path, **kwargs):
+        return self.loop.run_until_complete(
+            self.app.dispatch(Request.blank(path, **kwargs)))
+
+    def test_inline(self):
+        main = threading.current_thread().name
+        self.assertEqual(self.get('/coro/1'), ('coro', 1))
+        self.assertEqual(self.get('/inline/1'), ('inline', 1, main))
+        self.assertEqual(self.get('/nothing').status_int, 404)
+
+    def test_thread(self):
+        kind, id, name = self.get('/thread/1')
+        self.assertEqual((kind, id), ('thread', 1))
+        self.assertNotEqual(name, threading.current_thread().name)
+        self.assertEqual(self.app.executors.pool('small').max_workers, 1)
+
+    def test_process(self):
+        id, page, pid = self.get('/process/2')
+        self.assertEqual((id, page), (2, 1))
+        self.assertNotEqual(pid, os.getpid())
+
+    def test_process_misconfigured(self):
+        self.assertRaises(RouteConfigurationError, self.get, '/lambda/1')
+        self.assertRaises(RouteConfigurationError, self.get, '/bad/1')
+
+    def test_coroutine_validator(self):
+        response = self.get(
+            '/validated/3', headers={'If-None-Match': '"v3"'})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.etag, 'v3')
+        self.assertEqual(
+            self.get('/validated/3', headers={'If-None-Match': '"v2"'}),
+            ('coro', 3))
+
+
+class TestAsyncLimits(TestCase):
+
+    def test_limits(self):
+        loop = asyncio.new_event_loop()
+        events = {}
+
+        async def slow():
+            await events['release'].wait()
+            return 'slow'
+
+        app = AsyncDispatcher(route(
+            route('slow', slow,
+                  concurrency=dict(max_concurrency=1, max_queue=2)),
+            route('timeout', slow, concurrency=dict(
+                max_concurrency=1, max_queue=1, timeout=0.01))))
+        self.assertIsInstance(app.limiter, AsyncLimiter)
+
+        async def scenario():
+            release = events['release'] = asyncio.Event()
+            get = lambda path: asyncio.ensure_future(
+                app.dispatch(Request.blank(path)))
+            first, second, third = get('/slow'), get('/slow'), get('/slow')
+            await asyncio.sleep(0)
+            rejected = await app.dispatch(Request.blank('/slow'))
+            gauge, = app.limiter.gauges.values()
+            numbers = (gauge.in_flight, gauge.queued)
+            blocker = get('/timeout')
+            await asyncio.sleep(0)
+            timed_out = await app.dispatch(Request.blank('/timeout'))
+            release.set()
+            results = await asyncio.gather(first, second, third, blocker)
+            return rejected, numbers, timed_out, results
+
+        try:
+            rejected, numbers, timed_out, results = loop.run_until_complete(
+                scenario())
+        finally:
+            app.close()
+            loop.close()
+        self.assertEqual(rejected.status_int, 503)
+        self.assertEqual(numbers, (1, 2))
+        self.assertEqual(timed_out.status_int, 503)
+        self.assertEqual(results, ['slow'] * 4)
+        gauge = app.limiter.gauges[app.routes.routes[0]]
+        self.assertEqual((gauge.in_flight, gauge.admitted), (0, 3))
+
+
+class TestAsyncCoalesce(TestCase):
+
+    def test_coalesce(self):
+        loop = asyncio.new_event_loop()
+        events = {}
+        calls = []
+
+        async def page(id):
+            calls.append(id)
+            await events['release'].wait()
+            return 'page %s' % id
+
+        app = AsyncDispatcher(route(
+            route('page/{id}', page, coalesce=True),
+            route('wait/{id}', page, coalesce=0.01)))
+        self.assertIsInstance(app.coalescer, AsyncCoalescer)
+
+        async def scenario():
+            release = events['release'] = asyncio.Event()
+            requests = [
+                asyncio.ensure_future(app.dispatch(Request.blank(path)))
+                for path in ['/page/1'] * 3 + ['/page/2', '/wait/w']]
+            await asyncio.sleep(0)
+            timed_out = await app.dispatch(Request.blank('/wait/w'))
+            release.set()
+            return timed_out, await asyncio.gather(*requests)
+
+        try:
+            timed_out, results = loop.run_until_complete(scenario())
+        finally:
+            app.close()
+            loop.close()
+        self.assertEqual(timed_out.status_int, 504)
+        self.assertEqual(results, ['page 1'] * 3 + ['page 2', 'page w'])
+        self.assertEqual(calls, ['1', '2', 'w'])
+        self.assertEqual(app.coalescer.coalesced, 3)
@@ -7,12 +7,14 @@
 
 import re
 
-from routr.utils import cached_property, join
+from six import string_types
+
+from routr.utils import cached_property, join, join_segments
 from routr.exc import (
-    InvalidRoutePattern, RouteReversalError, NoURLPatternMatched)
+    InvalidRoutePattern, RouteReversalError, NoURLPatternMatched, PathTooLong)
 
 
-__all__ = ('URLPattern',)
+__all__ = ('URLPattern', 'Converter', 'register_converter', 'value_converter')
 
 
 def parse_args(line):
@@ -29,26 +31,190 @@ def parse_args(line):
     return args, kwargs
 
 
+class Converter(object):
+    """ Converter for URL pattern placeholders
+
+    Converter supplies a regular expression ``regex`` which matches values
+    for placeholder, a ``to_python`` function which converts matched string
+    into Python object and a ``to_url`` function which converts Python object
+    back into string for URL reversal.
+
+    Converters are registered in :attr:`URLPattern.typemap` via
+    :meth:`URLPattern.register_converter`.
+
+    :param regex:
+        regular expression which matches placeholder's value
+    :param to_python:
+        optional function for converting matched string into Python object, it
+        can raise ``ValueError`` which is treated as a non-match
+    :param to_url:
+        optional function for converting Python object into URL string
+    :param segment:
+        ``True`` if ``regex`` never matches ``/``, so values are always
+        contained in a single path segment
+    """
+
+    regex = '[^/]+'
+    segment = False
+
+    def __init__(self, regex=None, to_python=None, to_url=None,
+                 segment=None):
+        if regex is not None:
+            self.regex = regex
+        if segment is not None:
+            self.segment = segment
+        if to_python is not None:
+            self.to_python = to_python
+        if to_url is not None:
+            self.to_url = to_url
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        if isinstance(value, string_types):
+            return value
+        return str(value)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.regex)
+
+
+_identity = Converter.__dict__['to_python']
+
+
+def value_converter(converter):
+    """ Return ``to_python`` function of ``converter`` or ``None`` if it
+    returns values as is
+    """
+    c = converter.to_python
+    if getattr(c, '__func__', None) is _identity:
+        return None
+    return c
+
+
+class IntConverter(Converter):
+    """ Converter for non-negative integers, optionally bounded by ``min`` and
+    ``max``
+
+    If both bounds are non-negative the range is checked by regular
+    expression itself, so values out of range are never matched.
+    """
+
+    regex = '[0-9]+'
+    segment = True
+
+    def __init__(self, min=None, max=None):
+        self.min = min
+        self.max = max
+        if min is not None and min < 0:
+            self.regex = '-?[0-9]+'
+        elif max is not None:
+            self.regex = range_re(min or 0, max)
+
+    def to_python(self, value):
+        value = int(value)
+        if self.min is not None and value < self.min:
+            raise ValueError(value)
+        if self.max is not None and value > self.max:
+            raise ValueError(value)
+        return value
+
+
+class UUIDConverter(Converter):
+    """ Converter for UUIDs in canonical form"""
+
+    regex = (
+        '[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+        '[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+    segment = True
+
+    def to_python(self, value):
+        from uuid import UUID
+        return UUID(value)
+
+
+class DateConverter(Converter):
+    """ Converter for dates in ``YYYY-MM-DD`` format"""
+
+    regex = '[0-9]{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12][0-9]|3[01])'
+    segment = True
+
+    def to_python(self, value):
+        from datetime import date
+        return date(*[int(x) for x in value.split('-')])
+
+    def to_url(self, value):
+        if isinstance(value, string_types):
+            return value
+        return value.strftime('%Y-%m-%d')
+
+
+def range_re(lo, hi):
+    """ Return regular expression which matches only integers between ``lo``
+    and ``hi`` inclusively written without leading zeros
+
+        >>> range_re(0, 42)
+        '(?:[1-3][0-9]|4[0-2]|[0-9])(?![0-9])'
+
+    """
+    if lo > hi:
+        raise InvalidRoutePattern('empty range [%d, %d]' % (lo, hi))
+    alts = []
+    for n in range(len(str(hi)), len(str(lo)) - 1, -1):
+        a = max(lo, 10 ** (n - 1) if n > 1 else 0)
+        b = min(hi, 10 ** n - 1)
+        alts.extend(_digits_range_re(str(a), str(b)))
+    return '(?:' + '|'.join(alts) + ')(?![0-9])'
+
+
+def _digits_range_re(a, b):
+    if not a:
+        return ['']
+    if a[0] == b[0]:
+        return [a[0] + r for r in _digits_range_re(a[1:], b[1:])]
+    n = len(a) - 1
+    first, last = int(a[0]), int(b[0])
+    head, tail = [], []
+    if a[1:] != '0' * n:
+        head = [a[0] + r for r in _digits_range_re(a[1:], '9' * n)]
+        first += 1
+    if b[1:] != '9' * n:
+        tail = [b[0] + r for r in _digits_range_re('0' * n, b[1:])]
+        last -= 1
+    middle = []
+    if first <= last:
+        digit = str(first) if first == last else '[%d-%d]' % (first, last)
+        middle = [digit + '[0-9]' * n]
+    return head + middle + tail
+
+
 def handle_str(args):
     args, kwargs = parse_args(args)
     re = kwargs.pop('re', None)
     if kwargs or args:
         raise InvalidRoutePattern("invalid args for 'str' type")
     if re:
-        return (re + '(?=$|/)', None)
-    return ('[^/]+', None)
+        return Converter(re + '(?=$|/)')
+    return Converter('[^/]+', segment=True)
 
 
 def handle_path(args):
     if args:
         raise InvalidRoutePattern("'path' type doesn't accept args")
-    return ('.*', None)
+    return Converter('.*')
 
 
 def handle_int(args):
-    if args:
-        raise InvalidRoutePattern("'path' type doesn't accept args")
-    return ('[0-9]+', int)
+    args, kwargs = parse_args(args)
+    if args or set(kwargs) - set(['min', 'max']):
+        raise InvalidRoutePattern(
+            "'int' type accepts only 'min' and 'max' keyword args")
+    try:
+        kwargs = dict((k, int(v)) for k, v in kwargs.items())
+    except ValueError:
+        raise InvalidRoutePattern("'int' type bounds should be integers")
+    return IntConverter(**kwargs)
 
 
 def handle_any(args):
@@ -58,12 +224,46 @@ def handle_any(args):
     if kwargs:
         raise InvalidRoutePattern("'any' doesn't accept keyword args")
 
-    return ('(' + '|'.join('(' + re.escape(x) + ')' for x in args) + ')', None)
+    return Converter(
+        '(' + '|'.join('(' + re.escape(x) + ')' for x in args) + ')',
+        segment=not any('/' in x for x in args))
+
+
+def handle_uuid(args):
+    if args:
+        raise InvalidRoutePattern("'uuid' type doesn't accept args")
+    return UUIDConverter()
+
+
+def handle_slug(args):
+    if args:
+        raise InvalidRoutePattern("'slug' type doesn't accept args")
+    return Converter('[-a-zA-Z0-9_]+', segment=True)
+
+
+def handle_date(args):
+    if args:
+        raise InvalidRoutePattern("'date' type doesn't accept args")
+    return DateConverter()
+
+
+class lazy_re(object):
+    """ Regular expression compiled on first access"""
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self.compiled = None
+
+    def __get__(self, obj, cls):
+        if self.compiled is None:
+            self.compiled = re.compile(self.pattern, self.flags)
+        return self.compiled
 
 
 class URLPattern(object):
 
-    _type_re = re.compile("""
+    _type_re = lazy_re("""
         {
         (?P<label>[a-zA-Z][a-zA-Z_0-9]*)     # label
         (:(?P<type>[a-zA-Z][a-zA-Z_0-9]*))?  # optional type identifier
@@ -79,13 +279,57 @@ class URLPattern(object):
         'path':   handle_path,
         'int':    handle_int,
         'any':    handle_any,
+        'uuid':   handle_uuid,
+        'slug':   handle_slug,
+        'date':   handle_date,
     }
 
+    @classmethod
+    def register_converter(cls, name, handler):
+        """ Register placeholder type ``name`` for patterns of this class and
+        its subclasses
+
+        :param name:
+            name of the type to be used in patterns like ``{id:name}``
+        :param handler:
+            :class:`.Converter` instance or a function which accepts string
+            with type's args and returns :class:`.Converter`
+        """
+        if 'typemap' not in cls.__dict__:
+            cls.typemap = {}
+        cls.typemap[name] = handler
+
+    def lookup_converter(self, typ, args):
+        """ Return :class:`.Converter` for type ``typ`` called with ``args``
+        """
+        for cls in type(self).__mro__:
+            typemap = cls.__dict__.get('typemap')
+            if typemap and typ in typemap:
+                handler = typemap[typ]
+                break
+        else:
+            raise InvalidRoutePattern(
+                "unknown type '%s' in pattern '%s'" % (typ, self.pattern))
+        if isinstance(handler, Converter):
+            if args:
+                raise InvalidRoutePattern(
+                    "'%s' type doesn't accept args" % typ)
+            return handler
+        converter = handler(args)
+        if isinstance(converter, tuple):
+            converter = Converter(*converter)
+        return converter
+
+    # maximum length of path this pattern's regular expression is run against,
+    # see routr.complexity.limit
+    max_length = None
+
     def __init__(self, pattern):
         self.pattern = pattern
 
         self._compiled = None
         self._names = None
+        self._converters = None
 
     @cached_property
     def is_exact(self):
@@ -101,42 +345,67 @@ class URLPattern(object):
     def _pattern_len(self):
         return len(self.pattern)
 
+    @cached_property
+    def _prefix(self):
+        # literal text before the first placeholder
+        m = self._type_re.search(self.pattern)
+        return self.pattern[:m.start()] if m else self.pattern
+
     def compile(self):
         if self.is_exact:
             return
 
         names = []
+        converters = []
         compiled = ''
         last = 0
         for n, m in enumerate(self._type_re.finditer(self.pattern)):
             compiled += re.escape(self.pattern[last:m.start()])
             typ, label, args = (
                 m.group('type'), m.group('label'), m.group('args'))
-            if not typ in self.typemap:
-                raise InvalidRoutePattern(
-                    "unknown type '%s' in pattern '%s'" % (typ, self.pattern))
-            r, c = self.typemap[typ](args)
+            converter = self.lookup_converter(typ, args)
+            c = value_converter(converter)
             name = '_gpt%d' % n
             names.append((name, c, label))
-            compiled += '(?P<%s>%s)' % (name, r)
+            converters.append(converter)
+            compiled += '(?P<%s>%s)' % (name, converter.regex)
             last = m.end()
         compiled += re.escape(self.pattern[last:])
 
         self._compiled = re.compile(compiled)
         self._names = names
+        self._converters = converters
 
     def reverse(self, *args):
         if self.is_exact:
             return self.pattern
 
-        r = self.pattern
-        for arg in args:
-            r = self._type_re.sub(str(arg), r, 1)
-        if self._type_re.search(r):
+        parts, tail = self._reverse_parts
+        if len(args) < len(parts):
             raise RouteReversalError(
                 "not enough params for reversal of '%s' route,"
                 ' only %r was supplied' % (self.pattern, args))
-        return r
+        r = ''
+        for (prefix, c), arg in zip(parts, args):
+            r += prefix + c.to_url(arg)
+        return r + tail
+
+    @cached_property
+    def _reverse_parts(self):
+        placeholders = list(self._type_re.finditer(self.pattern))
+        try:
+            if self._compiled is None:
+                self.compile()
+            converters = self._converters
+        except InvalidRoutePattern:
+            # pattern can't be used for matching but still can be reversed
+            converters = [Converter()] * len(placeholders)
+        parts = []
+        last = 0
+        for m, c in zip(placeholders, converters):
+            parts.append((self.pattern[last:m.start()], c))
+            last = m.end()
+        return parts, self.pattern[last:]
 
     def match(self, path_info):
         if self.is_exact:
@@ -144,6 +413,10 @@ class URLPattern(object):
                 raise NoURLPatternMatched(path_info)
             return path_info[self._pattern_len:], ()
 
+        if self.max_length is not None and len(path_info) > self.max_length:
+            if not path_info.startswith(self._prefix):
+                raise NoURLPatternMatched(path_info)
+            raise PathTooLong("path is too long for '%s'" % self.pattern)
         m = self.compiled.match(path_info)
         if not m:
             raise NoURLPatternMatched("no match for '%s' against '%s'" % (
@@ -157,6 +430,82 @@ class URLPattern(object):
             raise NoURLPatternMatched()
         return path_info[m.end():], args
 
+    @cached_property
+    def _segment_parts(self):
+        if not self.pattern.startswith('/'):
+            return None
+        parts = []
+        n = 0
+        for part in self.pattern.split('/')[1:]:
+            placeholders = list(self._type_re.finditer(part))
+            if not placeholders:
+                parts.append(part)
+                continue
+            compiled = ''
+            names = []
+            last = 0
+            for m in placeholders:
+                converter = self.lookup_converter(
+                    m.group('type'), m.group('args'))
+                if not converter.segment:
+                    return None
+                c = value_converter(converter)
+                name = '_gpt%d' % n
+                n += 1
+                names.append((name, c))
+                compiled += re.escape(part[last:m.start()])
+                compiled += '(?P<%s>%s)' % (name, converter.regex)
+                last = m.end()
+            compiled += re.escape(part[last:]) + '\\Z'
+            parts.append((re.compile(compiled), names))
+        return parts
+
+    def match_segments(self, segments, pos):
+        """ Match ``segments`` starting from ``pos`` against pattern
+
+        Pattern should match whole segments, placeholders which can match only
+        within a segment are matched against individual segments.
+
+        :param segments:
+            a tuple of path segments as returned by
+            :func:`routr.utils.split_path`
+        :param pos:
+            index of the first segment to match
+        :return:
+            index of the first segment which wasn't matched and a tuple of
+            captured args
+        """
+        parts = self._segment_parts
+        if parts is None or type(self).match is not URLPattern.match:
+            return self._match_segments_by_path(segments, pos)
+        end = pos + len(parts)
+        if end > len(segments):
+            raise NoURLPatternMatched()
+        args = ()
+        for part in parts:
+            segment = segments[pos]
+            pos += 1
+            if isinstance(part, string_types):
+                if segment != part:
+                    raise NoURLPatternMatched()
+                continue
+            compiled, names = part
+            m = compiled.match(segment)
+            if not m:
+                raise NoURLPatternMatched()
+            try:
+                args += tuple(
+                    c(m.group(n)) if c else m.group(n) for (n, c) in names)
+            except ValueError:
+                raise NoURLPatternMatched()
+        return end, args
+
+    def _match_segments_by_path(self, segments, pos):
+        path_info, args = self.match(join_segments(segments, pos))
+        if path_info and not path_info.startswith('/'):
+            raise NoURLPatternMatched()
+        return len(segments) - path_info.count('/'), args
+
     def __add__(self, o):
         if o is None:
             return self
@@ -169,3 +518,6 @@ class URLPattern(object):
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self.pattern)
+
+
+register_converter = URLPattern.register_converter
@@ -5,16 +5,18 @@
 
 """
 
-import inspect
 import sys
+import math
+import time
 import types
 
 import six
 
-
 __all__ = (
     'import_string', 'cached_property', 'ImportStringError', 'join',
-    'positional_args', 'inject_args')
+    'split_path', 'join_segments', 'urlencode', 'mapping_proxy',
+    'positional_args', 'inject_args', 'percentile', 'timer', 'walk',
+    'request_key', 'PolicyCache')
 
 
 class cached_property(object):
@@ -139,6 +141,99 @@ def join(a, b):
     return (a or '').rstrip('/') + '/' + (b or '').lstrip('/')
 
 
+def split_path(path_info):
+    """ Split ``path_info`` into a tuple of segments
+
+        >>> split_path('/a/b/')
+        ('a', 'b', '')
+
+    """
+    return tuple(path_info[1:].split('/')) if path_info else ()
+
+
+def join_segments(segments, pos=0):
+    """ Join ``segments`` starting from ``pos`` back into path
+
+        >>> join_segments(('a', 'b', ''), 1)
+        '/b/'
+
+    """
+    return '/' + '/'.join(segments[pos:]) if pos < len(segments) else ''
+
+
+# read-only view of dict, a copy is used on Pythons without it
+mapping_proxy = getattr(types, 'MappingProxyType', dict)
+
+
+def urlencode(query):
+    """ Encode ``query`` dict into query string, :mod:`urllib` is imported
+    lazily as it's needed only for reversal with query params
+    """
+    try:
+        from urllib.parse import urlencode
+    except ImportError:
+        from urllib import urlencode
+    return urlencode(query)
+
+
+# the most precise clock available for measuring durations
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def walk(route):
+    """ Iterate over ``route`` and all routes nested in it depth first"""
+    yield route
+    for r in getattr(route, 'routes', ()):
+        for sub in walk(r):
+            yield sub
+
+
+def request_key(request, trace, vary=()):
+    """ Return key which identifies ``request`` matched with ``trace``
+    along with values of ``vary`` request headers or ``None`` if trace has
+    unhashable arguments
+    """
+    key = (
+        trace.endpoint, request.method, trace.args,
+        tuple(sorted(trace.kwargs.items())) if trace.kwargs else (),
+        request.query_string,
+        tuple(request.headers.get(h) for h in vary))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class PolicyCache(object):
+    """ Policies made out of annotation values with ``coerce``, each value is
+    coerced once
+    """
+
+    def __init__(self, coerce):
+        self.coerce = coerce
+        self._policies = {}
+
+    def __call__(self, value):
+        try:
+            return self._policies[id(value)][1]
+        except KeyError:
+            policy = self.coerce(value)
+            # value is kept so its id isn't reused by another object
+            self._policies[id(value)] = (value, policy)
+            return policy
+
+
+def percentile(values, p):
+    """ Return ``p``-th percentile of sorted ``values`` by nearest rank or
+    ``None`` if there are no values
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(len(values) * p / 100.0))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
 def positional_args(obj):
     """ Return ordered list of positional args with which ``obj`` can be called
 
@@ -161,7 +256,9 @@ def positional_args(obj):
 
 
 def _positional_args(func):
-    argspec = inspect.getargspec(func)
+    import inspect
+    getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+    argspec = getargspec(func)
     return (argspec.args[:-len(argspec.defaults)]
             if argspec.defaults
             else argspec.args)
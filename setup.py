@@ -1,10 +1,8 @@
 import os
-import sys
 
 from setuptools import find_packages, setup
 
 
-is_py26 = sys.version_info[:2] == (2, 6)
 version = '0.7.1'
 
 
@@ -18,11 +16,10 @@ setup(
     url='http://routr.readthedocs.org/',
     license='BSD',
     packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
-    install_requires=list(filter(None, [
+    install_requires=[
         'WebOb >= 1.2b3',
         'six >= 1.3.0',
-        'unittest2 == 0.5.1' if is_py26 else None,
-    ])),
+    ],
     include_package_data=True,
     test_suite='routr.tests',
     zip_safe=False,
@@ -30,7 +27,6 @@ setup(
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2.6',
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3.2',
         'Programming Language :: Python :: 3.3',